@@ -0,0 +1,40 @@
+from typing import Optional
+
+from ...tools.dispatch_queue import dispatch_queue
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, dispatch_id: Optional[str] = None):
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._get_dispatch(dispatch_id, (self.mode, project.id))
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, dispatch_id: Optional[str] = None, **kwargs):
+        return self._get_dispatch(dispatch_id, (self.mode, None))
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+        '<string:project_id>/<string:dispatch_id>',
+        '<string:mode>/<string:project_id>/<string:dispatch_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _get_dispatch(dispatch_id: Optional[str], scope: tuple):
+        if not dispatch_id:
+            return dispatch_queue.stats(), 200
+        dispatch = dispatch_queue.get(dispatch_id, scope)
+        if not dispatch:
+            return {"message": f"No such dispatch: {dispatch_id}"}, 404
+        return dispatch, 200
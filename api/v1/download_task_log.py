@@ -1,36 +1,26 @@
-from io import BytesIO
-from flask import send_file, abort
+from typing import Optional, Tuple
+
+from botocore.exceptions import ClientError
+from flask import Response, request, stream_with_context
+from flask_restful import abort
+
 from tools import MinioClient, api_tools, MinioClientAdmin, auth
 
+from ...constants import LOG_DOWNLOAD_CHUNK_SIZE
+from ...tools.log_storage import iter_decompressed, iter_range, log_file_names, UNCOMPRESSED_SIZE_METADATA
+
+
 class ProjectApi(api_tools.APIModeHandler):
     @auth.decorators.check_api(["configuration.tasks.tasks.create"])
     def get(self, project_id: int, task_name: str, task_result_id: str):
         project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
-        minio_client = MinioClient(project)
-        bucket_name = str(task_name).replace("_", "").replace(" ", "").lower()
-        try:
-            file = minio_client.download_file(bucket_name, f'{task_result_id}.log')
-            try:
-                return send_file(BytesIO(file), attachment_filename=file)
-            except TypeError:  # new flask
-                return send_file(BytesIO(file), download_name=f'{task_result_id}.log', as_attachment=True)
-        except:
-            abort(404)
+        return self._stream_log(MinioClient(project), task_name, task_result_id)
 
 
 class AdminApi(api_tools.APIModeHandler):
     @auth.decorators.check_api(["configuration.tasks.tasks.create"])
     def get(self, project_id: int, task_name: str, task_result_id: str):
-        minio_client = MinioClientAdmin()
-        bucket_name = str(task_name).replace("_", "").replace(" ", "").lower()
-        try:
-            file = minio_client.download_file(bucket_name, f'{task_result_id}.log')
-            try:
-                return send_file(BytesIO(file), attachment_filename=file)
-            except TypeError:  # new flask
-                return send_file(BytesIO(file), download_name=f'{task_result_id}.log', as_attachment=True)
-        except:
-            abort(404)
+        return self._stream_log(MinioClientAdmin(), task_name, task_result_id)
 
 
 class API(api_tools.APIBase):
@@ -42,3 +32,85 @@ class API(api_tools.APIBase):
         'default': ProjectApi,
         'administration': AdminApi,
     }
+
+    @staticmethod
+    def _get_object(minio_client, bucket: str, file_name: str, byte_range: Optional[str] = None) -> dict:
+        kwargs = {'Bucket': minio_client.format_bucket_name(bucket), 'Key': file_name}
+        if byte_range:
+            kwargs['Range'] = byte_range
+        try:
+            return minio_client.s3_client.get_object(**kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code == 'InvalidRange':
+                abort(416)
+            if code in ('NoSuchKey', 'NoSuchBucket', '404'):
+                abort(404)
+            raise
+
+    @staticmethod
+    def _head_log(minio_client, bucket_name: str, task_result_id: str) -> Tuple[str, dict]:
+        """ Key and HEAD response of the archived log, whichever layout it was written with """
+        for file_name in log_file_names(task_result_id):
+            try:
+                return file_name, minio_client.s3_client.head_object(
+                    Bucket=minio_client.format_bucket_name(bucket_name), Key=file_name
+                )
+            except ClientError:
+                continue
+        abort(404)
+
+    @staticmethod
+    def _stream_log(minio_client, task_name: str, task_result_id: str):
+        """ Streams an archived log, compressed logs are sent as is to clients accepting their encoding
+
+        Range requests apply to the bytes sent: the stored ones when passed through, the
+        decompressed ones otherwise, as long as the object records its uncompressed size.
+        """
+        bucket_name = str(task_name).replace("_", "").replace(" ", "").lower()
+        file_name, head = API._head_log(minio_client, bucket_name, task_result_id)
+        encoding = head.get('ContentEncoding') or None
+        headers = {
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Content-Disposition': f'attachment; filename={task_result_id}.log',
+            'Accept-Ranges': 'bytes',
+            'Vary': 'Accept-Encoding',
+        }
+        passthrough = encoding is None or request.accept_encodings.quality(encoding) > 0
+        byte_range = request.range if request.range and len(request.range.ranges) == 1 else None
+
+        if passthrough:
+            obj = API._get_object(
+                minio_client, bucket_name, file_name,
+                byte_range.to_header() if byte_range else None
+            )
+            if encoding:
+                headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(obj['ContentLength'])
+            status = 200
+            if obj.get('ContentRange'):
+                headers['Content-Range'] = obj['ContentRange']
+                status = 206
+            chunks = obj['Body'].iter_chunks(LOG_DOWNLOAD_CHUNK_SIZE)
+            return Response(stream_with_context(chunks), status=status, headers=headers)
+
+        length = head.get('Metadata', {}).get(UNCOMPRESSED_SIZE_METADATA)
+        length = int(length) if length and length.isdigit() else None
+        if length is not None:
+            headers['Content-Length'] = str(length)
+        content_range = None
+        if byte_range and length is not None:
+            content_range = byte_range.range_for_length(length)
+            if content_range is None:
+                return Response(status=416, headers={'Content-Range': f'bytes */{length}'})
+
+        obj = API._get_object(minio_client, bucket_name, file_name)
+        chunks = iter_decompressed(obj['Body'].iter_chunks(LOG_DOWNLOAD_CHUNK_SIZE), encoding)
+        status = 200
+        if content_range is not None:
+            start, stop = content_range
+            chunks = iter_range(chunks, start, stop)
+            headers['Content-Range'] = f'bytes {start}-{stop - 1}/{length}'
+            headers['Content-Length'] = str(stop - start)
+            status = 206
+        return Response(stream_with_context(chunks), status=status, headers=headers)
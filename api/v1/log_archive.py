@@ -0,0 +1,48 @@
+from typing import Optional
+
+from ...models.log_archive import TaskLogArchiveJob
+from ...tools.log_archiver import log_archiver
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, task_result_id: Optional[str] = None):
+        if not task_result_id:
+            return {"message": "task_result_id is required"}, 400
+        return self._get_job([
+            TaskLogArchiveJob.task_result_id == task_result_id,
+            TaskLogArchiveJob.project_id == project_id,
+            TaskLogArchiveJob.mode == self.mode,
+        ])
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, task_result_id: Optional[str] = None, **kwargs):
+        if not task_result_id:
+            return log_archiver.queue_stats(), 200
+        return self._get_job([
+            TaskLogArchiveJob.task_result_id == task_result_id,
+            TaskLogArchiveJob.mode == self.mode,
+        ])
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:mode>/<string:project_id>',
+        '<string:project_id>/<string:task_result_id>',
+        '<string:mode>/<string:project_id>/<string:task_result_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _get_job(query_filter: list):
+        job = TaskLogArchiveJob.query.filter(*query_filter).first()
+        if not job:
+            return {"message": "No log archival queued for this task result"}, 404
+        return job.to_json(), 200
@@ -31,7 +31,8 @@ class ProjectApi(api_tools.APIModeHandler):
         logs_limit = 10000000000
 
         return {
-            "websocket_url": f"{websocket_base_url}?query={logs_query}&start={logs_start}&limit={logs_limit}"
+            "websocket_url": f"{websocket_base_url}?query={logs_query}&start={logs_start}&limit={logs_limit}",
+            "task_result_id": task_result_id,
         }, 200
 
 
@@ -60,7 +61,8 @@ class AdminApi(api_tools.APIModeHandler):
             return {"message": "specify task_id or task_result_id"}, 404
 
         return {
-            "websocket_url": self._get_loki_url(result.task_result_id)
+            "websocket_url": self._get_loki_url(result.task_result_id),
+            "task_result_id": result.task_result_id,
         }, 200
 
 
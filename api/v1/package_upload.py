@@ -0,0 +1,97 @@
+from typing import Optional
+
+from flask import request
+from pydantic import ValidationError
+
+from ...models.validation_pd import TaskPackageUploadPD
+from ...tools.package_uploads import package_uploads, UploadError
+
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def get(self, project_id: int, upload_id: Optional[str] = None):
+        return self._handle(self.mode, int(project_id), upload_id, 'get')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, project_id: int, upload_id: Optional[str] = None):
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._handle(self.mode, project.id, upload_id, 'post')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def put(self, project_id: int, upload_id: Optional[str] = None):
+        return self._handle(self.mode, int(project_id), upload_id, 'put')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def delete(self, project_id: int, upload_id: Optional[str] = None):
+        return self._handle(self.mode, int(project_id), upload_id, 'delete')
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def get(self, upload_id: Optional[str] = None, **kwargs):
+        return self._handle(self.mode, None, upload_id, 'get')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, upload_id: Optional[str] = None, **kwargs):
+        return self._handle(self.mode, None, upload_id, 'post')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def put(self, upload_id: Optional[str] = None, **kwargs):
+        return self._handle(self.mode, None, upload_id, 'put')
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def delete(self, upload_id: Optional[str] = None, **kwargs):
+        return self._handle(self.mode, None, upload_id, 'delete')
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+        '<string:project_id>/<string:upload_id>',
+        '<string:mode>/<string:project_id>/<string:upload_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _handle(mode: str, project_id: Optional[int], upload_id: Optional[str], method: str):
+        """ Chunked package upload
+
+        POST without upload_id initiates ({file_name, sha256[, size]}), PUT ?part_number=N sends
+        a part as the raw request body, GET lists received parts to resume, POST completes and
+        verifies the checksum, DELETE aborts. A complete upload_id is then passed to the tasks api.
+        """
+        try:
+            if not upload_id:
+                if method != 'post':
+                    return {"message": "upload_id is required"}, 400
+                try:
+                    pd_obj = TaskPackageUploadPD.parse_obj(request.json)
+                except ValidationError as e:
+                    return e.errors(), 400
+                upload = package_uploads.initiate(mode, project_id, **pd_obj.dict())
+                return package_uploads.to_json(upload), 201
+
+            upload = package_uploads.get(mode, project_id, upload_id)
+            if not upload:
+                return {"message": "No such upload"}, 404
+            if method == 'get':
+                return package_uploads.to_json(upload), 200
+            if method == 'put':
+                try:
+                    part_number = int(request.args.get('part_number', ''))
+                except ValueError:
+                    return {"message": "part_number is required"}, 400
+                return package_uploads.upload_part(upload, part_number, request.stream), 200
+            if method == 'post':
+                return package_uploads.to_json(package_uploads.complete(upload)), 200
+            package_uploads.abort(upload)
+            return None, 204
+        except UploadError as e:
+            return {"message": e.message}, e.code
@@ -1,4 +1,5 @@
 import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import defaultdict
 from datetime import datetime
 
@@ -6,13 +7,16 @@ from flask import request, make_response, jsonify
 from flask_restful import abort
 from hurry.filesize import size
 
+from ...constants import RESULTS_PAGE_SIZE, RESULTS_PAGE_SIZE_MAX
 from ...models.pd.results import ResultsGetModel
 from ...models.results import TaskResults
 from ...models.tasks import Task
 
 from tools import api_tools, auth
 
-from ...utils import write_task_run_logs_to_minio_bucket
+from ...tools.log_archiver import log_archiver
+from ...tools.status_broker import status_broker
+from ...tools.task_stats import task_stats_normalizer
 
 
 class ProjectApi(api_tools.APIModeHandler):
@@ -23,14 +27,11 @@ class ProjectApi(api_tools.APIModeHandler):
         if not task:
             abort(404)
 
-        task_results = TaskResults.query.filter(
+        return self._get_results([
             TaskResults.mode == self.mode,
             TaskResults.task_id == task_id,
             TaskResults.project_id == project_id,
-        ).all()
-
-        rows = [ResultsGetModel.parse_obj(i.to_json()).dict() for i in task_results]
-        return {"total": len(rows), "rows": rows}, 200
+        ])
 
         # rows = defaultdict(list)
         #
@@ -82,10 +83,11 @@ class ProjectApi(api_tools.APIModeHandler):
             task_duration=data.get('task_duration'),
             task_status=data.get('task_status'),
             task_result_id=data.get('task_result_id'),
-            task_stats=data.get('task_stats'),
+            **task_stats_normalizer.columns(data.get('task_stats')),
             mode=self.mode
         )
         task_result.insert()
+        status_broker.notify(task_result)
         return {"message": "Created", "code": 201, "task_id": task_result.id}, 201
 
     @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
@@ -101,13 +103,15 @@ class ProjectApi(api_tools.APIModeHandler):
         task_result.log = data.get('log')
         task_result.results = data.get('results')
         task_result.task_status = data.get('task_status')
-        task_result.task_stats = data.get('task_stats')
+        for k, v in task_stats_normalizer.columns(data.get('task_stats')).items():
+            setattr(task_result, k, v)
         task_result.commit()
+        status_broker.notify(task_result)
 
         # project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
         # task_name = Task.query.filter_by(project_id=project_id, task_id=task_result.task_id).first().task_name
 
-        write_task_run_logs_to_minio_bucket(task_result)
+        log_archiver.enqueue(task_result)
         resp = {"message": "Accepted", "code": 202, "task_result_id": task_result.task_result_id}
         return make_response(resp, resp.get('code', 202))
 
@@ -121,13 +125,10 @@ class AdminApi(api_tools.APIModeHandler):
         task = Task.query.filter(Task.task_id == task_id, Task.mode == self.mode).first()
         if not task:
             abort(404)
-        task_results = TaskResults.query.filter(
+        return self._get_results([
             TaskResults.mode == self.mode,
             TaskResults.task_id == task_id
-        ).all()
-
-        rows = [ResultsGetModel.parse_obj(i.to_json()).dict() for i in task_results]
-        return {"total": len(rows), "rows": rows}, 200
+        ])
 
     @auth.decorators.check_api(["configuration.tasks.tasks.create"])
     def post(self, **kwargs):
@@ -142,9 +143,10 @@ class AdminApi(api_tools.APIModeHandler):
             task_duration=data.get('task_duration'),
             task_status=data.get('task_status'),
             task_result_id=data.get('task_result_id'),
-            task_stats=data.get('task_stats'),
+            **task_stats_normalizer.columns(data.get('task_stats')),
         )
         task_result.insert()
+        status_broker.notify(task_result)
         return {"message": "Created", "code": 201, "task_id": task_result.id}, 201
 
     @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
@@ -163,13 +165,15 @@ class AdminApi(api_tools.APIModeHandler):
         task_result.log = data.get('log')
         task_result.results = data.get('results')
         task_result.task_status = data.get('task_status')
-        task_result.task_stats = data.get('task_stats')
+        for k, v in task_stats_normalizer.columns(data.get('task_stats')).items():
+            setattr(task_result, k, v)
         task_result.commit()
+        status_broker.notify(task_result)
 
         # project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
         # task_name = Task.query.filter_by(project_id=project_id, task_id=task_result.task_id).first().task_name
 
-        write_task_run_logs_to_minio_bucket(task_result)
+        log_archiver.enqueue(task_result)
         return {"message": "Accepted", "code": 202, "task_result_id": task_result.task_result_id}, 202
 
 
@@ -185,3 +189,83 @@ class API(api_tools.APIBase):
         'default': ProjectApi,
         'administration': AdminApi,
     }
+
+    @staticmethod
+    def _get_results(query_filter: list):
+        """ Keyset paginated results: ?limit=&cursor=&order=desc|asc&fields=a,b&with_total=true|false
+
+        total is counted for the first page as before, cursor pages only count it with with_total=true.
+        """
+        args = request.args
+        try:
+            limit = min(int(args.get('limit', RESULTS_PAGE_SIZE)), RESULTS_PAGE_SIZE_MAX)
+        except ValueError:
+            return {"message": "limit must be an integer"}, 400
+        if limit < 1:
+            return {"message": "limit must be at least 1"}, 400
+        descending = args.get('order', 'desc').lower() != 'asc'
+
+        fields = [i.strip() for i in args.get('fields', '').split(',') if i.strip()] or \
+            list(ResultsGetModel.DEFAULT_FIELDS)
+        unknown = set(fields) - set(ResultsGetModel.__fields__)
+        if unknown:
+            return {"message": f"Unknown fields: {sorted(unknown)}"}, 400
+        columns = {i for i in fields if i not in ('ts', 'task_stats')} | {'id'}
+        if 'ts' in fields:
+            columns.add('created_at')
+        if 'task_stats' in fields:
+            # served from the metric columns, not the raw blob
+            columns.update(('cpu_usage', 'memory_usage_bytes'))
+        columns = sorted(columns)
+
+        query = TaskResults.query.with_entities(
+            *(getattr(TaskResults, i) for i in columns)
+        ).filter(*query_filter)
+        cursor = args.get('cursor')
+        with_total = args.get('with_total', 'false' if cursor else 'true').lower() == 'true'
+        total = query.count() if with_total else None
+
+        if cursor:
+            try:
+                cursor_id = int(urlsafe_b64decode(cursor.encode()).decode())
+            except ValueError:
+                return {"message": "Invalid cursor"}, 400
+            query = query.filter(TaskResults.id < cursor_id if descending else TaskResults.id > cursor_id)
+        query = query.order_by(TaskResults.id.desc() if descending else TaskResults.id.asc())
+
+        rows = []
+        for row in query.limit(limit + 1).all():
+            data = dict(zip(columns, row))
+            if 'ts' in fields and data.get('created_at'):
+                data['ts'] = int(data['created_at'].timestamp())
+            rows.append(data)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = urlsafe_b64encode(str(rows[-1]['id']).encode()).decode()
+
+        if 'task_stats' in fields:
+            API._set_task_stats(rows)
+        rows = [ResultsGetModel.parse_obj(i).dict(include=set(fields)) for i in rows]
+        resp = {"rows": rows, "next_cursor": next_cursor}
+        if total is not None:
+            resp["total"] = total
+        return resp, 200
+
+    @staticmethod
+    def _set_task_stats(rows: list) -> None:
+        """ Compact task_stats from the metric columns, raw stats only for rows the backfill has not reached """
+        pending = [i['id'] for i in rows if i['cpu_usage'] is None and i['memory_usage_bytes'] is None]
+        raw = dict(TaskResults.query.with_entities(TaskResults.id, TaskResults.task_stats).filter(
+            TaskResults.id.in_(pending)
+        ).all()) if pending else dict()
+        for row in rows:
+            if row['id'] in raw:
+                row['task_stats'] = raw[row['id']]
+            elif row['cpu_usage'] is not None or row['memory_usage_bytes'] is not None:
+                row['task_stats'] = {
+                    "cpu_usage": row['cpu_usage'],
+                    "memory_usage": size(row['memory_usage_bytes']) if row['memory_usage_bytes'] is not None else None
+                }
+            else:
+                row['task_stats'] = None
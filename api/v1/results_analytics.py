@@ -0,0 +1,178 @@
+import math
+from calendar import timegm
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from flask import request
+from flask_restful import abort
+from sqlalchemy import func, cast, Integer
+
+from ...constants import ANALYTICS_POINTS, ANALYTICS_POINTS_MAX, ANALYTICS_MIN_BUCKET, ANALYTICS_DEFAULT_RANGE
+from ...models.results import TaskResults
+from ...models.tasks import Task
+from ...tools.lttb import lttb
+
+from tools import api_tools, auth, db
+
+
+METRICS = {
+    'count': lambda i: i['count'],
+    'duration_p50': lambda i: i['duration']['p50'],
+    'duration_p95': lambda i: i['duration']['p95'],
+    'duration_max': lambda i: i['duration']['max'],
+    'cpu_usage': lambda i: i['cpu_usage'],
+    'memory_usage_bytes': lambda i: i['memory_usage_bytes'],
+}
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, task_id: str):
+        if not Task.query.filter(Task.task_id == task_id).first():
+            abort(404)
+        return self._get_analytics([
+            TaskResults.mode == self.mode,
+            TaskResults.task_id == task_id,
+            TaskResults.project_id == project_id,
+        ])
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, task_id: str, **kwargs):
+        if not Task.query.filter(Task.task_id == task_id, Task.mode == self.mode).first():
+            abort(404)
+        return self._get_analytics([
+            TaskResults.mode == self.mode,
+            TaskResults.task_id == task_id,
+        ])
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>/<string:task_id>',
+        '<string:mode>/<string:project_id>/<string:task_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _parse_time(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            return datetime.utcfromtimestamp(float(value))
+        except ValueError:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        # created_at is naive utc
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    @staticmethod
+    def _get_analytics(query_filter: list):
+        """ Time bucketed run history: ?start=&end=(epoch or iso)&points=&bucket=<sec>&metric=
+
+        Buckets are aggregated in SQL; if there are more than points of them they are
+        downsampled with LTTB on metric (duration_p95 by default).
+        """
+        args = request.args
+        try:
+            end = API._parse_time(args.get('end')) or datetime.utcnow()
+            start = API._parse_time(args.get('start')) or end - timedelta(seconds=ANALYTICS_DEFAULT_RANGE)
+            points = min(int(args.get('points', ANALYTICS_POINTS)), ANALYTICS_POINTS_MAX)
+            bucket = int(args['bucket']) if args.get('bucket') else None
+        except (ValueError, OverflowError, OSError):
+            # out of range epochs raise OverflowError/OSError
+            return {"message": "start/end must be epoch seconds or iso dates, points and bucket integers"}, 400
+        metric = args.get('metric', 'duration_p95')
+        if metric not in METRICS:
+            return {"message": f"metric must be one of {sorted(METRICS)}"}, 400
+        if points < 1:
+            return {"message": "points must be at least 1"}, 400
+        if end <= start:
+            return {"message": "Empty time range"}, 400
+        if not bucket or bucket < 1:
+            bucket = max(ANALYTICS_MIN_BUCKET, math.ceil((end - start).total_seconds() / points))
+
+        query_filter = [*query_filter, TaskResults.created_at >= start, TaskResults.created_at < end]
+        bucket_expr = API._bucket_expr(bucket)
+        if bucket_expr is None:
+            return {"message": "Results analytics needs PostgreSQL or SQLite"}, 501
+        is_postgres = db.engine.dialect.name == 'postgresql'
+
+        columns = [
+            bucket_expr,
+            func.count(TaskResults.id),
+            func.max(TaskResults.task_duration),
+            func.avg(TaskResults.cpu_usage),
+            func.avg(TaskResults.memory_usage_bytes),
+        ]
+        if is_postgres:
+            columns.extend((
+                func.percentile_cont(0.5).within_group(TaskResults.task_duration),
+                func.percentile_cont(0.95).within_group(TaskResults.task_duration),
+            ))
+        rows = {}
+        for row in db.session.query(*columns).filter(*query_filter).group_by(bucket_expr).all():
+            ts = int(row[0])
+            rows[ts] = {
+                "ts": ts,
+                "count": row[1],
+                "statuses": {},
+                "duration": {
+                    "p50": row[5] if is_postgres else None,
+                    "p95": row[6] if is_postgres else None,
+                    "max": row[2],
+                },
+                "cpu_usage": float(row[3]) if row[3] is not None else None,
+                "memory_usage_bytes": int(row[4]) if row[4] is not None else None,
+            }
+
+        for ts, status, count in db.session.query(
+                bucket_expr, TaskResults.task_status, func.count(TaskResults.id)
+        ).filter(*query_filter).group_by(bucket_expr, TaskResults.task_status).all():
+            rows[int(ts)]["statuses"][status or 'unknown'] = count
+
+        if not is_postgres:
+            API._set_percentiles(rows, bucket_expr, query_filter)
+
+        result = [rows[i] for i in sorted(rows)]
+        downsampled = len(result) > points
+        if downsampled:
+            result = lttb(result, points, lambda i: (i['ts'], METRICS[metric](i) or 0))
+        return {
+            "bucket": bucket,
+            "start": timegm(start.utctimetuple()),
+            "end": timegm(end.utctimetuple()),
+            "downsampled": downsampled,
+            "rows": result,
+        }, 200
+
+    @staticmethod
+    def _bucket_expr(bucket: int):
+        """ created_at floored to bucket seconds as epoch, None on databases it is not written for """
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            epoch = func.extract('epoch', TaskResults.created_at)
+            return (func.floor(epoch / bucket) * bucket).label('bucket')
+        if dialect == 'sqlite':
+            epoch = cast(func.strftime('%s', TaskResults.created_at), Integer)
+            return (epoch - epoch % bucket).label('bucket')
+        return None
+
+    @staticmethod
+    def _set_percentiles(rows: dict, bucket_expr, query_filter: list) -> None:
+        """ Nearest rank percentiles for databases without percentile_cont (SQLite) """
+        durations = defaultdict(list)
+        for ts, duration in db.session.query(bucket_expr, TaskResults.task_duration).filter(
+                *query_filter, TaskResults.task_duration.isnot(None)
+        ).order_by(bucket_expr, TaskResults.task_duration).yield_per(1000):
+            durations[int(ts)].append(duration)
+        for ts, values in durations.items():
+            rows[ts]["duration"]["p50"] = values[max(0, math.ceil(len(values) * 0.5) - 1)]
+            rows[ts]["duration"]["p95"] = values[max(0, math.ceil(len(values) * 0.95) - 1)]
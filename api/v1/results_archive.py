@@ -0,0 +1,55 @@
+from typing import Optional
+
+from flask import request
+
+from ...models.retention import TaskResultsArchive
+from ...tools.retention import retention_compactor
+
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, task_id: str):
+        return self._get_archive([
+            TaskResultsArchive.mode == self.mode,
+            TaskResultsArchive.project_id == project_id,
+            TaskResultsArchive.task_id == task_id,
+        ])
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, task_id: str, **kwargs):
+        return self._get_archive([
+            TaskResultsArchive.mode == self.mode,
+            TaskResultsArchive.task_id == task_id,
+        ])
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>/<string:task_id>',
+        '<string:mode>/<string:project_id>/<string:task_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _get_archive(query_filter: list):
+        """ Archived results chunks of a task, rows of one chunk with ?archive_id= """
+        archive_id: Optional[str] = request.args.get('archive_id')
+        query = TaskResultsArchive.query.filter(*query_filter)
+        if not archive_id:
+            archives = query.order_by(TaskResultsArchive.first_created_at.desc()).all()
+            return {"total": len(archives), "rows": [i.to_json() for i in archives]}, 200
+        try:
+            archive = query.filter(TaskResultsArchive.id == int(archive_id)).first()
+        except ValueError:
+            return {"message": "archive_id must be an integer"}, 400
+        if not archive:
+            return {"message": "No such archive"}, 404
+        return {"archive": archive.to_json(), "rows": retention_compactor.read_archive(archive)}, 200
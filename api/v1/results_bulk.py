@@ -0,0 +1,154 @@
+import json
+from typing import List, Optional, Tuple
+
+from flask import request
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from pylon.core.tools import log
+from tools import api_tools, auth, db
+
+from ...constants import RESULTS_BULK_MAX_SIZE
+from ...models.pd.results import ResultsBulkItemModel
+from ...models.results import TaskResults
+from ...tools.log_archiver import log_archiver
+from ...tools.status_broker import status_broker
+from ...tools.task_stats import task_stats_normalizer
+
+
+NDJSON_MIMETYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'}
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, project_id: int):
+        return self._ingest(
+            [TaskResults.project_id == project_id, TaskResults.mode == self.mode],
+            {'project_id': project_id, 'mode': self.mode}
+        )
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, **kwargs):
+        return self._ingest(
+            [TaskResults.mode == self.mode],
+            {'mode': self.mode}
+        )
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _read_items() -> List[Tuple[Optional[dict], Optional[str]]]:
+        """ JSON array or NDJSON body as a list of (item, parse error) """
+        body = request.get_data(as_text=True)
+        if request.mimetype not in NDJSON_MIMETYPES:
+            data = json.loads(body)
+            if isinstance(data, dict):
+                data = data.get('items')
+            if not isinstance(data, list):
+                raise ValueError('Expected a list of results or {"items": [...]}')
+            return [(i, None) for i in data]
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError as e:
+                items.append((None, f'Invalid JSON: {e}'))
+        return items
+
+    @staticmethod
+    def _ingest(query_filter: list, defaults: dict):
+        """ Validates every item, then writes all creates and updates in one transaction """
+        try:
+            raw_items = API._read_items()
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        if not raw_items:
+            return {"message": "batch is empty"}, 400
+        if len(raw_items) > RESULTS_BULK_MAX_SIZE:
+            return {"message": f"batch size is limited to {RESULTS_BULK_MAX_SIZE}"}, 400
+
+        statuses = [None] * len(raw_items)
+        parsed = {}
+        for idx, (raw, error) in enumerate(raw_items):
+            if error is None:
+                try:
+                    parsed[idx] = ResultsBulkItemModel.parse_obj(raw)
+                    continue
+                except ValidationError as e:
+                    error = e.errors()
+            statuses[idx] = {"index": idx, "code": 400, "message": error}
+
+        task_result_ids = {i.task_result_id for i in parsed.values()}
+        existing = dict(TaskResults.query.with_entities(
+            TaskResults.task_result_id, TaskResults.id
+        ).filter(
+            TaskResults.task_result_id.in_(task_result_ids), *query_filter
+        ).all()) if task_result_ids else dict()
+
+        # several items for one task_result_id are folded into a single row write, in order
+        creates, updates = dict(), dict()
+        for idx, item in parsed.items():
+            key = item.task_result_id
+            status = {"index": idx, "task_result_id": key}
+            values = item.values()
+            if 'task_stats' in values:
+                values.update(task_stats_normalizer.columns(values.pop('task_stats')))
+            if key in creates:
+                if item.op == 'create':
+                    statuses[idx] = {**status, "code": 409, "message": "Duplicate create in batch"}
+                    continue
+                creates[key].update(values)
+                statuses[idx] = {**status, "code": 201, "message": "Created"}
+            elif key in existing:
+                if item.op == 'create':
+                    statuses[idx] = {**status, "code": 409, "message": "task_result_id already exists"}
+                    continue
+                updates.setdefault(key, {'id': existing[key]}).update(values)
+                statuses[idx] = {**status, "code": 202, "message": "Accepted"}
+            else:
+                if item.op == 'update':
+                    statuses[idx] = {**status, "code": 404, "message": "No such task_result_id"}
+                    continue
+                creates[key] = {**defaults, 'task_result_id': key, **values}
+                statuses[idx] = {**status, "code": 201, "message": "Created"}
+
+        try:
+            if creates:
+                db.session.bulk_insert_mappings(TaskResults, list(creates.values()))
+            if updates:
+                db.session.bulk_update_mappings(TaskResults, list(updates.values()))
+            db.session.commit()
+        except IntegrityError as e:
+            # a concurrent writer created one of the rows, nothing from the batch is stored
+            db.session.rollback()
+            log.warning('Bulk results ingestion conflict: %s', e)
+            return {"message": "Conflicting concurrent write, retry the batch"}, 409
+
+        written = TaskResults.query.filter(
+            TaskResults.task_result_id.in_([*creates, *updates]), *query_filter
+        ).all() if creates or updates else []
+        updated = [i for i in written if i.task_result_id in updates]
+        if updated:
+            log_archiver.enqueue(*updated)
+        status_broker.notify(*written)
+
+        counts = {
+            "created": len(creates),
+            "updated": len(updates),
+            "failed": sum(1 for i in statuses if i['code'] >= 400),
+        }
+        return {"total": len(statuses), **counts, "items": statuses}, 207 if counts['failed'] else 200
@@ -0,0 +1,80 @@
+from typing import Optional
+
+from flask import request
+from pydantic import ValidationError
+
+from ...models.retention import TaskRetentionPolicy
+from ...models.validation_pd import TaskRetentionPolicyPD
+from ...tools.retention import retention_compactor
+
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int):
+        return self._get(self.mode, int(project_id))
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
+    def put(self, project_id: int):
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._set(self.mode, project.id, request.json)
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, **kwargs):
+        return self._get(self.mode, None)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
+    def put(self, **kwargs):
+        return self._set(self.mode, None, request.json)
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _query(mode: str, project_id: Optional[int]):
+        return TaskRetentionPolicy.query.filter(
+            TaskRetentionPolicy.mode == mode,
+            TaskRetentionPolicy.project_id == project_id if project_id is not None
+            else TaskRetentionPolicy.project_id.is_(None)
+        )
+
+    @staticmethod
+    def _get(mode: str, project_id: Optional[int]):
+        policy = API._query(mode, project_id).first()
+        if policy:
+            return {**policy.to_json(), "default": False}, 200
+        return {
+            "mode": mode,
+            "project_id": project_id,
+            "results_days": retention_compactor.results_days,
+            "logs_days": retention_compactor.logs_days,
+            "default": True,
+        }, 200
+
+    @staticmethod
+    def _set(mode: str, project_id: Optional[int], data: dict):
+        try:
+            pd_obj = TaskRetentionPolicyPD.parse_obj(data)
+        except ValidationError as e:
+            return e.errors(), 400
+        policy = API._query(mode, project_id).first()
+        if policy is None:
+            policy = TaskRetentionPolicy(mode=mode, project_id=project_id, **pd_obj.dict())
+            policy.insert()
+        else:
+            for k, v in pd_obj.dict().items():
+                setattr(policy, k, v)
+            policy.commit()
+        return {**policy.to_json(), "default": False}, 200
@@ -1,6 +1,11 @@
+import math
+from typing import Optional
+
 from flask import request
 
 # from ...constants import TASK_STATUS
+from ...constants import TASK_PRIORITY_MIN, TASK_PRIORITY_MAX
+from ...models.schedules import TaskSchedule
 from ...models.tasks import Task
 # from ...models.results import TaskResults
 
@@ -8,7 +13,10 @@ from tools import VaultClient
 from pylon.core.tools import log
 
 from ...tools.TaskManager import TaskManager
-from tools import api_tools, auth
+from ...tools.dispatch_queue import dispatch_queue, DispatchQueueFull
+from ...tools.admission import AdmissionRejected
+from ...tools.secret_templates import task_templates
+from tools import api_tools, auth, db
 
 
 class ProjectApi(api_tools.APIModeHandler):
@@ -30,12 +38,22 @@ class ProjectApi(api_tools.APIModeHandler):
     @auth.decorators.check_api(["configuration.tasks.tasks.create"])
     def post(self, project_id: int, task_id: str):
         project, task = self._get_task(project_id, task_id)  # todo: why do we extra query project?
+        if not task:
+            return {"message": "No such task", "code": 404}, 404
         try:
             event = [{row['name']: row['default'] for row in request.json}]
         except:
             event = request.json if isinstance(request.json, list) else [request.json]
         # resp = TaskManager(project.id).run_task(event, task.task_id)
-        resp = TaskManager(project_id=project.id, mode=self.mode).run_task(event, task.task_id)
+        task_manager = TaskManager(project_id=project.id, mode=self.mode)
+        priority = self._get_priority(request.args.get('priority'))
+        coalesce = self._get_coalesce()
+        if request.args.get('async', 'false').lower() == 'true':
+            return self._dispatch_async(task_manager, event, task.task_id, priority, coalesce)
+        try:
+            resp = task_manager.run_task(event, task.task_id, priority=priority, coalesce=coalesce)
+        except AdmissionRejected as e:
+            return {"message": str(e), "code": 429}, 429, {"Retry-After": str(math.ceil(e.retry_after))}
         # todo: why do you think task_result_id will be correct?
         # task_result_id = TaskResults.query.filter_by(task_id=task_id, project_id=project_id).order_by(
         #     TaskResults.id.desc()).first()
@@ -51,13 +69,20 @@ class ProjectApi(api_tools.APIModeHandler):
         task.task_handler = args.get("invoke_func")
         task.region = args.get("region")
         task.env_vars = args.get("env_vars")
+        priority = self._get_priority(args.get("priority"))
+        if priority is not None:
+            task.priority = priority
         task.commit()
+        task_templates.invalidate(task_id)
         return task.to_json(), 200
 
     @auth.decorators.check_api(["configuration.tasks.tasks.delete"])
     def delete(self, project_id: int, task_id: str):
         project, task = self._get_task(project_id, task_id)  # todo: why do we extra query project?
         task.delete()
+        TaskSchedule.query.filter(TaskSchedule.task_id == task_id).delete()
+        db.session.commit()
+        task_templates.invalidate(task_id)
         return None, 204
 
 
@@ -76,11 +101,21 @@ class AdminApi(api_tools.APIModeHandler):
     @auth.decorators.check_api(["configuration.tasks.tasks.create"])
     def post(self, task_id: str, **kwargs):
         task = self._get_task(task_id)
+        if not task:
+            return {"message": "No such task", "code": 404}, 404
         try:
             event = [{row['name']: row['default'] for row in request.json}]
         except:
             event = request.json
-        resp = TaskManager(mode=self.mode).run_task(event, task.task_id)
+        task_manager = TaskManager(mode=self.mode)
+        priority = self._get_priority(request.args.get('priority'))
+        coalesce = self._get_coalesce()
+        if request.args.get('async', 'false').lower() == 'true':
+            return self._dispatch_async(task_manager, event, task.task_id, priority, coalesce)
+        try:
+            resp = task_manager.run_task(event, task.task_id, priority=priority, coalesce=coalesce)
+        except AdmissionRejected as e:
+            return {"message": str(e), "code": 429}, 429, {"Retry-After": str(math.ceil(e.retry_after))}
         # todo: why do you think task_result_id will be correct?
         # task_result_id = TaskResults.query.filter(
         #     TaskResults.task_id == task_id
@@ -98,7 +133,11 @@ class AdminApi(api_tools.APIModeHandler):
         task.task_handler = request.json.get("invoke_func", task.task_handler)
         task.region = request.json.get("region", task.region)
         task.env_vars = request.json.get("env_vars", task.env_vars)
+        priority = self._get_priority(request.json.get("priority"))
+        if priority is not None:
+            task.priority = priority
         task.commit()
+        task_templates.invalidate(task_id)
         return task.to_json(), 200
 
     @auth.decorators.check_api(["configuration.tasks.tasks.delete"])
@@ -106,6 +145,9 @@ class AdminApi(api_tools.APIModeHandler):
         # task = self._get_task(task_id)
         # task.delete()
         Task.query.filter(Task.task_id == task_id, Task.mode == self.mode).delete()
+        TaskSchedule.query.filter(TaskSchedule.task_id == task_id).delete()
+        db.session.commit()
+        task_templates.invalidate(task_id)
         return None, 204
 
 
@@ -119,3 +161,29 @@ class API(api_tools.APIBase):
         'default': ProjectApi,
         'administration': AdminApi,
     }
+
+    @staticmethod
+    def _get_priority(value) -> Optional[int]:
+        try:
+            return min(max(int(value), TASK_PRIORITY_MIN), TASK_PRIORITY_MAX)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _get_coalesce() -> Optional[bool]:
+        coalesce = request.args.get('coalesce')
+        if coalesce is None:
+            return None
+        return coalesce.lower() == 'true'
+
+    @staticmethod
+    def _dispatch_async(task_manager: TaskManager, event: list, task_id: str,
+                        priority: Optional[int] = None, coalesce: Optional[bool] = None):
+        try:
+            dispatch_id = dispatch_queue.submit(
+                (task_manager.mode, task_manager.project_id),
+                task_manager.run_task, event, task_id, priority=priority, coalesce=coalesce
+            )
+        except DispatchQueueFull as e:
+            return {"message": str(e), "code": 429}, 429, {"Retry-After": str(dispatch_queue.retry_after)}
+        return {"message": "Queued", "code": 202, "task_id": task_id, "dispatch_id": dispatch_id}, 202
@@ -0,0 +1,60 @@
+from flask import request
+from pydantic import ValidationError
+
+from ...models.tasks import Task
+from ...models.validation_pd import TaskRunBatchPD
+
+from ...tools.TaskManager import TaskManager
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, project_id: int):
+        data = request.json
+        try:
+            pd_obj = TaskRunBatchPD.parse_obj({'items': data} if isinstance(data, list) else data)
+        except ValidationError as e:
+            return e.errors(), 400
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._run(TaskManager(project_id=project.id, mode=self.mode), pd_obj)
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, **kwargs):
+        data = request.json
+        try:
+            pd_obj = TaskRunBatchPD.parse_obj({'items': data} if isinstance(data, list) else data)
+        except ValidationError as e:
+            return e.errors(), 400
+        return self._run(TaskManager(mode=self.mode), pd_obj)
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    def _run(self, task_manager: TaskManager, pd_obj: TaskRunBatchPD):
+        task_ids = {i.task_id for i in pd_obj.items}
+        query_filter = [Task.task_id.in_(task_ids), Task.mode == task_manager.mode]
+        if task_manager.mode == 'default':
+            query_filter.append(Task.project_id == task_manager.project_id)
+        existing = {i[0] for i in Task.query.with_entities(Task.task_id).filter(*query_filter).all()}
+
+        batch = [(i.task_id, i.event, i.priority) for i in pd_obj.items if i.task_id in existing]
+        dispatched = iter(task_manager.run_tasks(batch, queue_name=pd_obj.queue_name) if batch else [])
+        items = [
+            next(dispatched) if i.task_id in existing
+            else {"message": f"No such task: {i.task_id}", "code": 404, "task_id": i.task_id}
+            for i in pd_obj.items
+        ]
+        accepted = sum(1 for i in items if i['code'] == 200)
+        return {"total": len(items), "accepted": accepted, "items": items}, 200
@@ -0,0 +1,123 @@
+from datetime import datetime
+from typing import Optional
+
+from flask import request
+from pydantic import ValidationError
+
+from ...models.schedules import TaskSchedule
+from ...models.tasks import Task
+from ...models.validation_pd import TaskScheduleModelPD
+from ...tools.scheduler import get_next_run
+
+from tools import api_tools, auth
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    def _query(self, project_id: int):
+        return TaskSchedule.query.filter(
+            TaskSchedule.project_id == project_id,
+            TaskSchedule.mode == self.mode,
+        )
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, schedule_id: Optional[int] = None):
+        return self._get(self._query(project_id), schedule_id)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, project_id: int, **kwargs):
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._create(project.id, request.json)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
+    def put(self, project_id: int, schedule_id: int):
+        return self._update(self._query(project_id), schedule_id, request.json)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.delete"])
+    def delete(self, project_id: int, schedule_id: int):
+        self._query(project_id).filter(TaskSchedule.id == schedule_id).delete()
+        TaskSchedule.commit()
+        return None, 204
+
+
+class AdminApi(api_tools.APIModeHandler):
+    def _query(self):
+        return TaskSchedule.query.filter(TaskSchedule.mode == self.mode)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, schedule_id: Optional[int] = None, **kwargs):
+        return self._get(self._query(), schedule_id)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.create"])
+    def post(self, **kwargs):
+        return self._create(None, request.json)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.edit"])
+    def put(self, schedule_id: int, **kwargs):
+        return self._update(self._query(), schedule_id, request.json)
+
+    @auth.decorators.check_api(["configuration.tasks.tasks.delete"])
+    def delete(self, schedule_id: int, **kwargs):
+        self._query().filter(TaskSchedule.id == schedule_id).delete()
+        TaskSchedule.commit()
+        return None, 204
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>',
+        '<string:mode>/<string:project_id>',
+        '<string:project_id>/<int:schedule_id>',
+        '<string:mode>/<string:project_id>/<int:schedule_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _get(query, schedule_id: Optional[int]):
+        if schedule_id:
+            schedule = query.filter(TaskSchedule.id == schedule_id).first()
+            if not schedule:
+                return {"message": "No such schedule"}, 404
+            return schedule.to_json(), 200
+        rows = [i.to_json() for i in query.order_by(TaskSchedule.id).all()]
+        return {"total": len(rows), "rows": rows}, 200
+
+    def _create(self, project_id: Optional[int], data: dict):
+        try:
+            pd_obj = TaskScheduleModelPD.parse_obj(data)
+        except ValidationError as e:
+            return e.errors(), 400
+        mode = 'default' if project_id else 'administration'
+        task_query = Task.query.filter(Task.task_id == pd_obj.task_id, Task.mode == mode)
+        if project_id:
+            task_query = task_query.filter(Task.project_id == project_id)
+        if not task_query.first():
+            return {"message": f"No such task: {pd_obj.task_id}"}, 404
+        schedule = TaskSchedule(project_id=project_id, mode=mode, **pd_obj.dict())
+        schedule.next_run_at = get_next_run(schedule, datetime.utcnow())
+        schedule.insert()
+        return schedule.to_json(), 201
+
+    @staticmethod
+    def _update(query, schedule_id: int, data: dict):
+        schedule = query.filter(TaskSchedule.id == schedule_id).first()
+        if not schedule:
+            return {"message": "No such schedule"}, 404
+        current = schedule.to_json()
+        # switching between cron and interval replaces the other one
+        if data.get('cron'):
+            current['interval'] = None
+        if data.get('interval'):
+            current['cron'] = None
+        try:
+            pd_obj = TaskScheduleModelPD.parse_obj({**current, **data})
+        except ValidationError as e:
+            return e.errors(), 400
+        for k, v in pd_obj.dict().items():
+            setattr(schedule, k, v)
+        schedule.next_run_at = get_next_run(schedule, datetime.utcnow())
+        schedule.commit()
+        return schedule.to_json(), 200
@@ -0,0 +1,81 @@
+import json
+import time
+
+from flask import Response, stream_with_context
+
+from ...tools.status_broker import status_broker, get_task_status, make_key
+from tools import api_tools, auth, db
+
+
+class ProjectApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, project_id: int, task_id: str):
+        project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
+        return self._stream(make_key(self.mode, project.id, task_id))
+
+
+class AdminApi(api_tools.APIModeHandler):
+    @auth.decorators.check_api(["configuration.tasks.tasks.view"])
+    def get(self, task_id: str, **kwargs):
+        return self._stream(make_key(self.mode, None, task_id))
+
+
+class API(api_tools.APIBase):
+    url_params = [
+        '<string:project_id>/<string:task_id>',
+        '<string:mode>/<string:project_id>/<string:task_id>',
+    ]
+
+    mode_handlers = {
+        'default': ProjectApi,
+        'administration': AdminApi,
+    }
+
+    @staticmethod
+    def _format(data: dict, version: int) -> str:
+        return f'id: {version}\nevent: status\ndata: {json.dumps(data)}\n\n'
+
+    @staticmethod
+    def _stream(key: tuple):
+        """ Server-sent events: the current status on connect, then every status change of the task
+
+        Changes published on this node arrive at once, the status is also re-read from the DB on
+        every heartbeat so changes handled by other nodes show up within that delay.
+        The stream ends after max_stream_duration, EventSource reconnects and gets a fresh snapshot.
+        Each open stream holds a worker thread, past max_streams on this node clients only get the
+        snapshot and reconnect after a heartbeat, which turns them into polling.
+        """
+        if status_broker.max_streams and status_broker.subscribers >= status_broker.max_streams:
+            data = get_task_status(*key)
+            db.session.close()
+            return Response(
+                f'retry: {int(status_broker.heartbeat * 1000)}\n\n' + API._format(data, 0),
+                mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'}
+            )
+
+        def generate():
+            with status_broker.subscribe(key) as topic:
+                version = status_broker.current_version(topic)
+                data = get_task_status(*key)
+                yield 'retry: 3000\n\n' + API._format(data, version)
+                db.session.close()
+                deadline = time.monotonic() + status_broker.max_stream_duration
+                while time.monotonic() < deadline:
+                    events = status_broker.wait(topic, version, status_broker.heartbeat)
+                    if events:
+                        # every event is a full status, the latest one is enough
+                        version, data = events[-1]
+                        yield API._format(data, version)
+                        continue
+                    status = get_task_status(*key)
+                    db.session.close()
+                    if status != data:
+                        data = status
+                        yield API._format(data, version)
+                    else:
+                        yield ': keepalive\n\n'
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        })
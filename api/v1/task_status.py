@@ -1,6 +1,9 @@
-from ...constants import TASK_STATUS
-from ...models.results import TaskResults
-from tools import api_tools, auth
+import time
+
+from flask import request
+
+from ...tools.status_broker import status_broker, get_task_status, make_key
+from tools import api_tools, auth, db
 
 
 class ProjectApi(api_tools.APIModeHandler):
@@ -17,19 +20,12 @@ class ProjectApi(api_tools.APIModeHandler):
         #     task_result_ids = [x.task_result_id for x in task_results_progress]
         #     return {"code": 200, "IN_PROGRESS": True, "task_result_ids": task_result_ids}
         # return {"code": 200, "IN_PROGRESS": False}
-        return self._query_results([
-            TaskResults.task_id == task_id,
-            TaskResults.project_id == project.id,
-            TaskResults.mode == self.mode,
-        ])
+        return self._query_results(make_key(self.mode, project.id, task_id))
 
 
 class AdminApi(api_tools.APIModeHandler):
     def get(self, task_id: str, **kwargs):
-        return self._query_results([
-            TaskResults.task_id == task_id,
-            TaskResults.mode == self.mode,
-        ])
+        return self._query_results(make_key(self.mode, None, task_id))
 
 
 class API(api_tools.APIBase):
@@ -43,12 +39,27 @@ class API(api_tools.APIBase):
         'administration': AdminApi,
     }
 
-    def _query_results(self, query_filter: list):
-        resp = TaskResults.query.with_entities(TaskResults.task_result_id).filter(
-            TaskResults.task_status == TASK_STATUS.IN_PROGRESS,
-            *query_filter
-        ).all()
-        if resp:
-            task_result_ids = [i[0] for i in resp]
-            return {"code": 200, "IN_PROGRESS": True, "task_result_ids": task_result_ids}, 200
-        return {"code": 200, "IN_PROGRESS": False}, 200
+    def _query_results(self, key: tuple):
+        """ Current status, or with ?wait=<sec>&known=<in progress ids> a long poll until it differs from known """
+        try:
+            wait = min(float(request.args.get('wait', 0)), status_broker.max_wait)
+        except ValueError:
+            return {"message": "wait must be a number"}, 400
+        if wait <= 0:
+            return get_task_status(*key), 200
+
+        known = {i for i in request.args.get('known', '').split(',') if i}
+        deadline = time.monotonic() + wait
+        with status_broker.subscribe(key) as topic:
+            since = status_broker.current_version(topic)
+            while True:
+                status = get_task_status(*key)
+                # do not keep a pooled connection while waiting
+                db.session.close()
+                remaining = deadline - time.monotonic()
+                if set(status.get('task_result_ids', [])) != known or remaining <= 0:
+                    return status, 200
+                # changes from other nodes are only seen in the DB, re-check it every heartbeat
+                events = status_broker.wait(topic, since, min(remaining, status_broker.heartbeat))
+                if events:
+                    return events[-1][1], 200
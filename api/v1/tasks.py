@@ -1,35 +1,43 @@
 import json
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from flask import request
 from pydantic import ValidationError
 from sqlalchemy import or_, and_
 
+from ...models.schedules import TaskSchedule
 from ...models.tasks import Task
 from ...models.validation_pd import TaskCreateModelPD, TaskPutModelPD
-from hurry.filesize import size
 
 from ...tools.TaskManager import TaskManager
-from tools import api_tools, data_tools, MinioClient, MinioClientAdmin, auth, VaultClient
+from ...tools.packages import package_catalog
+from ...tools.package_uploads import package_uploads, UploadError
+from ...tools.package_manifest import inspect_package, check_handler as check_package_handler
+from ...tools.secret_templates import task_templates
+from ...tools.secrets_cache import secrets_cache
+from tools import api_tools, data_tools, db, MinioClient, MinioClientAdmin, auth
 
 from pylon.core.tools import log
 
 
-def get_control_tower_size() -> int:
-    mc = MinioClientAdmin()
-    return size(mc.get_file_size(mc.TASKS_BUCKET, 'control-tower.zip'))
-
-
 class SizeMapper:
-    def __init__(self, files: List[dict]):
-        self.sizes = {i['name']: size(i["size"]) for i in files}
+    def __init__(self, tasks: List[Task]):
+        self.packages = package_catalog.packages(tasks)
 
     def map_size(self, task: Task) -> dict:
         result = task.to_json()
-        result["size"] = self.sizes.get(task.file_name)
+        result.update(package_catalog.to_json(package_catalog.package_of(self.packages, task)))
         return result
 
 
+def check_handler(manifest: Optional[dict], runtime: str, handler: str) -> Tuple[Optional[list], List[str]]:
+    """ Validation errors in pydantic format if the package surely lacks handler, and warnings """
+    error, warning = check_package_handler(manifest, runtime, handler)
+    if error:
+        return [{"loc": ["task_handler"], "msg": error, "type": "value_error.handler"}], []
+    return None, [warning] if warning else []
+
+
 class ProjectApi(api_tools.APIModeHandler):
     def _get_task(self, project_id: int, task_id: str):
         return self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id), \
@@ -60,15 +68,15 @@ class ProjectApi(api_tools.APIModeHandler):
                 }]
                 return {"total": len(resp), "rows": resp}, 200
             else:
-                resp = [task.to_json()]
+                resp = [SizeMapper([task]).map_size(task)]
                 return {"total": len(resp), "rows": resp}, 200
 
         project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
-        c = MinioClient(project)
-        files = c.list_files('tasks')
+        package_catalog.ensure_loaded(self.mode, project.id)
+        package_catalog.ensure_loaded('administration', None)
 
         # total, tasks = api_tools.get(project_id, args, Task)
-        secrets = VaultClient.from_project(project_id).get_all_secrets()
+        secrets = secrets_cache.get(project_id, self.mode)
         control_tower_id = secrets.get('control_tower_id')
         total, tasks = api_tools.get(
             project_id, request.args, Task,
@@ -76,14 +84,12 @@ class ProjectApi(api_tools.APIModeHandler):
             rpc_manager=self.module.context.rpc_manager,
             # carrier.task.mode = :mode_1 AND
             # carrier.task.project_id = :project_id_1 AND
-            # (carrier.task.zippath IN (__[POSTCOMPILE_zippath_1]) OR carrier.task.task_id = :task_id_1)
+            # (carrier.task.zippath IN (SELECT zippath FROM carrier.task_package ...) OR carrier.task.task_id = :task_id_1)
             custom_filter=or_(
                 and_(
                     Task.mode == self.mode,
                     Task.project_id == project_id,
-                    Task.zippath.in_([
-                        f'tasks/{i["name"]}' for i in files
-                    ])
+                    Task.zippath.in_(package_catalog.zippaths(self.mode, project.id))
                 ),
                 Task.task_id == control_tower_id
             )
@@ -102,9 +108,7 @@ class ProjectApi(api_tools.APIModeHandler):
         #             i['webhook'] = task.webhook
         #             i["size"] = size(i["size"])
         #             rows.append(i)
-        size_mapper = SizeMapper(files)
-        size_mapper.sizes['control-tower.zip'] = get_control_tower_size()
-
+        size_mapper = SizeMapper(tasks)
         return {"total": total, "rows": list(map(size_mapper.map_size, tasks))}, 200
 
     @auth.decorators.check_api({
@@ -121,21 +125,33 @@ class ProjectApi(api_tools.APIModeHandler):
             return {"message": "Empty data object"}, 400
         data['project_id'] = project_id
 
+        upload = None
         if file is not None:
             data['task_package'] = file.filename
+        elif data.get('upload_id'):
+            upload = package_uploads.get_complete(self.mode, project_id, data['upload_id'])
+            if not upload:
+                return {"message": "No such complete upload"}, 404
+            data['task_package'] = upload.file_name
         try:
             pd_obj = TaskCreateModelPD(**data)
         except ValidationError as e:
             return e.errors(), 400
 
-        if file is None:
+        if file is None and upload is None:
             return {"message": "Validations are passed. Upload task_package file."}, 200
 
+        manifest = upload.manifest if upload is not None else inspect_package(file)
+        errors, warnings = check_handler(manifest, pd_obj.runtime, pd_obj.task_handler)
+        if errors:
+            return errors, 400
+
         task_payload = {
             "funcname": pd_obj.dict().pop('task_name'),
             "invoke_func": pd_obj.dict().pop('task_handler'),
             "region": pd_obj.dict().pop('engine_location'),
             "runtime": pd_obj.dict().pop('runtime'),
+            "priority": pd_obj.priority,
             "env_vars": json.dumps({
                 "cpu_cores": pd_obj.dict().pop('cpu_cores'),
                 "memory": pd_obj.dict().pop('memory'),
@@ -145,8 +161,17 @@ class ProjectApi(api_tools.APIModeHandler):
         }
 
         project = self.module.context.rpc_manager.call.project_get_or_404(project_id=project_id)
-        task = TaskManager(project.id, mode=self.mode).create_task(file, task_payload)
-        return {"task_id": task.task_id, "message": f"Task {task_payload['funcname']} created"}, 201
+        task_manager = TaskManager(project.id, mode=self.mode)
+        if upload is not None:
+            try:
+                task = task_manager.create_task_from_upload(upload, task_payload)
+            except UploadError as e:
+                return {"message": e.message}, e.code
+        else:
+            task = task_manager.create_task(file, task_payload, manifest=manifest)
+        return {
+            "task_id": task.task_id, "message": f"Task {task_payload['funcname']} created", "warnings": warnings
+        }, 201
 
     @auth.decorators.check_api({
         "permissions": ["configuration.tasks.tasks.edit"],
@@ -170,23 +195,43 @@ class ProjectApi(api_tools.APIModeHandler):
         if not task:
             return {"message": "No such task in selected in project"}, 404
 
+        upload = None
+        if file is not None:
+            manifest = inspect_package(file)
+        elif data.get('upload_id'):
+            upload = package_uploads.get_complete(self.mode, project.id, data['upload_id'])
+            if not upload:
+                return {"message": "No such complete upload"}, 404
+            manifest = upload.manifest
+        else:
+            manifest = package_catalog.manifest(self.mode, project.id, task.zippath)
+        errors, warnings = check_handler(manifest, task.runtime, pd_obj.task_handler)
+        if errors:
+            return errors, 400
+
         task.task_name = pd_obj.dict().get("task_name")
 
-        file_size = None
         if file is not None:
             data['task_package'] = file.filename
             task.zippath = f"tasks/{file.filename}"
-            api_tools.upload_file(bucket="tasks", f=file, project=project)
-            c = MinioClient(project)
-            file_size = size(c.get_file_size('tasks', filename=file.filename))
+            package_catalog.upload(self.mode, project.id, file, api_tools.upload_file, manifest)
+        elif upload is not None:
+            try:
+                package_uploads.attach(self.mode, project.id, upload)
+            except UploadError as e:
+                db.session.rollback()
+                return {"message": e.message}, e.code
+            task.zippath = f"tasks/{upload.file_name}"
+            package_uploads.consume(upload)
 
         task.task_handler = pd_obj.dict().get("task_handler")
         task.env_vars = json.dumps(pd_obj.dict().get("task_parameters"))
+        if pd_obj.priority is not None:
+            task.priority = pd_obj.priority
         task.commit()
-        resp = task.to_json()
-        resp['size'] = file_size
+        task_templates.invalidate(task_id)
 
-        return resp, 200
+        return {**SizeMapper([task]).map_size(task), "warnings": warnings}, 200
 
     @auth.decorators.check_api({
         "permissions": ["configuration.tasks.tasks.edit"],
@@ -201,27 +246,29 @@ class ProjectApi(api_tools.APIModeHandler):
             return {"message": "No such task in selected in project"}, 404
 
         c = MinioClient(project=project)
-        c.remove_file('tasks', str(task.zippath).split("/")[-1])
+        c.remove_file('tasks', task.file_name)
+        package_catalog.remove(self.mode, project.id, task.file_name)
         task.delete()
+        TaskSchedule.query.filter(TaskSchedule.task_id == task_id).delete()
+        db.session.commit()
+        task_templates.invalidate(task_id)
         return None, 204
 
 
 class AdminApi(api_tools.APIModeHandler):
     def _get_list(self) -> dict:
-        files = MinioClientAdmin().list_files('tasks')
+        package_catalog.ensure_loaded(self.mode, None)
         total, tasks = api_tools.get(
             None, request.args, Task,
             mode=self.mode,
             rpc_manager=self.module.context.rpc_manager,
             additional_filters=[
-                Task.zippath.in_([
-                    f'tasks/{i["name"]}' for i in files
-                ])
+                Task.zippath.in_(package_catalog.zippaths(self.mode, None))
             ]
             # additional_filters=[Task.task_name.in_([Path(i["name"]).stem for i in files])]
         )
 
-        size_mapper = SizeMapper(files)
+        size_mapper = SizeMapper(tasks)
         return {"total": total, "rows": list(map(size_mapper.map_size, tasks))}
         # return {"total": total, "rows": [i.to_json() for i in tasks]}
 
@@ -233,7 +280,7 @@ class AdminApi(api_tools.APIModeHandler):
                 "task_parameters": json.loads(task.env_vars).get('task_parameters'),
             }]}
         else:
-            return {"total": 1, "rows": [task.to_json()]}
+            return {"total": 1, "rows": [SizeMapper([task]).map_size(task)]}
 
     @auth.decorators.check_api({
         "permissions": ["configuration.tasks.tasks.view"],
@@ -266,10 +313,15 @@ class AdminApi(api_tools.APIModeHandler):
             return {"message": "Empty data object"}, 400
         data['mode'] = self.mode
 
+        upload = None
         try:
             data['task_package'] = file.filename
         except AttributeError:
-            ...
+            if data.get('upload_id'):
+                upload = package_uploads.get_complete(self.mode, None, data['upload_id'])
+                if not upload:
+                    return {"message": "No such complete upload"}, 404
+                data['task_package'] = upload.file_name
         try:
             log.info('HERE IS POST 1')
             pd_obj = TaskCreateModelPD.parse_obj(data)
@@ -279,9 +331,14 @@ class AdminApi(api_tools.APIModeHandler):
             return e.errors(), 400
         log.info('HERE IS POST 4')
 
-        if file is None:
+        if file is None and upload is None:
             return {"message": "Validations are passed. Upload task_package file."}, 200
 
+        manifest = upload.manifest if upload is not None else inspect_package(file)
+        errors, warnings = check_handler(manifest, pd_obj.runtime, pd_obj.task_handler)
+        if errors:
+            return errors, 400
+
         task_payload = pd_obj.dict()
         task_payload['env_vars'] = json.dumps(pd_obj._env_vars)
         # todo: fix
@@ -290,9 +347,15 @@ class AdminApi(api_tools.APIModeHandler):
         task_payload['region'] = pd_obj.engine_location
         log.info('HERE IS POST 5')
 
-        task = TaskManager(mode=self.mode).create_task(file, task_payload)
+        if upload is not None:
+            try:
+                task = TaskManager(mode=self.mode).create_task_from_upload(upload, task_payload)
+            except UploadError as e:
+                return {"message": e.message}, e.code
+        else:
+            task = TaskManager(mode=self.mode).create_task(file, task_payload, manifest=manifest)
         log.info('HERE IS POST 6')
-        return {"task_id": task.task_id, "message": f"Task {task.task_name} created"}, 201
+        return {"task_id": task.task_id, "message": f"Task {task.task_name} created", "warnings": warnings}, 201
 
     @auth.decorators.check_api({
         "permissions": ["configuration.tasks.tasks.edit"],
@@ -318,24 +381,42 @@ class AdminApi(api_tools.APIModeHandler):
         if not task:
             return {"message": "No such task in selected in project"}, 404
 
-        if file is None:
-            mc = MinioClientAdmin()
-            file_size = size(mc.get_file_size(bucket='tasks', filename=task.file_name))
+        upload = None
+        if file is not None:
+            manifest = inspect_package(file)
+        elif data.get('upload_id'):
+            upload = package_uploads.get_complete(self.mode, None, data['upload_id'])
+            if not upload:
+                return {"message": "No such complete upload"}, 404
+            manifest = upload.manifest
         else:
+            manifest = package_catalog.manifest(self.mode, None, task.zippath)
+        errors, warnings = check_handler(manifest, task.runtime, pd_obj.task_handler)
+        if errors:
+            return errors, 400
+
+        if file is not None:
             # data['task_package'] = file.filename
             task.zippath = f"tasks/{file.filename}"
-            api_tools.upload_file_admin(bucket="tasks", f=file)
-            file_size = size(file)
+            package_catalog.upload(self.mode, None, file, api_tools.upload_file_admin, manifest)
+        elif upload is not None:
+            try:
+                package_uploads.attach(self.mode, None, upload)
+            except UploadError as e:
+                db.session.rollback()
+                return {"message": e.message}, e.code
+            task.zippath = f"tasks/{upload.file_name}"
+            package_uploads.consume(upload)
 
         task.task_name = pd_obj.task_name
         task.task_handler = pd_obj.task_handler
         task.env_vars = json.dumps(pd_obj.task_parameters)
+        if pd_obj.priority is not None:
+            task.priority = pd_obj.priority
         task.commit()
+        task_templates.invalidate(task_id)
 
-        resp = task.to_json()
-        resp['size'] = file_size
-
-        return resp, 200
+        return {**SizeMapper([task]).map_size(task), "warnings": warnings}, 200
 
     @auth.decorators.check_api({
         "permissions": ["configuration.tasks.tasks.delete"],
@@ -352,7 +433,11 @@ class AdminApi(api_tools.APIModeHandler):
 
         mc = MinioClientAdmin()
         mc.remove_file('tasks', task.file_name)
+        package_catalog.remove(self.mode, None, task.file_name)
         task.delete()
+        TaskSchedule.query.filter(TaskSchedule.task_id == task_id).delete()
+        db.session.commit()
+        task_templates.invalidate(task_id)
         return None, 204
 
 
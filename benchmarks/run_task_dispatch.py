@@ -0,0 +1,57 @@
+""" Compare execute_lambda dispatch rate with a fresh Arbiter per run vs the pooled publisher
+
+Usage: python benchmarks/run_task_dispatch.py --host rabbit --user user --password password -n 500
+"""
+import argparse
+import importlib.util
+import time
+from pathlib import Path
+
+from arbiter import Arbiter
+
+spec = importlib.util.spec_from_file_location(
+    'arbiter_pool', Path(__file__).resolve().parent.parent.joinpath('tools', 'arbiter_pool.py')
+)
+arbiter_pool_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(arbiter_pool_module)
+
+
+def run_unpooled(factory, queue_name: str, runs: int) -> float:
+    start = time.perf_counter()
+    for i in range(runs):
+        arbiter = factory()
+        arbiter.apply('execute_lambda', queue=queue_name, task_kwargs={'benchmark': i})
+        arbiter.close()
+    return runs / (time.perf_counter() - start)
+
+
+def run_pooled(factory, queue_name: str, runs: int) -> float:
+    pool = arbiter_pool_module.ArbiterPool(factory=factory)
+    start = time.perf_counter()
+    for i in range(runs):
+        arbiter = pool.acquire(queue_name)
+        arbiter.apply('execute_lambda', queue=queue_name, task_kwargs={'benchmark': i})
+        arbiter.close()
+    result = runs / (time.perf_counter() - start)
+    pool.close()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5672)
+    parser.add_argument('--user', default='guest')
+    parser.add_argument('--password', default='guest')
+    parser.add_argument('--queue', default='tasks_benchmark')
+    parser.add_argument('-n', '--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    def factory():
+        return Arbiter(host=args.host, port=args.port, user=args.user, password=args.password)
+
+    unpooled = run_unpooled(factory, args.queue, args.runs)
+    pooled = run_pooled(factory, args.queue, args.runs)
+    print(f'unpooled: {unpooled:.1f} runs/sec')
+    print(f'pooled:   {pooled:.1f} runs/sec')
+    print(f'speedup:  {pooled / unpooled:.1f}x')
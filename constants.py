@@ -28,3 +28,49 @@ class TASK_STATUS(StrEnum):
     IN_PROGRESS = 'In progress...'
     DONE = 'Done'
     FAILED = 'Failed'
+
+
+class ARCHIVE_STATUS(StrEnum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    PRUNED = 'pruned'
+
+
+class UPLOAD_STATUS(StrEnum):
+    INITIATED = 'initiated'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    USED = 'used'
+
+
+RUN_BATCH_MAX_SIZE = 500
+
+TASK_PRIORITY_MIN = 0
+TASK_PRIORITY_MAX = 9
+TASK_PRIORITY_DEFAULT = 0
+
+RESULTS_PAGE_SIZE = 100
+RESULTS_PAGE_SIZE_MAX = 1000
+
+RESULTS_BULK_MAX_SIZE = 1000
+
+LOG_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+ANALYTICS_POINTS = 200
+ANALYTICS_POINTS_MAX = 2000
+ANALYTICS_MIN_BUCKET = 60
+ANALYTICS_DEFAULT_RANGE = 30 * 24 * 3600
+
+PACKAGE_HASH_CHUNK_SIZE = 1024 * 1024
+
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_PART_SIZE_MAX = 64 * 1024 * 1024
+UPLOAD_MAX_PARTS = 10000
+# stored as tasks/<file_name> in the String(128) zippath columns
+UPLOAD_FILE_NAME_MAX_LENGTH = 128 - len('tasks/')
+
+PACKAGE_MANIFEST_MAX_SOURCE_SIZE = 1024 * 1024
+PACKAGE_MANIFEST_MAX_SOURCES = 2000
+PACKAGE_MANIFEST_READ_BUFFER = 256 * 1024
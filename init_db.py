@@ -1,8 +1,187 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import inspect, text, Table, Column, Integer, String, DateTime
+from sqlalchemy.exc import IntegrityError, DBAPIError
+
+from pylon.core.tools import log
 from tools import db
 
 
+schema_version = Table(
+    'task_schema_version', db.get_shared_metadata(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(256), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def add_missing_columns(table) -> None:
+    """ create_all does not alter existing tables, add new nullable/defaulted columns by hand
+
+    NOT NULL is kept for columns with a server default, existing rows get the default.
+    """
+    existing = _column_names(table)
+    compiler = db.engine.dialect.ddl_compiler(db.engine.dialect, None)
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        ddl = f'ALTER TABLE {table.fullname} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}'
+        default = compiler.get_column_default_string(column)
+        if default is not None:
+            ddl += f' DEFAULT {default}'
+            if not column.nullable:
+                ddl += ' NOT NULL'
+        elif not column.nullable:
+            log.warning('Adding %s.%s as nullable, it has no server default', table.fullname, column.name)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(ddl))
+        except DBAPIError:
+            # another node added the column in the meantime
+            if column.name not in _column_names(table):
+                raise
+            log.info('Column %s.%s already added', table.fullname, column.name)
+
+
+def _column_names(table) -> set:
+    return {i['name'] for i in inspect(db.engine).get_columns(table.name, schema=table.schema)}
+
+
+def add_missing_indexes(table, names: Optional[set] = None) -> None:
+    """ create_all skips indexes of tables that already exist, names limits it to some of them """
+    existing = {i['name'] for i in inspect(db.engine).get_indexes(table.name, schema=table.schema)}
+    with db.engine.begin() as connection:
+        for index in table.indexes:
+            if index.name not in existing and (names is None or index.name in names):
+                log.info('Creating index %s on %s', index.name, table.fullname)
+                index.create(bind=connection)
+
+
+def _task_priority():
+    from .models.tasks import Task
+    add_missing_columns(Task.__table__)
+
+
+def _hot_path_indexes():
+    from .models.results import TaskResults
+    from .models.tasks import Task
+    add_missing_indexes(TaskResults.__table__)
+    add_missing_indexes(Task.__table__)
+
+
+def _task_results_metric_columns():
+    from .models.results import TaskResults
+    add_missing_columns(TaskResults.__table__)
+
+
+def _task_package_metadata():
+    from .models.packages import TaskPackage
+    add_missing_columns(TaskPackage.__table__)
+
+
+def _task_package_hash_index():
+    from .models.packages import TaskPackage
+    # the unique zippath index needs duplicates removed first, see step 10
+    add_missing_indexes(TaskPackage.__table__, {'ix_task_package_content_hash'})
+
+
+def _task_package_manifest():
+    from .models.packages import TaskPackage, TaskPackageUpload
+    add_missing_columns(TaskPackage.__table__)
+    add_missing_columns(TaskPackageUpload.__table__)
+
+
+def _task_package_blob_last_used():
+    from .models.packages import TaskPackageBlob
+    add_missing_columns(TaskPackageBlob.__table__)
+
+
+def _task_log_archive_location():
+    from .models.log_archive import TaskLogArchiveJob
+    add_missing_columns(TaskLogArchiveJob.__table__)
+
+
+def _task_run_claim_expiry_index():
+    from .models.coalescing import TaskRunClaim
+    add_missing_indexes(TaskRunClaim.__table__)
+
+
+def _task_package_unique_zippath():
+    from .models.packages import TaskPackage
+    # keep the most recently updated row of duplicates left by concurrent uploads
+    seen, duplicates = set(), []
+    for package_id, mode, project_id, zippath in TaskPackage.query.with_entities(
+            TaskPackage.id, TaskPackage.mode, TaskPackage.project_id, TaskPackage.zippath
+    ).order_by(TaskPackage.updated_at.desc().nullslast(), TaskPackage.id.desc()).all():
+        key = (mode, project_id or 0, zippath)
+        if key in seen:
+            duplicates.append(package_id)
+        seen.add(key)
+    if duplicates:
+        log.info('Removing %s duplicate task package rows', len(duplicates))
+        TaskPackage.query.filter(TaskPackage.id.in_(duplicates)).delete(synchronize_session=False)
+    db.session.commit()
+    add_missing_indexes(TaskPackage.__table__)
+
+
+# append only, every step must be safe to re-run on a partially migrated schema
+MIGRATIONS = [
+    (1, 'task.priority column', _task_priority),
+    (2, 'task and task_results lookup indexes', _hot_path_indexes),
+    (3, 'task_results metric columns', _task_results_metric_columns),
+    (4, 'task_package etag, hash and upload time', _task_package_metadata),
+    (5, 'task_package content hash index', _task_package_hash_index),
+    (6, 'task package manifest', _task_package_manifest),
+    (7, 'task_package_blob.last_used_at', _task_package_blob_last_used),
+    (8, 'task_log_archive_job bucket and file name', _task_log_archive_location),
+    (9, 'task_run_claim expiry index', _task_run_claim_expiry_index),
+    (10, 'task_package unique zippath per scope', _task_package_unique_zippath),
+]
+
+
+# pg_advisory_lock key for migrate(), any constant unique within the database
+MIGRATION_LOCK_KEY = 0x7461736b6d  # 'taskm'
+
+
+def migrate() -> None:
+    """ Applies pending MIGRATIONS, nodes starting together wait for each other (postgres advisory lock) """
+    if db.engine.dialect.name != 'postgresql':
+        _migrate()
+        return
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+        try:
+            _migrate()
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+
+def _migrate() -> None:
+    with db.engine.connect() as connection:
+        applied = {row[0] for row in connection.execute(schema_version.select())}
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        log.info('Applying tasks schema migration %s: %s', version, name)
+        step()
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(schema_version.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # another node recorded the same step concurrently
+            log.info('Tasks schema migration %s already recorded', version)
+
+
 def init_db():
     from .models.results import TaskResults
     from .models.tasks import Task
+    from .models.schedules import TaskSchedule, TaskSchedulerLeader
+    from .models.coalescing import TaskRunClaim
+    from .models.log_archive import TaskLogArchiveJob
+    from .models.retention import TaskRetentionPolicy, TaskResultsArchive
+    from .models.packages import TaskPackage, TaskPackageScope, TaskPackageBlob, TaskPackageUpload
     db.get_shared_metadata().create_all(bind=db.engine)
-
+    migrate()
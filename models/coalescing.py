@@ -0,0 +1,29 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from sqlalchemy import Column, String, DateTime, Index
+
+from tools import db, db_tools
+
+
+class TaskRunClaim(db_tools.AbstractBaseMixin, db.Base):
+    """ Cross-node claim on a (task, event) run, duplicates inside the window reuse its task_key """
+    __tablename__ = "task_run_claim"
+
+    key = Column(String(128), primary_key=True)
+    task_id = Column(String(128), unique=False, nullable=False)
+    task_key = Column(String(128), unique=False, nullable=True)
+    expires_at = Column(DateTime, unique=False, nullable=False)
+
+
+Index('ix_task_run_claim_expires_at', TaskRunClaim.expires_at)
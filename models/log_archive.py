@@ -0,0 +1,42 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+
+from tools import db, db_tools, data_tools
+
+from ..constants import ARCHIVE_STATUS
+
+
+class TaskLogArchiveJob(db_tools.AbstractBaseMixin, db.Base):
+    """ Durable Loki to MinIO log archival job, one row per task result """
+    __tablename__ = "task_log_archive_job"
+
+    task_result_id = Column(String(128), primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    task_id = Column(String(128), unique=False, nullable=True)
+    status = Column(String(32), unique=False, nullable=False, default=ARCHIVE_STATUS.QUEUED.value)
+    attempts = Column(Integer, unique=False, nullable=False, default=0)
+    last_error = Column(Text, unique=False, nullable=True)
+    # where the archived log was written, to prune it even after the task is gone
+    bucket = Column(String(128), unique=False, nullable=True)
+    file_name = Column(String(256), unique=False, nullable=True)
+    next_attempt_at = Column(DateTime, unique=False, nullable=False)
+    locked_by = Column(String(128), unique=False, nullable=True)
+    locked_until = Column(DateTime, unique=False, nullable=True)
+    created_at = Column(DateTime, server_default=data_tools.utcnow())
+    finished_at = Column(DateTime, unique=False, nullable=True)
+
+
+Index('ix_task_log_archive_job_status_next', TaskLogArchiveJob.status, TaskLogArchiveJob.next_attempt_at)
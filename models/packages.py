@@ -0,0 +1,90 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, JSON, Index, func
+
+from tools import db, db_tools, data_tools
+
+from ..constants import UPLOAD_STATUS
+
+
+class TaskPackage(db_tools.AbstractBaseMixin, db.Base):
+    """ Package file present in the tasks bucket of a project (or of a whole non-default mode) """
+    __tablename__ = "task_package"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    zippath = Column(String(128), unique=False, nullable=False)
+    size = Column(BigInteger, unique=False, nullable=True)
+    etag = Column(String(128), unique=False, nullable=True)
+    content_hash = Column(String(64), unique=False, nullable=True)
+    uploaded_at = Column(DateTime, unique=False, nullable=True)
+    manifest = Column(JSON, unique=False, nullable=True)
+    updated_at = Column(DateTime, server_default=data_tools.utcnow(), onupdate=data_tools.utcnow())
+
+    @property
+    def file_name(self) -> str:
+        return self.zippath.rsplit('/', 1)[-1]
+
+
+class TaskPackageScope(db_tools.AbstractBaseMixin, db.Base):
+    """ Scope whose tasks bucket has been listed into task_package at least once """
+    __tablename__ = "task_package_scope"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    loaded_at = Column(DateTime, server_default=data_tools.utcnow())
+
+
+class TaskPackageBlob(db_tools.AbstractBaseMixin, db.Base):
+    """ Package content stored once in the shared package store, referenced by task_package.content_hash """
+    __tablename__ = "task_package_blob"
+
+    content_hash = Column(String(64), primary_key=True)
+    size = Column(BigInteger, unique=False, nullable=True)
+    etag = Column(String(128), unique=False, nullable=True)
+    created_at = Column(DateTime, server_default=data_tools.utcnow())
+    last_used_at = Column(DateTime, unique=False, nullable=True)
+
+
+class TaskPackageUpload(db_tools.AbstractBaseMixin, db.Base):
+    """ Chunked package upload staged as a MinIO multipart upload in the package store """
+    __tablename__ = "task_package_upload"
+
+    id = Column(String(64), primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    file_name = Column(String(128), unique=False, nullable=False)
+    sha256 = Column(String(64), unique=False, nullable=False)
+    size = Column(BigInteger, unique=False, nullable=True)
+    key = Column(String(256), unique=False, nullable=False)
+    multipart_id = Column(String(1024), unique=False, nullable=True)
+    status = Column(String(32), unique=False, nullable=False, default=UPLOAD_STATUS.INITIATED.value)
+    last_error = Column(Text, unique=False, nullable=True)
+    manifest = Column(JSON, unique=False, nullable=True)
+    created_at = Column(DateTime, server_default=data_tools.utcnow())
+    updated_at = Column(DateTime, server_default=data_tools.utcnow(), onupdate=data_tools.utcnow())
+
+
+Index('ix_task_package_project_mode_zippath', TaskPackage.project_id, TaskPackage.mode, TaskPackage.zippath)
+Index('ix_task_package_content_hash', TaskPackage.content_hash)
+# one row per package, project_id is null outside the default mode and nulls never collide
+Index(
+    'ux_task_package_mode_project_zippath',
+    TaskPackage.mode, func.coalesce(TaskPackage.project_id, 0), TaskPackage.zippath,
+    unique=True
+)
+Index('ix_task_package_scope_project_mode', TaskPackageScope.project_id, TaskPackageScope.mode)
+Index('ix_task_package_upload_status_created', TaskPackageUpload.status, TaskPackageUpload.created_at)
@@ -1,27 +1,32 @@
+import re
 from datetime import datetime
-from typing import Optional, Union
+from typing import Optional, Union, ClassVar, Tuple, Literal
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, validator, constr
 from hurry.filesize import size
 
 
-class ResultsGetModel(BaseModel):
-    task_stats: Optional[dict]
-    id: int
-    mode: str
-    project_id: Optional[int]
-    results: Optional[str] = '{}'
-    task_duration: Optional[float] = 0
-    task_id: str
-    task_result_id: str
-    task_status: str
-    ts: Union[int, str, None]
-    created_at: Union[datetime, str, None]
+_SIZE_RE = re.compile(r'\s*(\d+(?:\.\d+)?)\s*([KMGTPEZY]?)(?:I?B)?\s*', re.IGNORECASE)
 
-    @validator('task_stats')
-    def format_stats(cls, value: Optional[dict]):
-        if not value:
-            return value
+
+def parse_size(value: Union[int, float, str, None]) -> Optional[int]:
+    """ Bytes from a number or a hurry.filesize style string like '12M' """
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    match = _SIZE_RE.fullmatch(str(value))
+    if not match:
+        return None
+    number, unit = match.groups()
+    power = 'KMGTPEZY'.find(unit.upper()) + 1 if unit else 0
+    return int(float(number) * 1024 ** power)
+
+
+def parse_task_stats(value: Optional[dict]) -> dict:
+    """ Metric columns of task_results from a raw docker stats blob """
+    stats = {'cpu_usage': None, 'memory_usage_bytes': None, 'memory_limit_bytes': None}
+    if not value:
+        return stats
+    try:
         usage_delta = (
                 value['cpu_stats']['cpu_usage']['total_usage'] -
                 value['precpu_stats']['cpu_usage']['total_usage']
@@ -32,10 +37,52 @@ class ResultsGetModel(BaseModel):
         )
         online_cpus = value["cpu_stats"].get("online_cpus",
                                              len(value["cpu_stats"]["cpu_usage"].get("percpu_usage", [None])))
+        stats['cpu_usage'] = round(usage_delta / system_delta, 2) * online_cpus * 100
+    except (KeyError, TypeError, ZeroDivisionError):
+        stats['cpu_usage'] = value.get('cpu_usage') if isinstance(value.get('cpu_usage'), (int, float)) else None
+    if value.get('memory_stats'):
+        stats['memory_usage_bytes'] = parse_size(value['memory_stats'].get('usage'))
+        stats['memory_limit_bytes'] = parse_size(value['memory_stats'].get('limit'))
+    else:
+        stats['memory_usage_bytes'] = parse_size(value.get('memory_usage'))
+    return stats
+
 
-        memory_usage = size(value["memory_stats"]["usage"]) if value.get('memory_stats') else value["memory_usage"]
+class ResultsGetModel(BaseModel):
+    task_stats: Optional[dict]
+    cpu_usage: Optional[float]
+    memory_usage_bytes: Optional[int]
+    memory_limit_bytes: Optional[int]
+    id: Optional[int]
+    mode: Optional[str]
+    project_id: Optional[int]
+    results: Optional[str] = '{}'
+    log: Optional[str]
+    task_duration: Optional[float] = 0
+    task_id: Optional[str]
+    task_result_id: Optional[str]
+    task_status: Optional[str]
+    ts: Union[int, str, None]
+    created_at: Union[datetime, str, None]
+
+    # heavy columns are only loaded when explicitly requested
+    DEFAULT_FIELDS: ClassVar[Tuple[str, ...]] = (
+        'id', 'mode', 'project_id', 'task_duration', 'task_id',
+        'task_result_id', 'task_status', 'task_stats', 'ts', 'created_at',
+    )
+
+    @validator('task_stats')
+    def format_stats(cls, value: Optional[dict]):
+        if not value or 'cpu_stats' not in value:
+            # already compact, e.g. built from the metric columns
+            return value
+        stats = parse_task_stats(value)
+        if value.get('memory_stats'):
+            memory_usage = size(stats['memory_usage_bytes']) if stats['memory_usage_bytes'] is not None else None
+        else:
+            memory_usage = value.get("memory_usage")
         return {
-            "cpu_usage": round(usage_delta / system_delta, 2) * online_cpus * 100,
+            "cpu_usage": stats['cpu_usage'],
             "memory_usage": memory_usage
         }
 
@@ -50,3 +97,23 @@ class ResultsGetModel(BaseModel):
         if isinstance(value, datetime):
             return value.isoformat(timespec='seconds')
         return value
+
+
+class ResultsBulkItemModel(BaseModel):
+    """ One create or update of the bulk ingestion endpoint, upsert by task_result_id by default """
+    op: Literal['create', 'update', 'upsert'] = 'upsert'
+    task_result_id: constr(min_length=1, max_length=128)
+    task_id: Optional[str]
+    results: Optional[str]
+    log: Optional[str]
+    task_duration: Optional[float]
+    task_status: Optional[str]
+    task_stats: Optional[dict]
+
+    WRITABLE_FIELDS: ClassVar[Tuple[str, ...]] = (
+        'task_id', 'results', 'log', 'task_duration', 'task_status', 'task_stats',
+    )
+
+    def values(self) -> dict:
+        """ Only the fields sent by the worker, so partial updates keep the stored ones """
+        return self.dict(include=set(self.WRITABLE_FIELDS), exclude_unset=True)
@@ -1,8 +1,10 @@
 from typing import Optional, Union
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, validator, conint
 import json
 
+from ...constants import TASK_PRIORITY_MIN, TASK_PRIORITY_MAX, TASK_PRIORITY_DEFAULT
+
 
 class TaskCreateModel(BaseModel):
     mode: str = 'default'
@@ -15,6 +17,7 @@ class TaskCreateModel(BaseModel):
     region: str
     webhook: str = ''
     env_vars: str = '{}'
+    priority: conint(ge=TASK_PRIORITY_MIN, le=TASK_PRIORITY_MAX) = TASK_PRIORITY_DEFAULT
 
     class Config:
         fields = {'task_handler': 'invoke_func', 'task_name': 'funcname'}
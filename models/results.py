@@ -13,11 +13,13 @@
 #     limitations under the License.
 from typing import Optional
 
-from sqlalchemy import String, Column, Integer, Text, Float, JSON, DateTime
+from sqlalchemy import String, Column, Integer, BigInteger, Text, Float, JSON, DateTime, Index
 
 from tools import db, db_tools, data_tools
 from pylon.core.tools import log
 
+from ..constants import TASK_STATUS
+
 
 class TaskResults(db_tools.AbstractBaseMixin, db.Base):
     __tablename__ = "task_results"
@@ -32,7 +34,11 @@ class TaskResults(db_tools.AbstractBaseMixin, db.Base):
     task_duration = Column(Float, unique=False, nullable=True)
     task_status = Column(Text, unique=False, nullable=True)
     task_result_id = Column(String(128), unique=True, nullable=False)
-    task_stats = Column(JSON, nullable=True, unique=False)
+    task_stats = Column(JSON(none_as_null=True), nullable=True, unique=False)
+    # computed from task_stats on ingest, the raw blob itself is only kept if configured
+    cpu_usage = Column(Float, unique=False, nullable=True)
+    memory_usage_bytes = Column(BigInteger, unique=False, nullable=True)
+    memory_limit_bytes = Column(BigInteger, unique=False, nullable=True)
     created_at = Column(DateTime, server_default=data_tools.utcnow())
 
     @property
@@ -56,3 +62,13 @@ class TaskResults(db_tools.AbstractBaseMixin, db.Base):
         serialized = super().to_json(**kwargs)
         serialized['ts'] = self.__get_ts(True)
         return serialized
+
+
+Index('ix_task_results_task_mode_project', TaskResults.task_id, TaskResults.mode, TaskResults.project_id)
+Index('ix_task_results_status_task', TaskResults.task_status, TaskResults.task_id)
+# partial index where the backend supports it, a plain one elsewhere
+Index(
+    'ix_task_results_in_progress', TaskResults.task_id, TaskResults.project_id, TaskResults.mode,
+    postgresql_where=TaskResults.task_status == TASK_STATUS.IN_PROGRESS.value,
+    sqlite_where=TaskResults.task_status == TASK_STATUS.IN_PROGRESS.value,
+)
@@ -0,0 +1,48 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from sqlalchemy import Column, Integer, String, DateTime, Index
+
+from tools import db, db_tools, data_tools
+
+
+class TaskRetentionPolicy(db_tools.AbstractBaseMixin, db.Base):
+    """ Retention of results and their logs for one project (or a whole non-default mode), null keeps forever """
+    __tablename__ = "task_retention_policy"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    results_days = Column(Integer, unique=False, nullable=True)
+    logs_days = Column(Integer, unique=False, nullable=True)
+    updated_at = Column(DateTime, server_default=data_tools.utcnow(), onupdate=data_tools.utcnow())
+
+
+class TaskResultsArchive(db_tools.AbstractBaseMixin, db.Base):
+    """ One compressed NDJSON chunk of expired task_results rows stored in MinIO """
+    __tablename__ = "task_results_archive"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    task_id = Column(String(128), unique=False, nullable=True)
+    bucket = Column(String(128), unique=False, nullable=False)
+    file_name = Column(String(512), unique=False, nullable=False)
+    rows = Column(Integer, unique=False, nullable=False)
+    first_created_at = Column(DateTime, unique=False, nullable=True)
+    last_created_at = Column(DateTime, unique=False, nullable=True)
+    created_at = Column(DateTime, server_default=data_tools.utcnow())
+
+
+Index('ix_task_retention_policy_mode_project', TaskRetentionPolicy.mode, TaskRetentionPolicy.project_id)
+Index('ix_task_results_archive_task', TaskResultsArchive.task_id, TaskResultsArchive.mode, TaskResultsArchive.project_id)
@@ -0,0 +1,46 @@
+#     Copyright 2020 getcarrier.io
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON
+
+from tools import db, db_tools, data_tools
+
+
+class TaskSchedule(db_tools.AbstractBaseMixin, db.Base):
+    __tablename__ = "task_schedule"
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, unique=False, nullable=True)
+    mode = Column(String(64), unique=False, nullable=False, default='default')
+    task_id = Column(String(128), unique=False, nullable=False)
+    name = Column(String(128), unique=False, nullable=False)
+    cron = Column(String(128), unique=False, nullable=True)
+    interval = Column(Integer, unique=False, nullable=True)
+    event = Column(JSON, unique=False, nullable=True)
+    queue_name = Column(String(128), unique=False, nullable=True)
+    priority = Column(Integer, unique=False, nullable=True)
+    active = Column(Boolean, unique=False, nullable=False, default=True)
+    jitter = Column(Integer, unique=False, nullable=False, default=0)
+    misfire_grace = Column(Integer, unique=False, nullable=False, default=60)
+    next_run_at = Column(DateTime, unique=False, nullable=True)
+    last_run_at = Column(DateTime, unique=False, nullable=True)
+    created_at = Column(DateTime, server_default=data_tools.utcnow())
+
+
+class TaskSchedulerLeader(db_tools.AbstractBaseMixin, db.Base):
+    """ Single row lease, the node holding it is the only one firing schedules """
+    __tablename__ = "task_scheduler_leader"
+
+    id = Column(Integer, primary_key=True)
+    holder = Column(String(128), unique=False, nullable=True)
+    expires_at = Column(DateTime, unique=False, nullable=True)
@@ -11,7 +11,7 @@
 #     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
-from sqlalchemy import Column, Integer, String, Text
+from sqlalchemy import Column, Integer, String, Text, Index
 
 from tools import db, db_tools
 
@@ -30,6 +30,7 @@ class Task(db_tools.AbstractBaseMixin, db.Base):
     region = Column(String(128), unique=False, nullable=False)
     webhook = Column(String(128), unique=False, nullable=True)
     env_vars = Column(Text, unique=False, nullable=True)
+    priority = Column(Integer, unique=False, nullable=False, default=0, server_default='0')
 
     def insert(self):
         if not self.webhook:
@@ -53,3 +54,5 @@ class Task(db_tools.AbstractBaseMixin, db.Base):
     #     except Empty:
     #         return super().to_json()
 
+
+Index('ix_task_project_mode_zippath', Task.project_id, Task.mode, Task.zippath)
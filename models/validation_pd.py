@@ -1,8 +1,11 @@
 import json
-from typing import BinaryIO, List, Optional
+from typing import BinaryIO, List, Optional, Union
 from ..models.tasks import Task
+from ..constants import RUN_BATCH_MAX_SIZE, TASK_PRIORITY_MIN, TASK_PRIORITY_MAX, TASK_PRIORITY_DEFAULT, \
+    UPLOAD_FILE_NAME_MAX_LENGTH
 
-from pydantic import BaseModel, validator
+from croniter import croniter
+from pydantic import BaseModel, validator, root_validator, conint, constr
 
 
 class TaskPutModelPD(BaseModel):
@@ -12,6 +15,7 @@ class TaskPutModelPD(BaseModel):
     runtime: str
     task_handler: str
     task_parameters: List[dict]
+    priority: Optional[conint(ge=TASK_PRIORITY_MIN, le=TASK_PRIORITY_MAX)] = None
 
     # @validator('task_package')
     # def validate_task_package(cls, value: str, values: dict):
@@ -27,6 +31,7 @@ class TaskCreateModelPD(TaskPutModelPD):
     cpu_cores: int
     memory: int
     timeout: int
+    priority: conint(ge=TASK_PRIORITY_MIN, le=TASK_PRIORITY_MAX) = TASK_PRIORITY_DEFAULT
 
     # class Config:
     #     fields = {
@@ -61,14 +66,17 @@ class TaskCreateModelPD(TaskPutModelPD):
         assert not query.first(), f'Task with name {value} already exists'
         return value
 
-    @validator('task_package')
-    def validate_task_package(cls, value: str, values: dict):
-        mode = values['mode']
-        assert not Task.query.filter(
-            Task.zippath == f'tasks/{value}',
-            Task.mode == mode,
-        ).first(), f'Task package {value} already exists'
-        return value
+    @root_validator(skip_on_failure=True)
+    def validate_task_package(cls, values: dict):
+        # package files are named per project, equal content is deduplicated by hash in storage
+        query = Task.query.filter(
+            Task.zippath == f'tasks/{values["task_package"]}',
+            Task.mode == values['mode'],
+        )
+        if values['mode'] == 'default':
+            query = query.filter(Task.project_id == values.get('project_id'))
+        assert not query.first(), f'Task package {values["task_package"]} already exists'
+        return values
 
     # @validator('task_parameters')
     # def validate_task_parameter_unique_name(cls, value: list):
@@ -84,7 +92,70 @@ class TaskCreateModelPD(TaskPutModelPD):
         return value
 
 
+class TaskRunBatchItemPD(BaseModel):
+    task_id: str
+    event: Union[List[dict], dict, None] = None
+    priority: Optional[conint(ge=TASK_PRIORITY_MIN, le=TASK_PRIORITY_MAX)] = None
+
+    @validator('event', always=True)
+    def normalize_event(cls, value: Union[List[dict], dict, None]):
+        if value is None:
+            return [{}]
+        if isinstance(value, dict):
+            return [value]
+        try:
+            # task parameters table rows
+            return [{row['name']: row['default'] for row in value}]
+        except (KeyError, TypeError):
+            return value
+
+
+class TaskRunBatchPD(BaseModel):
+    items: List[TaskRunBatchItemPD]
+    queue_name: Optional[str] = None
+
+    @validator('items')
+    def validate_batch_size(cls, value: list):
+        assert value, 'batch is empty'
+        assert len(value) <= RUN_BATCH_MAX_SIZE, f'batch size is limited to {RUN_BATCH_MAX_SIZE}'
+        return value
+
+
+class TaskScheduleModelPD(BaseModel):
+    task_id: str
+    name: str
+    cron: Optional[str] = None
+    interval: Optional[conint(ge=1)] = None
+    event: Union[List[dict], dict, None] = None
+    queue_name: Optional[str] = None
+    priority: Optional[conint(ge=TASK_PRIORITY_MIN, le=TASK_PRIORITY_MAX)] = None
+    active: bool = True
+    jitter: conint(ge=0) = 0
+    misfire_grace: conint(ge=0) = 60
+
+    @validator('cron')
+    def validate_cron(cls, value: Optional[str]):
+        if value:
+            assert croniter.is_valid(value), f'Invalid cron expression: {value}'
+        return value or None
+
+    @root_validator(skip_on_failure=True)
+    def check_cron_or_interval(cls, values: dict):
+        assert bool(values.get('cron')) != bool(values.get('interval')), 'Set either cron or interval'
+        return values
+
+
 # data = json.loads('{"task_name":"gdfsgdfg","task_package":"rabbit_queue_checker (6).zip","runtime":"Python 3.8","task_handler":"dfgdfg","engine_location":"default","cpu_cores":1,"memory":4,"timeout":500,"task_parameters":[]}')
 # data['mode'] = 'administration'
 # x = TaskCreateModelPD.parse_obj(data)
-# print(x.dict(by_alias=True))
\ No newline at end of file
+# print(x.dict(by_alias=True))
+
+class TaskRetentionPolicyPD(BaseModel):
+    results_days: Optional[conint(ge=1)] = None
+    logs_days: Optional[conint(ge=1)] = None
+
+
+class TaskPackageUploadPD(BaseModel):
+    file_name: constr(min_length=1, max_length=UPLOAD_FILE_NAME_MAX_LENGTH)
+    sha256: constr(regex=r'^[0-9a-fA-F]{64}$')
+    size: Optional[conint(ge=1)] = None
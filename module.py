@@ -17,8 +17,24 @@ from pylon.core.tools import log  # pylint: disable=E0611,E0401
 from pylon.core.tools import module  # pylint: disable=E0611,E0401
 import json
 
+from .constants import TASK_PRIORITY_MAX
 from .models.tasks import Task
 from .tools.TaskManager import TaskManager
+from .tools.arbiter_pool import arbiter_pool
+from .tools.secrets_cache import secrets_cache
+from .tools.secret_templates import task_templates
+from .tools.dispatch_queue import dispatch_queue
+from .tools.admission import admission
+from .tools.scheduler import scheduler
+from .tools.coalescer import run_coalescer
+from .tools.execution_counter import execution_counter
+from .tools.log_archiver import log_archiver
+from .tools.log_export import loki_exporter
+from .tools.status_broker import status_broker
+from .tools.task_stats import task_stats_normalizer
+from .tools.retention import retention_compactor
+from .tools.packages import package_catalog
+from .tools.package_uploads import package_uploads
 
 from tools import theme, constants as c, VaultClient, api_tools
 
@@ -78,6 +94,23 @@ class Module(module.ModuleModel):
 
         self.descriptor.register_tool('TaskManager', TaskManager)
 
+        arbiter_pool.configure(
+            factory=TaskManager.new_arbiter,
+            **self.descriptor.config.get('arbiter_pool', {})
+        )
+        secrets_cache.configure(**self.descriptor.config.get('secrets_cache', {}))
+        task_templates.configure(**self.descriptor.config.get('task_templates', {}))
+        execution_counter.configure(**self.descriptor.config.get('execution_counter', {}))
+        execution_counter.start()
+        run_coalescer.configure(**self.descriptor.config.get('coalescing', {}))
+        admission.configure(**self.descriptor.config.get('admission', {}))
+        dispatch_queue.configure(**self.descriptor.config.get('dispatch_queue', {}))
+        dispatch_queue.start(app=self.context.app)
+        status_broker.configure(**self.descriptor.config.get('status_events', {}))
+        loki_exporter.configure(**self.descriptor.config.get('log_export', {}))
+        log_archiver.configure(**self.descriptor.config.get('log_archiver', {}))
+        log_archiver.start(app=self.context.app)
+
         vault_client = VaultClient()
         secrets = vault_client.get_all_secrets()
 
@@ -89,6 +122,18 @@ class Module(module.ModuleModel):
             rqc = self.create_rabbit_queue_checker_task()
             secrets['rabbit_queue_checker_id'] = rqc.task_id
         vault_client.set_secrets(secrets)
+        secrets_cache.invalidate(mode='administration')
+
+        task_stats_normalizer.configure(**self.descriptor.config.get('task_stats', {}))
+        task_stats_normalizer.start(app=self.context.app)
+        retention_compactor.configure(**self.descriptor.config.get('retention', {}))
+        retention_compactor.start(app=self.context.app)
+        package_catalog.configure(**self.descriptor.config.get('packages', {}))
+        package_catalog.start(app=self.context.app)
+        package_uploads.configure(**self.descriptor.config.get('package_uploads', {}))
+
+        scheduler.configure(**self.descriptor.config.get('scheduler', {}))
+        scheduler.start(app=self.context.app)
 
     def create_control_tower_task(self) -> Task:
         cc_args = {
@@ -96,6 +141,7 @@ class Module(module.ModuleModel):
             "invoke_func": "lambda.handler",
             "runtime": "Python 3.8",
             "region": "default",
+            "priority": TASK_PRIORITY_MAX,
             "env_vars": json.dumps({
                 "token": "{{secret.auth_token}}",
                 "galloper_url": "{{secret.galloper_url}}",
@@ -116,6 +162,7 @@ class Module(module.ModuleModel):
             "invoke_func": "lambda.handler",
             "runtime": "Python 3.8",
             "region": "default",
+            "priority": TASK_PRIORITY_MAX,
             "env_vars": json.dumps({
                 "token": '{{secret.auth_token}}',
                 # "callback_url": ''.join([
@@ -153,3 +200,11 @@ class Module(module.ModuleModel):
     def deinit(self):  # pylint: disable=R0201
         """ De-init module """
         log.info("De-initializing module Tasks")
+        scheduler.stop()
+        dispatch_queue.stop()
+        log_archiver.stop()
+        task_stats_normalizer.stop()
+        retention_compactor.stop()
+        package_catalog.stop()
+        execution_counter.stop()
+        arbiter_pool.close()
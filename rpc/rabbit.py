@@ -2,19 +2,20 @@ from typing import Optional
 
 
 from pylon.core.tools import web, log
-from tools import VaultClient, api_tools
-
+from ..constants import TASK_PRIORITY_MAX
 from ..tools.TaskManager import TaskManager
+from ..tools.secrets_cache import secrets_cache
 
 
 class RPC:
     @web.rpc('check_rabbit_queues')
     def check_rabbit_queues(self, task_id: Optional[str] = None):
         if not task_id:
-            vault_client = VaultClient()
-            secrets = vault_client.get_all_secrets()
+            secrets = secrets_cache.get(mode='administration')
             task_id = secrets['rabbit_queue_checker_id']
         log.info('check_rabbit_queues rpc %s', task_id)
         event = dict()
         task_manager = TaskManager(mode='administration')
-        task_manager.run_task([event], task_id=task_id, queue_name="__internal")
+        task_manager.run_task(
+            [event], task_id=task_id, queue_name="__internal", priority=TASK_PRIORITY_MAX, coalesce=True
+        )
@@ -6,6 +6,17 @@ from tools import rpc_tools
 
 from ..models.tasks import Task
 from ..tools.TaskManager import TaskManager
+from ..tools.secrets_cache import secrets_cache
+from ..tools.dispatch_queue import dispatch_queue
+from ..tools.admission import admission
+from ..tools.scheduler import scheduler
+from ..tools.coalescer import run_coalescer
+from ..tools.execution_counter import execution_counter
+from ..tools.log_archiver import log_archiver
+from ..tools.status_broker import status_broker
+from ..tools.retention import retention_compactor
+from ..tools.packages import package_catalog
+from ..tools.package_uploads import package_uploads
 
 
 class RPC:
@@ -23,3 +34,63 @@ class RPC:
     @rpc_tools.wrap_exceptions(RuntimeError)
     def update_env(self, *, task_id: int, env_vars: str, rewrite: bool = True, **kwargs) -> bool:
         return TaskManager.update_task_env(task_id=task_id, env_vars=env_vars, rewrite=rewrite)
+
+    @web.rpc('tasks_invalidate_secrets_cache')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def invalidate_secrets_cache(self, project_id: Optional[int] = None, mode: Optional[str] = None) -> None:
+        secrets_cache.invalidate(project_id=project_id, mode=mode)
+
+    @web.rpc('tasks_secrets_cache_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def secrets_cache_stats(self) -> dict:
+        return dict(secrets_cache.stats)
+
+    @web.rpc('tasks_dispatch_queue_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def dispatch_queue_stats(self) -> dict:
+        return dispatch_queue.stats()
+
+    @web.rpc('tasks_admission_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def admission_stats(self) -> dict:
+        return dict(admission.stats)
+
+    @web.rpc('tasks_scheduler_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def scheduler_stats(self) -> dict:
+        return {'node_id': scheduler.node_id, 'is_leader': scheduler.is_leader, **scheduler.stats}
+
+    @web.rpc('tasks_coalescing_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def coalescing_stats(self) -> dict:
+        return dict(run_coalescer.stats)
+
+    @web.rpc('tasks_execution_counter_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def execution_counter_stats(self) -> dict:
+        return {'pending': execution_counter.pending, **execution_counter.stats}
+
+    @web.rpc('tasks_log_archiver_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def log_archiver_stats(self) -> dict:
+        return log_archiver.queue_stats()
+
+    @web.rpc('tasks_status_events_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def status_events_stats(self) -> dict:
+        return {'subscribers': status_broker.subscribers, **status_broker.stats}
+
+    @web.rpc('tasks_retention_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def retention_stats(self) -> dict:
+        return dict(retention_compactor.stats)
+
+    @web.rpc('tasks_packages_stats')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def packages_stats(self) -> dict:
+        return {**package_catalog.stats, 'uploads': dict(package_uploads.stats)}
+
+    @web.rpc('tasks_packages_reconcile')
+    @rpc_tools.wrap_exceptions(RuntimeError)
+    def packages_reconcile(self, project_id: Optional[int] = None, mode: str = 'default') -> None:
+        package_catalog.reconcile(mode, project_id)
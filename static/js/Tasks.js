@@ -24,7 +24,7 @@ const Tasks = {
             tags_mapper: [],
             isShowLastLogs: true,
             runningTasks: new Map(),
-            checkingTimeInterval: null,
+            statusSource: null,
             selectedResultId: null,
             websocket: null,
             isLoadingWebsocket: false,
@@ -58,10 +58,9 @@ const Tasks = {
             $('#tableLogs').empty();
             this.tags_mapper = [];
             this.isLoadingWebsocket = false;
-            if (this.checkingTimeInterval) {
-                this.stopCheckStatus();
-            }
+            this.stopCheckStatus();
             this.runningTasks.clear();
+            this.selectedResultId = null;
             if (this.websocket) {
                 this.closeWebsocket();
             }
@@ -135,44 +134,46 @@ const Tasks = {
             })
         },
         runTask() {
-            if (this.checkingTimeInterval) {
-                this.stopCheckStatus();
-            }
+            this.stopCheckStatus();
             if (this.websocket) this.closeWebsocket();
             this.checkTaskStatus(this.selectedTask.task_id, true);
         },
         checkTaskStatus(taskId, closeModal = false) {
-            if (this.checkingTimeInterval) this.stopCheckStatus();
-            ApiCheckStatus(this.selectedTask.task_id).then(data => {
-                if ($('#RunTaskModal').is(":visible") && closeModal) {
-                    $('#RunTaskModal').modal('hide');
-                    this.isLoadingRun = false;
+            this.stopCheckStatus();
+            if ($('#RunTaskModal').is(":visible") && closeModal) {
+                $('#RunTaskModal').modal('hide');
+                this.isLoadingRun = false;
+            }
+            // the server pushes the current status first and then every change of it
+            this.statusSource = ApiSubscribeStatus(taskId, data => this.handleTaskStatus(taskId, data));
+        },
+        handleTaskStatus(taskId, data) {
+            if (taskId !== this.selectedTask.task_id) return;
+            if (data.IN_PROGRESS) {
+                if (!this.websocket) {
+                    this.selectedResultId = data.task_result_ids.slice(-1)[0];
+                    this.fetchWebsocketURLByResultId(this.selectedResultId);
                 }
-                if (data.IN_PROGRESS) {
-                    this.checkingTimeInterval = setTimeout(() => this.checkTaskStatus(this.selectedTask.task_id), 5000)
-                    if (!this.websocket) {
-                        this.selectedResultId = data.task_result_ids.slice(-1);
-                        this.fetchWebsocketURLByResultId(this.selectedResultId);
-                    }
-                    this.runningTasks.set(taskId, data.task_result_ids);
-                } else {
-                    ApiLastResultId(taskId).then((data) => {
-                        if (data.websocket_url) {
-                            if (this.websocket) {
-                                this.closeWebsocket();
-                            }
-                            this.isLoadingWebsocket = true;
-                            this.init_websocket(data.websocket_url);
-                            this.stopCheckStatus();
-                            this.runningTasks.set(taskId, []);
+                this.runningTasks.set(taskId, data.task_result_ids);
+            } else {
+                ApiLastResultId(taskId).then((data) => {
+                    this.runningTasks.set(taskId, []);
+                    // the stream reconnects every few minutes, keep the log view of the same result
+                    if (this.websocket && data.task_result_id === this.selectedResultId) return;
+                    if (data.websocket_url) {
+                        if (this.websocket) {
+                            this.closeWebsocket();
                         }
-                    })
-                }
-            });
+                        this.selectedResultId = data.task_result_id;
+                        this.isLoadingWebsocket = true;
+                        this.init_websocket(data.websocket_url);
+                    }
+                })
+            }
         },
         stopCheckStatus() {
-            clearTimeout(this.checkingTimeInterval)
-            this.checkingTimeInterval = null;
+            if (this.statusSource) this.statusSource.close();
+            this.statusSource = null;
         },
         init_websocket(websocketURL) {
             this.websocket = new WebSocket(websocketURL)
@@ -37,6 +37,7 @@ const TasksCreateModal = {
                 cpu_quota: 1,
                 memory_quota: 4,
                 timeout_quota: 500,
+                priority: 0,
                 cloud_settings: {},
                 isLoading: false,
                 previewFile: null,
@@ -55,6 +56,7 @@ const TasksCreateModal = {
                  "cpu_cores": this.cpu_quota,
                  "memory": this.memory_quota,
                  "timeout": this.timeout_quota,
+                 "priority": this.priority,
                  "task_parameters": this.test_parameters.get()
             }
         },
@@ -183,6 +185,15 @@ const TasksCreateModal = {
                                             class="form-control"
                                             placeholder="Handler name (e.g. lambda.handler)">
                                     </div>
+                                    <p class="font-h5 font-bold">Priority</p>
+                                    <p class="font-h6 font-weight-400">Priority (0-9) recorded with the task and its runs</p>
+                                    <div class="custom-input mb-3 mt-2">
+                                        <input
+                                            type="number"
+                                            min="0" max="9"
+                                            v-model.number="priority"
+                                            class="form-control">
+                                    </div>
                                 </div>
                             </form>
                             <tasks-location
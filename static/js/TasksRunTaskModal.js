@@ -3,11 +3,13 @@ const TasksRunTaskModal = {
     data() {
         return {
             isLoading: false,
+            priority: null,
         }
     },
     mounted() {
         const vm = this;
         $("#RunTaskModal").on("show.bs.modal", function (e) {
+            vm.priority = null;
             vm.fetchParameters().then((data) => {
                 const taskParams = data.rows[0].task_parameters;
                 if (taskParams) {
@@ -44,7 +46,9 @@ const TasksRunTaskModal = {
             //         { name: "vhost", default: "carrier", type: "string", description: "", action: "" }
             //     ]
             const api_url = this.$root.build_api_url('tasks', 'run_task')
-            const resp = await fetch(`${api_url}/${getSelectedProjectId()}/${this.selectedTask.task_id}`,{
+            // coalesce protects from double clicks starting the same run twice
+            const query = this.priority !== null && this.priority !== '' ? `?coalesce=true&priority=${this.priority}` : '?coalesce=true'
+            const resp = await fetch(`${api_url}/${getSelectedProjectId()}/${this.selectedTask.task_id}${query}`,{
                 method: 'POST',
                 headers: {
                     "Content-Type": "application/json",
@@ -79,6 +83,16 @@ const TasksRunTaskModal = {
                     </div>
                     <div class="modal-body">
                         <div class="section">
+                            <p class="font-h5 font-bold">Priority</p>
+                            <p class="font-h6 font-weight-400">Override task priority (0-9) for this run</p>
+                            <div class="custom-input mb-3 mt-2" style="max-width: 200px">
+                                <input
+                                    type="number"
+                                    min="0" max="9"
+                                    :placeholder="selectedTask.priority ?? 0"
+                                    v-model="priority"
+                                    class="form-control">
+                            </div>
                             <slot></slot>
                         </div>
                     </div>
@@ -17,6 +17,8 @@ const TasksTable = {
             chartBarOptions,
             chartLineOptions,
             selectedResultId: null,
+            nextCursor: null,
+            isLoadingMore: false,
         }
     },
     mounted() {
@@ -69,13 +71,27 @@ const TasksTable = {
             ApiTasksResult(taskId)
                 .then(data => {
                     const taskData = Object.values(data.rows).flat().map(item => ({...item, task_name: this.selectedTask.task_name }));
+                    this.nextCursor = data.next_cursor;
                     $('#logs-table').bootstrapTable('load', taskData);
                 })
         },
+        loadMore() {
+            this.isLoadingMore = true;
+            ApiTasksResult(this.selectedTask.task_id, this.nextCursor)
+                .then(data => {
+                    const taskData = data.rows.map(item => ({...item, task_name: this.selectedTask.task_name }));
+                    this.nextCursor = data.next_cursor;
+                    $('#logs-table').bootstrapTable('append', taskData);
+                })
+                .finally(() => {
+                    this.isLoadingMore = false;
+                });
+        },
         generateContent(taskId) {
-            ApiTasksResult(taskId)
+            this.fetchTableData(taskId);
+            // run history is aggregated and downsampled by the server
+            ApiTasksAnalytics(taskId)
                 .then(data => {
-                    const taskData = Object.values(data.rows).flat().map(item => ({...item, task_name: this.selectedTask.task_name }));
                     const barDatasets = [{
                         data: [],
                         borderWidth: 1,
@@ -100,13 +116,11 @@ const TasksTable = {
                             yAxisID: 'memory',
                         }
                     ];
-                    $('#logs-table').bootstrapTable('load', taskData);
-                    taskData.forEach(result => {
-                        const ts = result.ts;
-                        this.labels.push(ts);
-                        const memory_usage = result.task_stats?.memory_usage ? Number(result.task_stats?.memory_usage.substring(0, result.task_stats?.memory_usage.length - 1)) : 0;
-                        const cpu_usage = result.task_stats?.cpu_usage ? result.task_stats?.cpu_usage : 0;
-                        const task_duration = result.task_duration ? result.task_duration / 1000 : 0;
+                    data.rows.forEach(bucket => {
+                        this.labels.push(new Date(bucket.ts * 1000).toLocaleString());
+                        const task_duration = bucket.duration.p95 ? bucket.duration.p95 / 1000 : 0;
+                        const cpu_usage = bucket.cpu_usage ? bucket.cpu_usage : 0;
+                        const memory_usage = bucket.memory_usage_bytes ? bucket.memory_usage_bytes / 1024 / 1024 : 0;
                         barDatasets[0].data.push(task_duration);
                         lineDatasets[0].data.push(cpu_usage);
                         lineDatasets[1].data.push(memory_usage);
@@ -249,6 +263,11 @@ const TasksTable = {
                         data-formatter="filesFormatter.actions"></th>
                 </template>
             </Table-Card>
+            <div class="d-flex justify-content-center mt-2 mr-3" v-if="nextCursor">
+                <button class="btn btn-secondary d-flex align-items-center" @click="loadMore">
+                    Load more<i v-if="isLoadingMore" class="preview-loader ml-2"></i>
+                </button>
+            </div>
         </div>
     `
 }
\ No newline at end of file
@@ -35,6 +35,7 @@ const TasksUpdateModal = {
             this.runtime = taskData.runtime;
             this.task_name = taskData.task_name;
             this.task_handler = taskData.task_handler;
+            this.priority = taskData.priority ?? 0;
             this.previewFile = taskData.zippath;
             const envVars = JSON.parse(taskData.env_vars);
             if (envVars.task_parameters) {
@@ -53,6 +54,7 @@ const TasksUpdateModal = {
                 task_name: null,
                 runtime: null,
                 task_handler: null,
+                priority: 0,
                 isLoading: false,
                 previewFile: '',
                 file: null,
@@ -65,6 +67,7 @@ const TasksUpdateModal = {
                 "task_handler": this.task_handler,
                 "runtime": this.runtime,
                 "task_package": this.previewFile,
+                "priority": this.priority,
                 "task_parameters": this.test_parameters.get()
             }
         },
@@ -192,6 +195,15 @@ const TasksUpdateModal = {
                                             class="form-control"
                                             placeholder="Handler name (e.g. lambda.handler)">
                                     </div>
+                                    <p class="font-h5 font-bold">Priority</p>
+                                    <p class="font-h6 font-weight-400">Priority (0-9) recorded with the task and its runs</p>
+                                    <div class="custom-input mb-3 mt-2">
+                                        <input
+                                            type="number"
+                                            min="0" max="9"
+                                            v-model.number="priority"
+                                            class="form-control">
+                                    </div>
                                 </div>
                             </form>
                             <slot></slot>
@@ -18,6 +18,12 @@ const ApiCheckStatus = async (taskId) => {
     })
     return res.json();
 }
+const ApiSubscribeStatus = (taskId, onStatus) => {
+    const api_url = V.build_api_url('tasks', 'task_events')
+    const source = new EventSource(`${api_url}/${getSelectedProjectId()}/${taskId}`)
+    source.addEventListener('status', event => onStatus(JSON.parse(event.data)))
+    return source
+}
 const ApiWebsocketURLByResultId = async (taskId, resultId) => {
     const api_url = V.build_api_url('tasks', 'loki_url')
     const res = await fetch (`${api_url}/${getSelectedProjectId()}/?task_id=${taskId}&task_result_id=${resultId}`,{
@@ -32,10 +38,19 @@ const ApiLastResultId = async (taskId) => {
     })
     return res.json();
 }
-const ApiTasksResult = async (taskId) => {
+const ApiTasksResult = async (taskId, cursor = null, limit = 100) => {
     const api_url = V.build_api_url('tasks', 'results')
-    const res = await fetch (`${api_url}/${getSelectedProjectId()}/${taskId}`,{
+    const params = new URLSearchParams({limit})
+    if (cursor) params.append('cursor', cursor)
+    const res = await fetch (`${api_url}/${getSelectedProjectId()}/${taskId}?${params}`,{
         method: 'GET',
     })
     return res.json();
-}
\ No newline at end of file
+}
+const ApiTasksAnalytics = async (taskId, points = 200) => {
+    const api_url = V.build_api_url('tasks', 'results_analytics')
+    const res = await fetch (`${api_url}/${getSelectedProjectId()}/${taskId}?points=${points}`,{
+        method: 'GET',
+    })
+    return res.json();
+}
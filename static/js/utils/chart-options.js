@@ -40,7 +40,7 @@ const chartBarOptions = {
                 display: false
             },
             title: {
-                text: 'duration, sec',
+                text: 'duration p95, sec',
                 display: true,
             }
         },
@@ -1,16 +1,30 @@
-from typing import Optional, Union, Callable
+from typing import Optional, Union, Callable, List, Tuple
 from uuid import uuid4
 from werkzeug.utils import secure_filename
 
 from arbiter import Arbiter
 import json
 
+from .admission import admission, AdmissionRejected
+from .arbiter_pool import arbiter_pool
+from .coalescer import run_coalescer
+from .execution_counter import execution_counter
+from .packages import package_catalog
+from .package_uploads import package_uploads
+from .secrets_cache import secrets_cache
+from .secret_templates import SecretTemplate, task_templates
+from ..constants import TASK_PRIORITY_DEFAULT
 from ..models.pd.task import TaskCreateModel
+from ..models.packages import TaskPackageUpload
 from ..models.tasks import Task
 from tools import constants as c, api_tools, rpc_tools, data_tools, MinioClient, VaultClient, MinioClientAdmin
 from pylon.core.tools import log
 
 
+GALLOPER_URL_TEMPLATE = SecretTemplate("{{secret.galloper_url}}", fallback=None)
+AUTH_TOKEN_TEMPLATE = SecretTemplate("{{secret.auth_token}}", fallback=None)
+
+
 class TaskManager:
     AVAILABLE_MODES = {'default', 'administration'}
 
@@ -22,12 +36,20 @@ class TaskManager:
         log.info('TaskManager init %s', [self.project_id, self.mode])
 
     @staticmethod
-    def get_arbiter():
+    def new_arbiter() -> Arbiter:
         return Arbiter(
             host=c.RABBIT_HOST, port=c.RABBIT_PORT,
             user=c.RABBIT_USER, password=c.RABBIT_PASSWORD
         )
 
+    @classmethod
+    def get_arbiter(cls, queue_name: str = c.RABBIT_QUEUE_NAME, pooled: bool = True):
+        if not pooled:
+            return cls.new_arbiter()
+        if arbiter_pool.factory is None:
+            arbiter_pool.factory = cls.new_arbiter
+        return arbiter_pool.acquire(queue_name)
+
     @property
     def upload_func(self) -> Callable:
         if self.mode == 'default':
@@ -39,66 +61,196 @@ class TaskManager:
                     file: Union[str, 'data_tools.files.File'],
                     task_args: dict,
                     file_name: Optional[str] = None,
+                    manifest: Optional[dict] = None,
                     **kwargs) -> Task:
 
         if isinstance(file, str):
             file = data_tools.files.File(file, file_name)
-        task_id = secure_filename(str(uuid4()))
+        task_model = self._task_model(task_args, file.filename)
+
+        package_catalog.upload(self.mode, self.project_id, file, self.upload_func, manifest)
+
+        return self._insert_task(task_model)
+
+    def create_task_from_upload(self, upload: TaskPackageUpload, task_args: dict) -> Task:
+        """ Creates a task from a completed chunked upload, its checksum is verified by then """
+        task_model = self._task_model(task_args, upload.file_name)
+
+        package_uploads.attach(self.mode, self.project_id, upload)
+        package_uploads.consume(upload)
+
+        return self._insert_task(task_model)
+
+    def _task_model(self, task_args: dict, file_name: str) -> TaskCreateModel:
         model_data = dict()
         model_data.update(task_args)
         model_data.update(dict(
             mode=self.mode,
             project_id=self.project_id,
-            zippath=f"tasks/{file.filename}",
-            task_id=task_id,
+            zippath=f"tasks/{file_name}",
+            task_id=secure_filename(str(uuid4())),
         ))
         log.info('model_data: %s', model_data)
-        task_model = TaskCreateModel.parse_obj(model_data)
-
-        self.upload_func(bucket="tasks", f=file, project=self.project_id)
+        return TaskCreateModel.parse_obj(model_data)
 
+    @staticmethod
+    def _insert_task(task_model: TaskCreateModel) -> Task:
         task = Task(**task_model.dict())
         task.insert()
         log.info('Task created: [id: %s, name: %s]', task.id, task.task_name)
         return task
 
-    def run_task(self, event: list, task_id: Optional[str] = None, queue_name: Optional[str] = None) -> dict:
-        log.info('YASK run event: %s, task_id: %s, queue_name: %s', event, task_id, queue_name)
-        if not queue_name:
-            queue_name = c.RABBIT_QUEUE_NAME
-        if self.mode == 'default':
-            vault_client = VaultClient.from_project(self.project_id)
-        else:
-            vault_client = VaultClient()
-        secrets = vault_client.get_all_secrets()
-
-        task_id = task_id if task_id else secrets["control_tower_id"]
-        task = Task.query.filter(Task.task_id == task_id).first()
-        task_json = task.to_json()
+    def _build_task_kwargs(self, vault_client: VaultClient, secrets: dict,
+                           task_id: str, event: list) -> dict:
+        template = task_templates.get(
+            task_id,
+            loader=lambda: self._load_task_json(task_id),
+            fallback=vault_client.unsecret,
+            exists=lambda: self._task_exists(task_id)
+        )
+        if template is None:
+            raise LookupError(f'No such task: {task_id}')
+        task_json = template.render(secrets)
         if self.mode == 'default':
             # need to remove that "if" if we want to always
             # set project_id from task manager and not from task
             task_json['project_id'] = self.project_id
         # TODO: we need to calculate it based on VUH, if we haven't used VUH quota then run
         # check_task_quota(task)
-        arbiter = self.get_arbiter()
-        task_kwargs = {
-            "task": vault_client.unsecret(value=task_json, secrets=secrets),
-            "event": vault_client.unsecret(value=event, secrets=secrets),
-            "galloper_url": vault_client.unsecret(value="{{secret.galloper_url}}", secrets=secrets),
-            "token": vault_client.unsecret(value="{{secret.auth_token}}", secrets=secrets),
+        return {
+            "task": task_json,
+            "event": SecretTemplate(event, vault_client.unsecret).render(secrets),
+            "galloper_url": GALLOPER_URL_TEMPLATE.render(secrets),
+            "token": AUTH_TOKEN_TEMPLATE.render(secrets),
             "mode": self.mode,
             "token_type": 'Bearer',
             "api_version": 1
         }
-        log.info('YASK KWARGS %s', task_kwargs)
-        arbiter.apply("execute_lambda", queue=queue_name, task_kwargs=task_kwargs)
-        arbiter.close()
 
+    @staticmethod
+    def _task_key(applied) -> Optional[str]:
+        if isinstance(applied, (list, tuple)):
+            return applied[0] if applied else None
+        return applied
+
+    def _add_task_executions(self, count: int = 1) -> None:
         if self.mode == 'default':
-            rpc_tools.RpcMixin().rpc.call.projects_add_task_execution(project_id=self.project_id)
+            execution_counter.add(self.project_id, count)
 
-        return {"message": "Accepted", "code": 200, "task_id": task_id}
+    @staticmethod
+    def _resolve_priority(task_kwargs: dict, priority: Optional[int] = None) -> int:
+        if priority is not None:
+            return priority
+        return task_kwargs['task'].get('priority') or TASK_PRIORITY_DEFAULT
+
+    def run_task(self, event: list, task_id: Optional[str] = None, queue_name: Optional[str] = None,
+                 priority: Optional[int] = None, coalesce: Optional[bool] = None) -> dict:
+        log.info('YASK run event: %s, task_id: %s, queue_name: %s, priority: %s', event, task_id, queue_name, priority)
+        if not queue_name:
+            queue_name = c.RABBIT_QUEUE_NAME
+        vault_client = secrets_cache.get_vault_client(self.project_id, self.mode)
+        secrets = secrets_cache.get(self.project_id, self.mode)
+
+        task_id = task_id if task_id else secrets["control_tower_id"]
+        if run_coalescer.enabled if coalesce is None else coalesce:
+            key = run_coalescer.make_key(self.project_id, self.mode, task_id, queue_name, priority, event)
+            return run_coalescer.run(
+                key, task_id,
+                lambda: self._run_task(vault_client, secrets, event, task_id, queue_name, priority)
+            )
+        return self._run_task(vault_client, secrets, event, task_id, queue_name, priority)
+
+    def _run_task(self, vault_client: VaultClient, secrets: dict, event: list, task_id: str,
+                  queue_name: str, priority: Optional[int]) -> dict:
+        task_kwargs = self._build_task_kwargs(vault_client, secrets, task_id, event)
+        log.info('YASK KWARGS %s', task_kwargs)
+        priority = self._resolve_priority(task_kwargs, priority)
+        admission.admit(self.project_id, self.mode, task_id, queue_name)
+        try:
+            arbiter = self.get_arbiter(queue_name)
+        except Exception:
+            admission.release(self.project_id, self.mode, task_id, queue_name)
+            raise
+        try:
+            applied = arbiter.apply("execute_lambda", queue=queue_name, task_kwargs=task_kwargs, priority=priority)
+        except Exception:
+            admission.release(self.project_id, self.mode, task_id, queue_name)
+            raise
+        finally:
+            arbiter.close()
+
+        self._add_task_executions()
+
+        return {
+            "message": "Accepted", "code": 200,
+            "task_id": task_id, "task_key": self._task_key(applied), "priority": priority
+        }
+
+    def run_tasks(self, batch: List[tuple], queue_name: Optional[str] = None) -> List[dict]:
+        """ Runs N (task_id, event[, priority]) items sharing one secrets read and one publisher """
+        log.info('run_tasks batch of %s, queue_name: %s', len(batch), queue_name)
+        if not queue_name:
+            queue_name = c.RABBIT_QUEUE_NAME
+        vault_client = secrets_cache.get_vault_client(self.project_id, self.mode)
+        secrets = secrets_cache.get(self.project_id, self.mode)
+
+        results = []
+        publisher = None
+        try:
+            for task_id, event, *rest in batch:
+                task_id = task_id if task_id else secrets["control_tower_id"]
+                try:
+                    task_kwargs = self._build_task_kwargs(vault_client, secrets, task_id, event)
+                except LookupError as e:
+                    results.append({"message": str(e), "code": 404, "task_id": task_id})
+                    continue
+                priority = self._resolve_priority(task_kwargs, rest[0] if rest else None)
+                try:
+                    admission.admit(self.project_id, self.mode, task_id, queue_name)
+                except AdmissionRejected as e:
+                    results.append({
+                        "message": str(e), "code": 429,
+                        "task_id": task_id, "retry_after": e.retry_after
+                    })
+                    continue
+                try:
+                    if publisher is None:
+                        publisher = self.get_arbiter(queue_name)
+                    applied = publisher.apply(
+                        "execute_lambda", queue=queue_name, task_kwargs=task_kwargs, priority=priority
+                    )
+                except Exception as e:
+                    log.exception('run_tasks failed to publish task %s', task_id)
+                    admission.release(self.project_id, self.mode, task_id, queue_name)
+                    results.append({"message": str(e), "code": 500, "task_id": task_id})
+                    continue
+                results.append({
+                    "message": "Accepted", "code": 200,
+                    "task_id": task_id, "task_key": self._task_key(applied), "priority": priority
+                })
+        finally:
+            if publisher is not None:
+                publisher.close()
+
+        self._add_task_executions(sum(1 for i in results if i['code'] == 200))
+        return results
+
+    @staticmethod
+    def _task_exists(task_id: str) -> bool:
+        return Task.query.with_entities(Task.id).filter(Task.task_id == task_id).first() is not None
+
+    @staticmethod
+    def _load_task_json(task_id: str) -> Optional[dict]:
+        task = Task.query.filter(Task.task_id == task_id).first()
+        if task:
+            package = package_catalog.package_of(package_catalog.packages([task]), task)
+            file_hash = package.content_hash if package else None
+            # workers may cache unpacked packages by hash
+            return {
+                **task.to_json(),
+                "package_hash": file_hash,
+                "package_path": package_catalog.store_path(file_hash),
+            }
 
     @property
     def query(self):
@@ -125,4 +277,5 @@ class TaskManager:
             task_vars.update(**json.loads(env_vars))
             Task.query.filter(Task.task_id == task_id).update({Task.env_vars: task_vars})
         Task.commit()
+        task_templates.invalidate(task_id)
         return True
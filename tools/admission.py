@@ -0,0 +1,186 @@
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Optional, Dict, Tuple
+
+from ..constants import TASK_STATUS
+from ..models.results import TaskResults
+from ..models.tasks import Task
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def refund(self, tokens: float = 1) -> None:
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + tokens)
+
+    @property
+    def retry_after(self) -> float:
+        return round(max(0.0, 1 - self.tokens) / self.rate, 2) if self.rate else 1
+
+
+class AdmissionController:
+    """ Token bucket rate and max-in-flight limits per project, task and queue name
+
+    Limits are dicts of {rate, burst, max_in_flight}; zero or missing means unlimited.
+    max_in_flight applies to project and task scopes only, as results do not record the queue.
+    In-flight counts come from TaskResults in progress, refreshed at most every in_flight_ttl seconds.
+    Results older than their task timeout (or in_flight_max_age without one) are considered stuck
+    and not counted.
+    """
+    SCOPES = ('project', 'task', 'queue')
+
+    def __init__(self):
+        self.limits: Dict[str, dict] = {scope: {} for scope in self.SCOPES}
+        self.overrides: Dict[str, Dict[str, dict]] = {scope: {} for scope in self.SCOPES}
+        self.in_flight_ttl = 5
+        self.in_flight_max_age = 3600
+        self._lock = Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = dict()
+        self._in_flight: Dict[str, Counter] = {'project': Counter(), 'task': Counter()}
+        self._in_flight_updated = 0.0
+        self.stats = {'admitted': 0, 'rejected': 0}
+
+    def configure(self, in_flight_ttl: Optional[float] = None, in_flight_max_age: Optional[float] = None,
+                  overrides: Optional[dict] = None, **limits) -> None:
+        if in_flight_ttl is not None:
+            self.in_flight_ttl = in_flight_ttl
+        if in_flight_max_age is not None:
+            self.in_flight_max_age = in_flight_max_age
+        for scope in self.SCOPES:
+            if scope in limits:
+                self.limits[scope] = limits[scope] or {}
+            self.overrides[scope] = {str(k): v for k, v in ((overrides or {}).get(scope) or {}).items()}
+        with self._lock:
+            self._buckets.clear()
+
+    def _limit(self, scope: str, key: str) -> dict:
+        return self.overrides[scope].get(key, self.limits[scope])
+
+    def _bucket(self, scope: str, key: str) -> Optional[TokenBucket]:
+        limit = self._limit(scope, key)
+        if not limit.get('rate'):
+            return None
+        with self._lock:
+            bucket = self._buckets.get((scope, key))
+            if bucket is None:
+                bucket = TokenBucket(limit['rate'], limit.get('burst') or limit['rate'])
+                self._buckets[(scope, key)] = bucket
+            return bucket
+
+    def _refresh_in_flight(self) -> None:
+        if time.monotonic() - self._in_flight_updated < self.in_flight_ttl:
+            return
+        now = datetime.utcnow()
+        rows = TaskResults.query.with_entities(
+            TaskResults.project_id, TaskResults.mode, TaskResults.task_id, TaskResults.created_at
+        ).filter(
+            TaskResults.task_status == TASK_STATUS.IN_PROGRESS,
+            TaskResults.created_at >= now - timedelta(seconds=self.in_flight_max_age)
+        ).all()
+        timeouts = self._timeouts({task_id for _, _, task_id, _ in rows})
+        projects, tasks = Counter(), Counter()
+        for project_id, mode, task_id, created_at in rows:
+            timeout = timeouts.get(task_id) or self.in_flight_max_age
+            if created_at < now - timedelta(seconds=timeout):
+                continue
+            projects[self.project_key(project_id, mode)] += 1
+            tasks[str(task_id)] += 1
+        self._in_flight = {'project': projects, 'task': tasks}
+        self._in_flight_updated = time.monotonic()
+
+    @staticmethod
+    def _timeouts(task_ids: set) -> Dict[str, int]:
+        """ Task timeouts in seconds, as stored in task env_vars """
+        if not task_ids:
+            return {}
+        timeouts = dict()
+        for task_id, env_vars in Task.query.with_entities(Task.task_id, Task.env_vars).filter(
+                Task.task_id.in_(task_ids)
+        ).all():
+            try:
+                timeouts[task_id] = int(json.loads(env_vars or '{}').get('timeout') or 0)
+            except (TypeError, ValueError, AttributeError):
+                continue
+        return timeouts
+
+    @staticmethod
+    def project_key(project_id: Optional[int], mode: str) -> str:
+        return str(project_id) if mode == 'default' else mode
+
+    def admit(self, project_id: Optional[int], mode: str, task_id: str, queue_name: str) -> None:
+        keys = {
+            'project': self.project_key(project_id, mode),
+            'task': str(task_id),
+            'queue': str(queue_name),
+        }
+        if any(self._limit(scope, keys[scope]).get('max_in_flight') for scope in ('project', 'task')):
+            self._refresh_in_flight()
+            for scope in ('project', 'task'):
+                max_in_flight = self._limit(scope, keys[scope]).get('max_in_flight')
+                if max_in_flight and self._in_flight[scope][keys[scope]] >= max_in_flight:
+                    self.stats['rejected'] += 1
+                    raise AdmissionRejected(
+                        f'Too many runs in progress for {scope} {keys[scope]} (max {max_in_flight})',
+                        retry_after=self.in_flight_ttl
+                    )
+
+        acquired = []
+        for scope, key in keys.items():
+            bucket = self._bucket(scope, key)
+            if bucket is None:
+                continue
+            if not bucket.try_acquire():
+                for i in acquired:
+                    i.refund()
+                self.stats['rejected'] += 1
+                raise AdmissionRejected(f'Rate limit exceeded for {scope} {key}', retry_after=bucket.retry_after)
+            acquired.append(bucket)
+        for scope in ('project', 'task'):
+            self._in_flight[scope][keys[scope]] += 1
+        self.stats['admitted'] += 1
+
+    def release(self, project_id: Optional[int], mode: str, task_id: str, queue_name: str) -> None:
+        """ Gives back what admit took for a run that was never published """
+        keys = {
+            'project': self.project_key(project_id, mode),
+            'task': str(task_id),
+            'queue': str(queue_name),
+        }
+        for scope, key in keys.items():
+            bucket = self._bucket(scope, key)
+            if bucket is not None:
+                bucket.refund()
+        for scope in ('project', 'task'):
+            if self._in_flight[scope][keys[scope]] > 0:
+                self._in_flight[scope][keys[scope]] -= 1
+        self.stats['admitted'] -= 1
+
+
+admission = AdmissionController()
@@ -0,0 +1,187 @@
+import inspect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from threading import Lock
+from typing import Callable, Optional, Dict
+
+from arbiter import Arbiter
+from pylon.core.tools import log
+
+try:
+    # pika raises these on a closed connection or channel before anything is sent
+    from pika.exceptions import ConnectionWrongStateError, ChannelWrongStateError
+    NOT_PUBLISHED_ERRORS = (ConnectionWrongStateError, ChannelWrongStateError)
+except ImportError:
+    NOT_PUBLISHED_ERRORS = ()
+
+
+class PooledPublisher:
+    """ Arbiter wrapper that returns itself to the pool on close() instead of disconnecting """
+
+    def __init__(self, pool: 'ArbiterPool', queue_name: str):
+        self.pool = pool
+        self.queue_name = queue_name
+        self.arbiter: Optional[Arbiter] = None
+        self.created_at = 0.0
+        self.last_used = 0.0
+        self.broken = False
+        self.accepts_priority = False
+
+    def connect(self) -> None:
+        self.disconnect()
+        self.arbiter = self.pool.factory()
+        self.created_at = self.last_used = time.monotonic()
+        self.broken = False
+        self.accepts_priority = self._accepts('priority')
+
+    def disconnect(self) -> None:
+        if self.arbiter is not None:
+            try:
+                self.arbiter.close()
+            except Exception as e:
+                log.warning('ArbiterPool failed to close arbiter for %s: %s', self.queue_name, e)
+        self.arbiter = None
+
+    @property
+    def is_healthy(self) -> bool:
+        if self.broken or self.arbiter is None:
+            return False
+        now = time.monotonic()
+        if self.pool.max_lifetime and now - self.created_at > self.pool.max_lifetime:
+            return False
+        if self.pool.max_idle and now - self.last_used > self.pool.max_idle:
+            return False
+        handler = getattr(self.arbiter, 'handler', None)
+        if handler is not None and hasattr(handler, 'is_alive'):
+            return handler.is_alive()
+        return True
+
+    def _accepts(self, kwarg: str) -> bool:
+        try:
+            parameters = inspect.signature(self.arbiter.apply).parameters
+        except (TypeError, ValueError):
+            return False
+        return kwarg in parameters
+
+    def apply(self, *args, priority: Optional[int] = None, **kwargs):
+        """ Publishes through the arbiter, passing priority only to arbiter versions that take it
+
+        The carrier arbiter publishes without AMQP priority and the task queues are declared by
+        the workers without x-max-priority, so for now priority is only recorded, not enforced.
+        Only failures that happen before the message is sent (connecting, a closed connection or
+        channel) are retried, anything else may have been published and retrying could run the
+        task twice.
+        """
+        for attempt in range(self.pool.retries + 1):
+            try:
+                if not self.is_healthy:
+                    self.connect()
+            except Exception as e:
+                self._failed(attempt, e)
+                continue
+            if priority is not None:
+                if self.accepts_priority:
+                    kwargs['priority'] = priority
+                elif not self.pool.priority_warned:
+                    self.pool.priority_warned = True
+                    log.warning('Arbiter cannot publish message priority, runs are delivered in FIFO order')
+            try:
+                result = self.arbiter.apply(*args, **kwargs)
+            except NOT_PUBLISHED_ERRORS as e:
+                self._failed(attempt, e)
+                continue
+            except Exception:
+                self.broken = True
+                raise
+            self.last_used = time.monotonic()
+            return result
+
+    def _failed(self, attempt: int, error: Exception) -> None:
+        self.broken = True
+        log.warning('ArbiterPool publish to %s failed (attempt %s): %s', self.queue_name, attempt + 1, error)
+        if attempt >= self.pool.retries:
+            raise error
+
+    def close(self) -> None:
+        self.pool.release(self)
+
+    def __getattr__(self, item):
+        if self.arbiter is None:
+            self.connect()
+        return getattr(self.arbiter, item)
+
+
+class ArbiterPool:
+    """ Process-wide pool of long-lived arbiters, one LIFO stack per queue name """
+
+    def __init__(self, factory: Optional[Callable[[], Arbiter]] = None,
+                 max_size: int = 4, max_idle: int = 300, max_lifetime: int = 3600,
+                 retries: int = 1):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.retries = retries
+        self._lock = Lock()
+        self._pools: Dict[str, LifoQueue] = defaultdict(lambda: LifoQueue(maxsize=self.max_size))
+        self.priority_warned = False
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def acquire(self, queue_name: str) -> PooledPublisher:
+        with self._lock:
+            pool = self._pools[queue_name]
+        while True:
+            try:
+                publisher = pool.get_nowait()
+            except Empty:
+                break
+            if publisher.is_healthy:
+                self.stats['reused'] += 1
+                return publisher
+            self.stats['discarded'] += 1
+            publisher.disconnect()
+        publisher = PooledPublisher(self, queue_name)
+        publisher.connect()
+        self.stats['created'] += 1
+        return publisher
+
+    def release(self, publisher: PooledPublisher) -> None:
+        if not publisher.is_healthy:
+            self.stats['discarded'] += 1
+            publisher.disconnect()
+            return
+        with self._lock:
+            pool = self._pools[publisher.queue_name]
+        try:
+            pool.put_nowait(publisher)
+        except Full:
+            publisher.disconnect()
+
+    @contextmanager
+    def publisher(self, queue_name: str):
+        publisher = self.acquire(queue_name)
+        try:
+            yield publisher
+        finally:
+            publisher.close()
+
+    def close(self) -> None:
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().disconnect()
+                except Empty:
+                    break
+
+
+arbiter_pool = ArbiterPool()
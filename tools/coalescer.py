@@ -0,0 +1,186 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from threading import Lock, Event
+from typing import Callable, Optional, Dict, Tuple
+
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+
+from pylon.core.tools import log
+from tools import db
+
+from ..models.coalescing import TaskRunClaim
+
+CLAIMS = TaskRunClaim.__table__
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.result: Optional[dict] = None
+        self.error: Optional[Exception] = None
+        self.expires_at = float('inf')
+
+
+class RunCoalescer:
+    """ Single-flight for identical run requests: duplicates within the window attach to the first run
+
+    Concurrent duplicates on this node wait for the first one; with shared=True a claim row in
+    task_run_claim extends this to other nodes, duplicates there poll the claim until the first
+    run stored its task_key. Expired claims are deleted at most every cleanup_interval seconds.
+    """
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, enabled: bool = False, window: float = 5, shared: bool = False, wait_timeout: float = 30,
+                 cleanup_interval: float = 60):
+        self.enabled = enabled
+        self.window = window
+        self.shared = shared
+        self.wait_timeout = wait_timeout
+        self.cleanup_interval = cleanup_interval
+        self._cleaned_at = 0.0
+        self._lock = Lock()
+        self._flights: Dict[str, _Flight] = dict()
+        self.stats = {'dispatched': 0, 'coalesced': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    @staticmethod
+    def make_key(project_id: Optional[int], mode: str, task_id: str, queue_name: str,
+                 priority: Optional[int], event) -> str:
+        event_hash = hashlib.sha256(json.dumps(event, sort_keys=True, default=str).encode()).hexdigest()
+        raw = f'{mode}:{project_id}:{task_id}:{queue_name}:{priority}:{event_hash}'
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, v in self._flights.items() if v.done.is_set() and v.expires_at <= now]:
+            del self._flights[key]
+
+    def run(self, key: str, task_id: str, func: Callable[[], dict]) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.expires_at <= now:
+                flight = None
+            is_leader = flight is None
+            if is_leader:
+                self._prune(now)
+                flight = self._flights[key] = _Flight()
+
+        if not is_leader:
+            flight.done.wait(self.wait_timeout)
+            if flight.error is not None:
+                raise flight.error
+            if flight.result is None:
+                raise TimeoutError(f'Coalesced run of task {task_id} did not finish in time')
+            self.stats['coalesced'] += 1
+            return {**flight.result, "coalesced": True}
+
+        lease = None
+        try:
+            claimed = None
+            while self.shared:
+                lease, claimed = self._claim(key, task_id)
+                if claimed is not None:
+                    break
+                lease = self._renew(key, lease)
+                if lease is not None:
+                    break
+            if claimed is not None:
+                flight.result = claimed
+                self.stats['coalesced'] += 1
+            else:
+                flight.result = func()
+                self.stats['dispatched'] += 1
+                if self.shared:
+                    # empty, not null, once dispatched so waiting nodes stop polling
+                    self._store(key, lease, flight.result.get('task_key') or '')
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._flights.pop(key, None)
+            if self.shared:
+                self._release(key, lease)
+            raise
+        finally:
+            flight.expires_at = time.monotonic() + self.window
+            flight.done.set()
+
+    def _cleanup(self, connection, now: datetime) -> None:
+        if time.monotonic() - self._cleaned_at < self.cleanup_interval:
+            return
+        self._cleaned_at = time.monotonic()
+        connection.execute(CLAIMS.delete().where(CLAIMS.c.expires_at < now))
+
+    def _claim(self, key: str, task_id: str) -> Tuple[Optional[datetime], Optional[dict]]:
+        """ Returns (lease, None) when this node owns the run, otherwise (None, response of the run it coalesces into)
+
+        Claims use their own connections so the caller's session is never committed. The lease
+        covers dispatching (wait_timeout, waiting nodes give up by then anyway), its expires_at
+        identifies the owner when the task_key is stored.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = datetime.utcnow()
+            lease = now + timedelta(seconds=max(self.window, self.wait_timeout))
+            try:
+                with db.engine.begin() as connection:
+                    self._cleanup(connection, now)
+                    connection.execute(CLAIMS.delete().where(and_(CLAIMS.c.key == key, CLAIMS.c.expires_at < now)))
+                    connection.execute(CLAIMS.insert().values(key=key, task_id=task_id, expires_at=lease))
+                return lease, None
+            except IntegrityError:
+                pass
+            while True:
+                with db.engine.connect() as connection:
+                    claim = connection.execute(CLAIMS.select().where(CLAIMS.c.key == key)).first()
+                if claim is None or (claim.task_key is None and claim.expires_at < datetime.utcnow()):
+                    # the run owning it failed or its node is gone, claim it again
+                    break
+                if claim.task_key is not None:
+                    return None, {
+                        "message": "Accepted", "code": 200,
+                        "task_id": claim.task_id, "task_key": claim.task_key or None, "coalesced": True
+                    }
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'Coalesced run of task {task_id} did not finish in time')
+                time.sleep(self.POLL_INTERVAL)
+
+    @staticmethod
+    def _owned(key: str, lease: datetime):
+        return and_(CLAIMS.c.key == key, CLAIMS.c.expires_at == lease, CLAIMS.c.task_key.is_(None))
+
+    def _renew(self, key: str, lease: datetime) -> Optional[datetime]:
+        """ Extends the lease right before dispatching, None if another node took the claim over """
+        renewed = datetime.utcnow() + timedelta(seconds=max(self.window, self.wait_timeout))
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                CLAIMS.update().where(self._owned(key, lease)).values(expires_at=renewed)
+            ).rowcount
+        return renewed if updated else None
+
+    def _release(self, key: str, lease: Optional[datetime]) -> None:
+        if lease is None:
+            return
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(CLAIMS.delete().where(self._owned(key, lease)))
+        except Exception as e:
+            log.warning('Failed to release run claim %s: %s', key, e)
+
+    def _store(self, key: str, lease: datetime, task_key: Optional[str]) -> None:
+        # the coalescing window starts once the run is dispatched
+        with db.engine.begin() as connection:
+            updated = connection.execute(CLAIMS.update().where(self._owned(key, lease)).values(
+                task_key=task_key, expires_at=datetime.utcnow() + timedelta(seconds=self.window)
+            )).rowcount
+        if not updated:
+            log.warning('Run claim %s was taken over while dispatching', key)
+
+run_coalescer = RunCoalescer()
@@ -0,0 +1,161 @@
+import time
+from collections import OrderedDict, deque
+from queue import Queue, Full, Empty
+from threading import Thread, Lock, Event
+from typing import Callable, Optional
+from uuid import uuid4
+
+from pylon.core.tools import log
+from tools import db
+
+
+class DispatchQueueFull(Exception):
+    pass
+
+
+class DispatchQueue:
+    """ Bounded in-process queue of run dispatches served by a pool of worker threads
+
+    Every dispatch belongs to a (mode, project_id) scope and is only visible from it.
+    """
+
+    def __init__(self, max_size: int = 1000, workers: int = 4, retry_after: int = 5,
+                 history_size: int = 10000, latency_window: int = 1000):
+        self.max_size = max_size
+        self.workers = workers
+        self.retry_after = retry_after
+        self.history_size = history_size
+        self.latency_window = latency_window
+        self._queue: Optional[Queue] = None
+        self._threads = []
+        self._stop = Event()
+        self._lock = Lock()
+        self._dispatches: 'OrderedDict[str, dict]' = OrderedDict()
+        self._latencies = deque(maxlen=latency_window)
+        self._in_flight = 0
+        self.counters = {'submitted': 0, 'rejected': 0, 'done': 0, 'failed': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+        self._latencies = deque(self._latencies, maxlen=self.latency_window)
+
+    @property
+    def is_running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self, app=None) -> None:
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._queue = Queue(maxsize=self.max_size)
+        self._threads = [
+            Thread(target=self._work, args=(app,), name=f'tasks-dispatch-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        log.info('Dispatch queue started with %s workers, max size %s', self.workers, self.max_size)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        if self._queue is not None and not self._queue.empty():
+            log.warning('Dispatch queue stopped with %s undispatched runs', self._queue.qsize())
+
+    def submit(self, scope: tuple, func: Callable, *args, **kwargs) -> str:
+        if self._queue is None:
+            raise RuntimeError('Dispatch queue is not started')
+        dispatch_id = str(uuid4())
+        mode, project_id = scope
+        record = {
+            'dispatch_id': dispatch_id,
+            'mode': mode,
+            'project_id': project_id,
+            'status': 'queued',
+            'queued_at': time.time(),
+            'result': None,
+            'error': None,
+        }
+        with self._lock:
+            self._dispatches[dispatch_id] = record
+            while len(self._dispatches) > self.history_size:
+                self._dispatches.popitem(last=False)
+        try:
+            self._queue.put_nowait((dispatch_id, time.monotonic(), func, args, kwargs))
+        except Full:
+            with self._lock:
+                self._dispatches.pop(dispatch_id, None)
+            self.counters['rejected'] += 1
+            raise DispatchQueueFull(f'Dispatch queue is full ({self.max_size})')
+        self.counters['submitted'] += 1
+        return dispatch_id
+
+    def get(self, dispatch_id: str, scope: tuple) -> Optional[dict]:
+        mode, project_id = scope
+        with self._lock:
+            record = self._dispatches.get(dispatch_id)
+            if not record or record['mode'] != mode or record['project_id'] != project_id:
+                return None
+            return dict(record)
+
+    def _work(self, app) -> None:
+        # on stop keep serving until the queue is drained
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                dispatch_id, enqueued, func, args, kwargs = self._queue.get(timeout=1)
+            except Empty:
+                continue
+            with self._lock:
+                self._in_flight += 1
+                record = self._dispatches.get(dispatch_id, {})
+                record['status'] = 'running'
+            try:
+                if app is not None:
+                    with app.app_context():
+                        try:
+                            result = func(*args, **kwargs)
+                        finally:
+                            # worker threads outlive requests, do not keep their sessions around
+                            db.session.remove()
+                else:
+                    result = func(*args, **kwargs)
+                record.update(status='done', result=result)
+                self.counters['done'] += 1
+            except Exception as e:
+                log.exception('Dispatch %s failed', dispatch_id)
+                record.update(status='failed', error=str(e))
+                self.counters['failed'] += 1
+            finally:
+                latency = time.monotonic() - enqueued
+                record['latency'] = round(latency, 4)
+                with self._lock:
+                    self._in_flight -= 1
+                    self._latencies.append(latency)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            in_flight = self._in_flight
+        stats = {
+            'depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_size': self.max_size,
+            'workers': len(self._threads),
+            'in_flight': in_flight,
+            **self.counters,
+        }
+        if latencies:
+            stats['latency'] = {
+                'p50': round(latencies[len(latencies) // 2], 4),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4),
+                'max': round(latencies[-1], 4),
+            }
+        return stats
+
+
+dispatch_queue = DispatchQueue()
@@ -0,0 +1,137 @@
+import time
+from collections import Counter
+from queue import Empty
+from threading import Thread, Lock, Event
+from typing import Optional
+
+from pylon.core.tools import log
+from tools import rpc_tools
+
+
+class ExecutionCounter:
+    """ Aggregates per-project task executions and flushes them to the projects plugin in bulk
+
+    Flushes every flush_interval seconds or once max_pending executions are buffered.
+    bulk_rpc, when set, receives {project_id: count} in one call per flush. The projects plugin
+    has no such rpc yet, so by default every execution is still sent through its own
+    projects_add_task_execution call: the only gain then is that sending happens off the
+    request path, the number of rpcs stays the same. Counts of failed calls are kept and retried with backoff, up to
+    max_backoff seconds apart. A timed out call may still have been applied, its counts are
+    dropped rather than sent twice.
+    """
+    AMBIGUOUS_ERRORS = (TimeoutError, Empty)
+
+    def __init__(self, flush_interval: float = 10, max_pending: int = 500,
+                 bulk_rpc: Optional[str] = None, max_backoff: float = 300):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.bulk_rpc = bulk_rpc
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._retry_at = 0.0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._pending = Counter()
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        self._wakeup = Event()
+        self.stats = {'added': 0, 'flushed': 0, 'flushes': 0, 'errors': 0, 'dropped': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    @property
+    def pending(self) -> int:
+        return sum(self._pending.values())
+
+    def add(self, project_id: int, count: int = 1) -> None:
+        if count <= 0:
+            return
+        with self._lock:
+            self._pending[project_id] += count
+            self.stats['added'] += count
+            pending = sum(self._pending.values())
+        if self._thread is None:
+            # not started, keep the old synchronous behaviour
+            self.flush()
+        elif pending >= self.max_pending:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='tasks-execution-counter', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+        if self._pending:
+            log.error('Execution counter stopped with unsent counts: %s', dict(self._pending))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            if time.monotonic() < self._retry_at and not self._stop.is_set():
+                return
+            with self._lock:
+                counts, self._pending = self._pending, Counter()
+            if not counts:
+                return
+            unsent = self._send(counts)
+            with self._lock:
+                self._pending.update(unsent)
+            if unsent:
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(self.max_backoff, self.flush_interval * 2 ** self._failures)
+            else:
+                self._failures = 0
+                self._retry_at = 0.0
+            self.stats['flushes'] += 1
+            self.stats['flushed'] += sum(counts.values()) - sum(unsent.values())
+
+    def _send(self, counts: Counter) -> Counter:
+        """ Counts left to retry, those of calls that surely failed """
+        rpc = rpc_tools.RpcMixin().rpc
+        if self.bulk_rpc:
+            try:
+                getattr(rpc.call, self.bulk_rpc)(counts=dict(counts))
+            except self.AMBIGUOUS_ERRORS as e:
+                log.error('Bulk rpc %s timed out, dropping executions %s: %s', self.bulk_rpc, dict(counts), e)
+                self.stats['errors'] += 1
+                self.stats['dropped'] += sum(counts.values())
+            except Exception as e:
+                log.warning('Bulk rpc %s failed, retrying later: %s', self.bulk_rpc, e)
+                self.stats['errors'] += 1
+                return Counter(counts)
+            return Counter()
+        unsent = Counter(counts)
+        for project_id, count in counts.items():
+            try:
+                for _ in range(count):
+                    try:
+                        rpc.call.projects_add_task_execution(project_id=project_id)
+                    except self.AMBIGUOUS_ERRORS as e:
+                        log.error('Adding a task execution for project %s timed out, dropping it: %s', project_id, e)
+                        self.stats['errors'] += 1
+                        self.stats['dropped'] += 1
+                    unsent[project_id] -= 1
+            except Exception as e:
+                log.warning('Failed to add task executions for project %s: %s', project_id, e)
+                self.stats['errors'] += 1
+        return +unsent
+
+
+execution_counter = ExecutionCounter()
@@ -0,0 +1,218 @@
+import random
+import socket
+from datetime import datetime, timedelta
+from threading import Thread, Event, current_thread
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import and_, or_, func
+from sqlalchemy.exc import IntegrityError
+
+from pylon.core.tools import log
+from tools import db
+
+from ..constants import ARCHIVE_STATUS
+from ..models.log_archive import TaskLogArchiveJob
+from ..models.results import TaskResults
+from ..models.tasks import Task
+from ..utils import write_task_run_logs_to_minio_bucket
+
+
+class LogArchiver:
+    """ Worker pool moving task run logs from Loki to MinIO out of the results request path
+
+    Jobs live in task_log_archive_job, one row per task_result_id, so repeated PUTs of one
+    result re-queue the same job instead of piling up. Failed attempts are retried with
+    exponential backoff until max_attempts; a job whose worker died is picked up again
+    once its lease expires.
+    """
+
+    def __init__(self, workers: int = 2, poll_interval: float = 5, lease: int = 300,
+                 max_attempts: int = 5, backoff: float = 10, backoff_max: float = 600):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.node_id = f'{socket.gethostname()}:{uuid4()}'
+        self._threads = []
+        self._stop = Event()
+        self._wakeup = Event()
+        self.stats = {'enqueued': 0, 'archived': 0, 'retried': 0, 'failed': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    @property
+    def is_running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self, app=None) -> None:
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._threads = [
+            Thread(target=self._work, args=(app,), name=f'tasks-log-archiver-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+        log.info('Log archiver started with %s workers', self.workers)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def enqueue(self, *task_results: TaskResults) -> None:
+        """ Queues (or re-queues) archival of the results logs in one commit, call after the results are committed """
+        now = datetime.utcnow()
+        for _ in range(2):
+            for task_result in task_results:
+                values = {
+                    'project_id': task_result.project_id,
+                    'mode': task_result.mode,
+                    'task_id': task_result.task_id,
+                    'status': ARCHIVE_STATUS.QUEUED.value,
+                    'attempts': 0,
+                    'last_error': None,
+                    'next_attempt_at': now,
+                    'locked_by': None,
+                    'locked_until': None,
+                    'finished_at': None,
+                }
+                query = TaskLogArchiveJob.query.filter(TaskLogArchiveJob.task_result_id == task_result.task_result_id)
+                if not query.update(values, synchronize_session=False):
+                    db.session.add(TaskLogArchiveJob(task_result_id=task_result.task_result_id, **values))
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # some result was queued concurrently, update that job instead
+                db.session.rollback()
+        self.stats['enqueued'] += len(task_results)
+        self._wakeup.set()
+
+    @staticmethod
+    def get_status(task_result_id: str) -> Optional[dict]:
+        job = TaskLogArchiveJob.query.filter(TaskLogArchiveJob.task_result_id == task_result_id).first()
+        return job.to_json() if job else None
+
+    def queue_stats(self) -> dict:
+        counts = dict(db.session.query(
+            TaskLogArchiveJob.status, func.count(TaskLogArchiveJob.task_result_id)
+        ).group_by(TaskLogArchiveJob.status).all())
+        return {'jobs': counts, 'workers': len(self._threads), **self.stats}
+
+    def _work(self, app) -> None:
+        while not self._stop.is_set():
+            processed = False
+            try:
+                if app is not None:
+                    with app.app_context():
+                        processed = self.run_once()
+                else:
+                    processed = self.run_once()
+            except Exception:
+                log.exception('Log archiver iteration failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self) -> bool:
+        job = self._claim()
+        if job is None:
+            return False
+        task_result = TaskResults.query.filter(TaskResults.task_result_id == job.task_result_id).first()
+        if task_result is None:
+            self._finish(job, ARCHIVE_STATUS.FAILED, error='Task result does not exist')
+            self.stats['failed'] += 1
+            return True
+        task = Task.query.with_entities(Task.task_name).filter(Task.task_id == task_result.task_id).first()
+        if task is None:
+            # the log is named after the task, retrying cannot help
+            self._finish(job, ARCHIVE_STATUS.FAILED, error='Task does not exist')
+            self.stats['failed'] += 1
+            return True
+        try:
+            location = write_task_run_logs_to_minio_bucket(task_result, task_name=task.task_name)
+        except Exception as e:
+            db.session.rollback()
+            if job.attempts >= self.max_attempts:
+                log.error('Giving up archiving logs of %s after %s attempts: %s', job.task_result_id, job.attempts, e)
+                self._finish(job, ARCHIVE_STATUS.FAILED, error=str(e))
+                self.stats['failed'] += 1
+            else:
+                delay = min(self.backoff * 2 ** (job.attempts - 1), self.backoff_max)
+                delay += random.uniform(0, delay / 10)
+                log.warning('Archiving logs of %s failed, retry in %ss: %s', job.task_result_id, int(delay), e)
+                self._finish(
+                    job, ARCHIVE_STATUS.QUEUED, error=str(e),
+                    next_attempt_at=datetime.utcnow() + timedelta(seconds=delay)
+                )
+                self.stats['retried'] += 1
+            return True
+        bucket, file_name = location or (None, None)
+        self._finish(job, ARCHIVE_STATUS.DONE, bucket=bucket, file_name=file_name)
+        self.stats['archived'] += 1
+        return True
+
+    @property
+    def _worker_id(self) -> str:
+        return f'{self.node_id}:{current_thread().name}'
+
+    def _claim(self) -> Optional[TaskLogArchiveJob]:
+        now = datetime.utcnow()
+        job = TaskLogArchiveJob.query.filter(or_(
+            and_(
+                TaskLogArchiveJob.status == ARCHIVE_STATUS.QUEUED.value,
+                TaskLogArchiveJob.next_attempt_at <= now
+            ),
+            # the worker holding it is gone
+            and_(
+                TaskLogArchiveJob.status == ARCHIVE_STATUS.RUNNING.value,
+                TaskLogArchiveJob.locked_until < now
+            ),
+        )).order_by(
+            TaskLogArchiveJob.next_attempt_at
+        ).with_for_update(skip_locked=True).first()
+        if job is None:
+            db.session.rollback()
+            return None
+        job.status = ARCHIVE_STATUS.RUNNING.value
+        job.attempts += 1
+        job.locked_by = self._worker_id
+        job.locked_until = now + timedelta(seconds=self.lease)
+        db.session.commit()
+        return job
+
+    def _finish(self, job: TaskLogArchiveJob, status: ARCHIVE_STATUS, error: Optional[str] = None,
+                next_attempt_at: Optional[datetime] = None, **location) -> None:
+        values = {
+            'status': status.value,
+            'last_error': error,
+            'locked_by': None,
+            'locked_until': None,
+            **location,
+        }
+        if next_attempt_at:
+            values['next_attempt_at'] = next_attempt_at
+        else:
+            values['finished_at'] = datetime.utcnow()
+        # a job re-queued by a newer PUT while running is no longer ours to finish
+        TaskLogArchiveJob.query.filter(
+            TaskLogArchiveJob.task_result_id == job.task_result_id,
+            TaskLogArchiveJob.locked_by == self._worker_id
+        ).update(values, synchronize_session=False)
+        db.session.commit()
+
+
+log_archiver = LogArchiver()
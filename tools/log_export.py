@@ -0,0 +1,109 @@
+import heapq
+from datetime import datetime, timezone
+from typing import Iterator, Tuple, Optional
+
+import requests
+
+from pylon.core.tools import log
+
+
+def to_ns(value: datetime) -> int:
+    if value.tzinfo is None:
+        # task_results timestamps are naive utc
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp()) * 10 ** 9 + value.microsecond * 1000
+
+
+class LokiExporter:
+    """ Streams log entries of a Loki query in timestamp order without loading them all
+
+    The time range is split into windows of `window` seconds and every window is paged with
+    `page_limit` entries per query_range call. Loki returns the first page_limit entries of
+    the window, each stream already sorted, so a page only needs a heap merge of its streams.
+    """
+
+    def __init__(self, page_limit: int = 5000, window: int = 3600, timeout: float = 60, lookbehind: int = 300,
+                 part_size: int = 8 * 1024 * 1024, compression: Optional[str] = 'gzip',
+                 compression_level: Optional[int] = None):
+        self.page_limit = page_limit
+        self.window = window
+        self.timeout = timeout
+        # logs shipped slightly before the result row was created
+        self.lookbehind = lookbehind
+        # minio multipart part size of exported log files
+        self.part_size = part_size
+        # gzip, zstd or null for plain text files
+        self.compression = compression
+        self.compression_level = compression_level
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def iter_entries(self, query_range_url: str, query: str,
+                     start: Optional[datetime], end: Optional[datetime] = None) -> Iterator[Tuple[int, str]]:
+        """ Yields (unix ns, line) for query in [start - lookbehind, end), only the last window without start """
+        end_ns = to_ns(end or datetime.utcnow()) + 10 ** 9
+        window_ns = self.window * 10 ** 9
+        start_ns = to_ns(start) - self.lookbehind * 10 ** 9 if start else end_ns - window_ns
+        while start_ns < end_ns:
+            window_end = min(start_ns + window_ns, end_ns)
+            yield from self._iter_window(query_range_url, query, start_ns, window_end)
+            start_ns = window_end
+
+    def _query(self, url: str, query: str, start_ns: int, end_ns: int) -> list:
+        response = requests.get(url, params={
+            'query': query,
+            'start': start_ns,
+            'end': end_ns,
+            'limit': self.page_limit,
+            'direction': 'forward',
+        }, timeout=self.timeout)
+        if not response.ok:
+            log.warning('Request to loki failed with status %s', response.status_code)
+        response.raise_for_status()
+        return response.json()['data']['result']
+
+    def _iter_window(self, url: str, query: str, start_ns: int, end_ns: int) -> Iterator[Tuple[int, str]]:
+        """ Pages until a page brings nothing new, loki may cap pages below page_limit
+
+        (max_entries_limit_per_query), so a short page does not mean the window is done.
+        """
+        cursor = start_ns
+        # the next page starts at the last timestamp seen, skip (stream, line) pairs already yielded there
+        seen_at_cursor = set()
+        page_size = 0
+        while cursor < end_ns:
+            streams = self._query(url, query, cursor, end_ns)
+            count = 0
+            last_ts, at_last_ts = cursor, set(seen_at_cursor)
+            for ts, key, line in heapq.merge(*(
+                    self._stream_values(stream) for stream in streams
+            ), key=lambda item: item[0]):
+                count += 1
+                if ts == cursor and (key, line) in seen_at_cursor:
+                    continue
+                if ts != last_ts:
+                    last_ts, at_last_ts = ts, set()
+                at_last_ts.add((key, line))
+                yield ts, line
+            if not count:
+                return
+            page_size = max(page_size, count)
+            if last_ts == cursor and at_last_ts == seen_at_cursor:
+                if count < page_size:
+                    return
+                # a whole page of lines sharing one timestamp, nothing new can be paged there
+                log.warning('More than %s log lines at %s, skipping the rest of them', count, cursor)
+                cursor, seen_at_cursor = cursor + 1, set()
+            else:
+                cursor, seen_at_cursor = last_ts, at_last_ts
+
+    @staticmethod
+    def _stream_values(stream: dict) -> Iterator[Tuple[int, tuple, str]]:
+        key = tuple(sorted(stream.get('stream', {}).items()))
+        for ts, line in stream['values']:
+            yield int(ts), key, line
+
+loki_exporter = LokiExporter()
@@ -0,0 +1,87 @@
+import gzip
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, Iterable, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+SUPPORTED_ENCODINGS = ('gzip', 'zstd')
+LOG_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+# user metadata key of archived logs, boto returns it lower-cased
+UNCOMPRESSED_SIZE_METADATA = 'uncompressed-size'
+
+
+def log_file_name(task_result_id: str, encoding: Optional[str]) -> str:
+    """ Object key of an archived run log, compressed ones carry their encoding's extension """
+    return f'{task_result_id}.log{LOG_EXTENSIONS.get(encoding, "")}'
+
+
+def log_file_names(task_result_id: str) -> list:
+    """ Keys an archived run log may have, plain .log last as logs written before were all stored under it """
+    return [log_file_name(task_result_id, i) for i in SUPPORTED_ENCODINGS] + [log_file_name(task_result_id, None)]
+
+
+def check_encoding(encoding: Optional[str]) -> Optional[str]:
+    if not encoding or encoding == 'identity':
+        return None
+    if encoding not in SUPPORTED_ENCODINGS:
+        raise ValueError(f'Unsupported log compression: {encoding}')
+    if encoding == 'zstd' and zstandard is None:
+        raise ValueError('zstd log compression needs the zstandard package')
+    return encoding
+
+
+@contextmanager
+def compressed_writer(fileobj, encoding: Optional[str], level: Optional[int] = None):
+    """ Wraps a writable fileobj so everything written to it is compressed with encoding """
+    if encoding == 'gzip':
+        writer = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level or 6, mtime=0)
+        try:
+            yield writer
+        finally:
+            writer.close()
+    elif encoding == 'zstd':
+        writer = zstandard.ZstdCompressor(level=level or 3).stream_writer(fileobj)
+        try:
+            yield writer
+        finally:
+            # ends the frame without closing fileobj
+            writer.flush(zstandard.FLUSH_FRAME)
+    else:
+        yield fileobj
+
+
+def iter_decompressed(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'zstd':
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        yield from chunks
+        return
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_range(chunks: Iterable[bytes], start: int, stop: Optional[int]) -> Iterator[bytes]:
+    """ Bytes [start, stop) of a chunked stream """
+    position = 0
+    for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start:
+            piece = chunk[max(start - position, 0):None if stop is None else stop - position]
+            if piece:
+                yield piece
+        position = chunk_end
+        if stop is not None and position >= stop:
+            return
+
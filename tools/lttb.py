@@ -0,0 +1,39 @@
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+def lttb(data: Sequence[T], threshold: int, xy: Callable[[T], Tuple[float, float]]) -> List[T]:
+    """ Largest-Triangle-Three-Buckets downsampling of data (sorted by x) to threshold items
+
+    Keeps the first and the last item and, for every bucket in between, the item forming the
+    largest triangle with the previously kept item and the average of the next bucket.
+    """
+    length = len(data)
+    if threshold >= length or threshold < 3:
+        return list(data)
+
+    points = [xy(i) for i in data]
+    sampled = [data[0]]
+    every = (length - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # average of the next bucket
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, length)
+        avg_range = points[avg_start:avg_end] or [points[-1]]
+        avg_x = sum(p[0] for p in avg_range) / len(avg_range)
+        avg_y = sum(p[1] for p in avg_range) / len(avg_range)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        max_area, next_a = -1.0, range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area, next_a = area, j
+        sampled.append(data[next_a])
+        a = next_a
+    sampled.append(data[-1])
+    return sampled
@@ -0,0 +1,98 @@
+from typing import Optional
+
+from pylon.core.tools import log
+
+
+# S3 rejects multipart parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class MultipartWriter:
+    """ File-like writer streaming into a MinIO object through an S3 multipart upload
+
+    Data is buffered up to part_size and sent part by part, so memory stays bounded by one part.
+    Objects smaller than a part are stored with a single put. Use as a context manager: the upload
+    is completed on success and aborted on error. User metadata only known once everything is
+    written may be put in metadata before completing; multipart objects get it through a copy
+    onto themselves.
+    """
+
+    def __init__(self, minio_client, bucket: str, file_name: str, part_size: int = 8 * 1024 * 1024,
+                 **object_kwargs):
+        self.s3_client = minio_client.s3_client
+        self.bucket = minio_client.format_bucket_name(bucket)
+        self.file_name = file_name
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.object_kwargs = object_kwargs
+        self.upload_id: Optional[str] = None
+        self.parts = []
+        self.metadata = dict()
+        self.size = 0
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self) -> None:
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.file_name, **self.object_kwargs
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.file_name, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self._buffer)
+        )
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self._buffer = bytearray()
+
+    def complete(self) -> None:
+        if self.upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=self.file_name, Body=bytes(self._buffer),
+                Metadata=self.metadata, **self.object_kwargs
+            )
+        else:
+            if self._buffer:
+                self._upload_part()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.file_name, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+            if self.metadata:
+                self._replace_metadata()
+        self._buffer = bytearray()
+
+    def _replace_metadata(self) -> None:
+        try:
+            self.s3_client.copy_object(
+                Bucket=self.bucket, Key=self.file_name,
+                CopySource={'Bucket': self.bucket, 'Key': self.file_name},
+                MetadataDirective='REPLACE', Metadata=self.metadata, **self.object_kwargs
+            )
+        except Exception as e:
+            # the object itself is complete, only its metadata is missing
+            log.warning('Failed to set metadata of %s/%s: %s', self.bucket, self.file_name, e)
+
+    def abort(self) -> None:
+        self._buffer = bytearray()
+        if self.upload_id is None:
+            return
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.file_name, UploadId=self.upload_id)
+        except Exception as e:
+            log.warning('Failed to abort multipart upload of %s/%s: %s', self.bucket, self.file_name, e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.complete()
+        else:
+            self.abort()
+        return False
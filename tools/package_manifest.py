@@ -0,0 +1,250 @@
+import io
+import re
+import zipfile
+import zlib
+from typing import Optional, Dict, List, Tuple
+
+from ..constants import RUNTIME_MAPPING, PACKAGE_MANIFEST_MAX_SOURCE_SIZE, PACKAGE_MANIFEST_MAX_SOURCES
+
+
+RUNTIME_FAMILIES = {
+    'python': 'python',
+    'nodejs': 'node',
+    'java': 'java',
+    'dotnetcore': 'dotnet',
+    'go': 'go',
+    'ruby': 'ruby',
+}
+
+# directories holding dependencies, their sources are listed as modules but never parsed
+VENDORED_DIRS = ('node_modules', 'site-packages', 'dist-packages', 'vendor')
+# bumped when modules gets more complete, older manifests never turn a miss into an error
+MANIFEST_VERSION = 2
+
+_PYTHON_DEF = re.compile(rb'^(?:async\s+)?def\s+(\w+)\s*\(([^)]*)\)', re.MULTILINE)
+_NODE_EXPORTS = (
+    # exports.handler = ..., module.exports.handler = ...
+    re.compile(rb'^\s*(?:module\.)?exports\.(\w+)\s*=', re.MULTILINE),
+    # export const handler = ..., export async function handler(...)
+    re.compile(rb'^\s*export\s+(?:const|let|var|(?:async\s+)?function)\s+(\w+)', re.MULTILINE),
+)
+_NODE_EXPORTS_OBJECT = re.compile(rb'module\.exports\s*=\s*\{([^}]*)\}')
+_RUBY_DEF = re.compile(rb'^\s*def\s+(?:self\.)?(\w+)\s*\(\s*event:\s*,\s*context:\s*\)', re.MULTILINE)
+
+
+def _top_level_args(args: str) -> List[str]:
+    """ Arguments of a def split on commas outside brackets, annotations and defaults included """
+    result, depth, current = [], 0, ''
+    for char in args:
+        depth += (char in '[{') - (char in ']}')
+        if char == ',' and depth == 0:
+            result.append(current.strip())
+            current = ''
+        else:
+            current += char
+    return [i for i in result + [current.strip()] if i]
+
+
+def _python_handlers(source: bytes) -> List[str]:
+    # def handler(event, context), annotated or not
+    return [
+        name.decode() for name, args in _PYTHON_DEF.findall(source)
+        if len([i for i in _top_level_args(args.decode('utf-8', 'ignore')) if not i.startswith('*')]) == 2
+    ]
+
+
+def _node_handlers(source: bytes) -> List[str]:
+    names = [i for pattern in _NODE_EXPORTS for i in pattern.findall(source)]
+    for body in _NODE_EXPORTS_OBJECT.findall(source):
+        # module.exports = { handler, other: impl }
+        names.extend(re.findall(rb'(?:^|,)\s*(\w+)\s*(?=[:,]|$)', body.strip()))
+    return [i.decode() for i in names]
+
+
+def _ruby_handlers(source: bytes) -> List[str]:
+    return [i.decode() for i in _RUBY_DEF.findall(source)]
+
+
+SOURCE_PARSERS = {
+    'python': (('.py',), _python_handlers),
+    'node': (('.js', '.mjs', '.cjs'), _node_handlers),
+    'ruby': (('.rb',), _ruby_handlers),
+}
+# modules shipped in a form that is not parsed, still importable by the runtime
+COMPILED_EXTENSIONS = {
+    'python': ('.pyc', '.so', '.pyd'),
+    'node': ('.ts',),
+}
+
+
+def runtime_family(runtime: str) -> Optional[str]:
+    """ 'Python 3.8' -> 'python' through the lambda image name in RUNTIME_MAPPING """
+    image = RUNTIME_MAPPING.get(runtime, '').split(':', 1)[-1]
+    for prefix, family in RUNTIME_FAMILIES.items():
+        if image.startswith(prefix):
+            return family
+
+
+def _module_name(path: str, extension: str) -> str:
+    """ Dotted module of a source path, package/__init__.py is the package itself """
+    module = path[:-len(extension)].replace('/', '.')
+    if module.endswith('.__init__'):
+        return module[:-len('.__init__')]
+    return module
+
+
+def _compiled_module_name(path: str) -> str:
+    """ pkg/__pycache__/mod.cpython-38.pyc and pkg/mod.cpython-38-x86_64-linux-gnu.so are pkg.mod """
+    parts = [i for i in path.split('/') if i != '__pycache__']
+    parts[-1] = parts[-1].split('.', 1)[0]
+    if parts[-1] == '__init__' and len(parts) > 1:
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _is_vendored(path: str) -> bool:
+    return any(i in VENDORED_DIRS for i in path.split('/')[:-1])
+
+
+def inspect_package(fileobj) -> Optional[dict]:
+    """ Reads the zip directory and small sources of a package once
+
+    Returns the unpacked size, the file count and, per runtime family, the source modules and
+    the handlers found in them: module.function for python, node and ruby, class names for java
+    (classes inside jars are not looked into), assemblies for dotnet and root files for go.
+    Modules also list compiled and dependency directory modules, which are never parsed.
+    truncated is set when not every source was scanned. None if fileobj is not a zip.
+    """
+    stream = getattr(fileobj, 'stream', fileobj)
+    if not all(hasattr(stream, i) for i in ('read', 'seek', 'tell')):
+        return None
+    position = stream.tell()
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        stream.seek(position)
+        return None
+    try:
+        files = [i for i in archive.infolist() if not i.is_dir()]
+        families = set(RUNTIME_FAMILIES.values())
+        entry_points: Dict[str, List[str]] = {family: [] for family in families}
+        modules: Dict[str, List[str]] = {family: [] for family in families}
+        scanned, truncated = 0, False
+        for info in files:
+            name = info.filename
+            if '/' not in name:
+                modules['go'].append(name)
+                if '.' not in name:
+                    entry_points['go'].append(name)
+            for family, extensions in COMPILED_EXTENSIONS.items():
+                if name.endswith(extensions):
+                    modules[family].append(_compiled_module_name(name))
+            vendored = _is_vendored(name)
+            for family, (extensions, parser) in SOURCE_PARSERS.items():
+                extension = next((i for i in extensions if name.endswith(i)), None)
+                if extension is None:
+                    continue
+                module = _module_name(name, extension)
+                modules[family].append(module)
+                if vendored:
+                    continue
+                if info.file_size > PACKAGE_MANIFEST_MAX_SOURCE_SIZE or scanned >= PACKAGE_MANIFEST_MAX_SOURCES:
+                    truncated = True
+                    continue
+                scanned += 1
+                try:
+                    source = archive.read(info)
+                except (zipfile.BadZipFile, NotImplementedError, RuntimeError, EOFError, zlib.error):
+                    # corrupted, encrypted or unsupported compression
+                    truncated = True
+                    continue
+                entry_points[family].extend(f'{module}.{i}' for i in parser(source))
+            if name.endswith('.class') and '$' not in name:
+                entry_points['java'].append(_module_name(name, '.class'))
+            elif name.endswith('.dll'):
+                entry_points['dotnet'].append(name.rsplit('/', 1)[-1][:-len('.dll')])
+        return {
+            'version': MANIFEST_VERSION,
+            'unpacked_size': sum(i.file_size for i in files),
+            'file_count': len(files),
+            'truncated': truncated,
+            'entry_points': {k: sorted(set(v)) for k, v in entry_points.items() if v},
+            'modules': {k: sorted(set(v)) for k, v in modules.items() if v},
+        }
+    finally:
+        archive.close()
+        stream.seek(position)
+
+
+def check_handler(manifest: Optional[dict], runtime: str, handler: str) -> Tuple[Optional[str], Optional[str]]:
+    """ (error, warning) about handler against the package manifest
+
+    Only a handler whose module (python, node, ruby) or root file (go) is surely not in the
+    package is an error: the manifest must list every module and no module may end with the
+    handler's one, as dependency directories may be on the import path. A handler not among the
+    detected entry points is a warning: detection is heuristic and skipped parts may hold it.
+    """
+    family = runtime_family(runtime)
+    if not manifest or not family or not handler:
+        return None, None
+    entry_points = manifest.get('entry_points', {}).get(family, [])
+    modules = manifest.get('modules', {}).get(family)
+    if family in ('java', 'dotnet'):
+        # com.example.Handler::handleRequest, Assembly::Namespace.Class::Method
+        candidate, module = handler.split('::', 1)[0], None
+    elif family == 'go':
+        candidate = module = handler
+    else:
+        # src/index.handler and src.index.handler are the same
+        module, _, function = handler.rpartition('.')
+        module = module.replace('/', '.')
+        candidate = f'{module}.{function}'
+    if candidate in entry_points:
+        return None, None
+    if module is not None and modules is not None and module not in modules:
+        if manifest.get('version', 1) >= MANIFEST_VERSION and \
+                not any(i.endswith(f'.{module}') for i in modules):
+            return f'Handler {handler} not found: there is no {module} in the package', None
+        return None, f'Handler {handler} may not be in the package: no {module} at its root'
+    if entry_points and not manifest.get('truncated'):
+        return None, f'Handler {handler} was not recognized, detected: {", ".join(entry_points[:20])}'
+    return None, None
+
+
+class RangeReader(io.RawIOBase):
+    """ Seekable read-only view of a MinIO object through ranged GETs, enough for zipfile """
+
+    def __init__(self, s3_client, bucket: str, key: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size or not len(buffer):
+            return 0
+        stop = min(self._position + len(buffer), self.size) - 1
+        data = self.s3_client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f'bytes={self._position}-{stop}'
+        )['Body'].read()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
@@ -0,0 +1,223 @@
+import base64
+import io
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional, List
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+from werkzeug.utils import secure_filename
+
+from pylon.core.tools import log
+from tools import db, MinioClientAdmin
+
+from .minio_upload import MIN_PART_SIZE
+from .package_manifest import inspect_package, RangeReader
+from .packages import package_catalog, make_scope
+from ..constants import UPLOAD_STATUS, UPLOAD_PART_SIZE, UPLOAD_PART_SIZE_MAX, UPLOAD_MAX_PARTS, \
+    PACKAGE_HASH_CHUNK_SIZE, PACKAGE_MANIFEST_READ_BUFFER
+from ..models.packages import TaskPackageUpload
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class PackageUploads:
+    """ Chunked, resumable package uploads staged as MinIO multipart uploads in the package store
+
+    Parts go straight to MinIO, which also is the source of truth for the parts already received,
+    so a client resumes by asking for the upload and sending only the missing parts. complete()
+    assembles the object, verifies its sha256 against the one declared on initiate and moves it to
+    its content address; only then a task can be created from the upload.
+    """
+
+    def __init__(self, part_size: int = UPLOAD_PART_SIZE, ttl: float = 24 * 3600):
+        self.part_size = part_size
+        self.ttl = ttl
+        self.stats = {'initiated': 0, 'completed': 0, 'failed': 0, 'expired': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    @property
+    def bucket(self) -> str:
+        return package_catalog.store_bucket
+
+    def get(self, mode: str, project_id: Optional[int], upload_id: str) -> Optional[TaskPackageUpload]:
+        mode, project_id = make_scope(mode, project_id)
+        return TaskPackageUpload.query.filter(
+            TaskPackageUpload.id == upload_id,
+            TaskPackageUpload.mode == mode,
+            TaskPackageUpload.project_id == project_id if project_id is not None
+            else TaskPackageUpload.project_id.is_(None),
+        ).first()
+
+    def get_complete(self, mode: str, project_id: Optional[int], upload_id: str) -> Optional[TaskPackageUpload]:
+        upload = self.get(mode, project_id, upload_id)
+        if upload and upload.status == UPLOAD_STATUS.COMPLETE.value:
+            return upload
+
+    def initiate(self, mode: str, project_id: Optional[int], file_name: str, sha256: str,
+                 size: Optional[int] = None) -> TaskPackageUpload:
+        self.expire()
+        # the name becomes the object key in the project bucket and Task.zippath
+        file_name = secure_filename(file_name)
+        if not file_name:
+            raise UploadError('Invalid file_name')
+        mode, project_id = make_scope(mode, project_id)
+        store_client = MinioClientAdmin()
+        if self.bucket not in store_client.list_bucket():
+            store_client.create_bucket(bucket=self.bucket, bucket_type='autogenerated')
+        upload_id = uuid4().hex
+        key = f'uploads/{upload_id}'
+        multipart = store_client.s3_client.create_multipart_upload(
+            Bucket=store_client.format_bucket_name(self.bucket), Key=key, ContentType='application/zip'
+        )
+        upload = TaskPackageUpload(
+            id=upload_id, mode=mode, project_id=project_id, file_name=file_name,
+            sha256=sha256.lower(), size=size, key=key, multipart_id=multipart['UploadId'],
+        )
+        db.session.add(upload)
+        db.session.commit()
+        self.stats['initiated'] += 1
+        return upload
+
+    @staticmethod
+    def _check_status(upload: TaskPackageUpload, status: str) -> None:
+        if upload.status != status:
+            raise UploadError(f'Upload is {upload.status}', 409)
+
+    def upload_part(self, upload: TaskPackageUpload, part_number: int, stream) -> dict:
+        """ Sends one part read from stream, re-sending a part number replaces it """
+        self._check_status(upload, UPLOAD_STATUS.INITIATED.value)
+        if not 1 <= part_number <= UPLOAD_MAX_PARTS:
+            raise UploadError(f'part_number must be between 1 and {UPLOAD_MAX_PARTS}')
+        # S3 needs the part length up front, one part is the most held in memory
+        data = stream.read(UPLOAD_PART_SIZE_MAX + 1)
+        if len(data) > UPLOAD_PART_SIZE_MAX:
+            raise UploadError(f'Part exceeds {UPLOAD_PART_SIZE_MAX} bytes', 413)
+        if not data:
+            raise UploadError('Empty part')
+        store_client = MinioClientAdmin()
+        resp = store_client.s3_client.upload_part(
+            Bucket=store_client.format_bucket_name(self.bucket), Key=upload.key,
+            UploadId=upload.multipart_id, PartNumber=part_number, Body=data,
+            ContentMD5=base64.b64encode(hashlib.md5(data).digest()).decode(),
+        )
+        return {'part_number': part_number, 'size': len(data), 'etag': resp['ETag'].strip('"')}
+
+    def list_parts(self, upload: TaskPackageUpload) -> List[dict]:
+        if upload.status != UPLOAD_STATUS.INITIATED.value:
+            return []
+        store_client = MinioClientAdmin()
+        parts = []
+        paginator = store_client.s3_client.get_paginator('list_parts')
+        for page in paginator.paginate(
+                Bucket=store_client.format_bucket_name(self.bucket), Key=upload.key, UploadId=upload.multipart_id
+        ):
+            parts.extend(
+                {'part_number': i['PartNumber'], 'size': i['Size'], 'etag': i['ETag'].strip('"')}
+                for i in page.get('Parts', [])
+            )
+        return parts
+
+    def to_json(self, upload: TaskPackageUpload) -> dict:
+        parts = self.list_parts(upload)
+        return {
+            **upload.to_json(exclude_fields={'multipart_id', 'key'}),
+            "part_size": self.part_size,
+            "parts": parts,
+            "received": sum(i['size'] for i in parts),
+        }
+
+    def complete(self, upload: TaskPackageUpload) -> TaskPackageUpload:
+        self._check_status(upload, UPLOAD_STATUS.INITIATED.value)
+        parts = self.list_parts(upload)
+        if not parts:
+            raise UploadError('No parts uploaded')
+        missing = sorted(set(range(1, parts[-1]['part_number'] + 1)) - {i['part_number'] for i in parts})
+        if missing:
+            raise UploadError(f'Missing parts {missing[:10]}')
+        if any(i['size'] < MIN_PART_SIZE for i in parts[:-1]):
+            raise UploadError(f'Every part but the last must be at least {MIN_PART_SIZE} bytes')
+        received = sum(i['size'] for i in parts)
+        if upload.size is not None and received != upload.size:
+            raise UploadError(f'Received {received} bytes of {upload.size}')
+
+        store_client = MinioClientAdmin()
+        bucket = store_client.format_bucket_name(self.bucket)
+        store_client.s3_client.complete_multipart_upload(
+            Bucket=bucket, Key=upload.key, UploadId=upload.multipart_id,
+            MultipartUpload={'Parts': [{'PartNumber': i['part_number'], 'ETag': i['etag']} for i in parts]}
+        )
+        # multipart etags are not content hashes, read the object back once
+        digest = hashlib.sha256()
+        for chunk in store_client.s3_client.get_object(Bucket=bucket, Key=upload.key)['Body'].iter_chunks(
+                PACKAGE_HASH_CHUNK_SIZE
+        ):
+            digest.update(chunk)
+        if digest.hexdigest() != upload.sha256:
+            store_client.s3_client.delete_object(Bucket=bucket, Key=upload.key)
+            upload.status = UPLOAD_STATUS.FAILED.value
+            upload.last_error = f'sha256 mismatch: got {digest.hexdigest()}'
+            db.session.commit()
+            self.stats['failed'] += 1
+            raise UploadError('Checksum mismatch, upload the package again', 422)
+
+        try:
+            upload.manifest = inspect_package(io.BufferedReader(
+                RangeReader(store_client.s3_client, bucket, upload.key), PACKAGE_MANIFEST_READ_BUFFER
+            ))
+        except Exception as e:
+            log.warning('Failed to inspect uploaded package %s: %s', upload.id, e)
+        package_catalog.store_staged(store_client, upload.key, upload.sha256)
+        upload.size = received
+        upload.status = UPLOAD_STATUS.COMPLETE.value
+        db.session.commit()
+        self.stats['completed'] += 1
+        return upload
+
+    @staticmethod
+    def attach(mode: str, project_id: Optional[int], upload: TaskPackageUpload):
+        """ Attaches the content of a complete upload as a package of the scope """
+        try:
+            return package_catalog.attach(mode, project_id, upload.file_name, upload.sha256, upload.manifest)
+        except (ClientError, LookupError) as e:
+            log.warning('Content of upload %s is gone: %s', upload.id, e)
+            raise UploadError('Uploaded package is no longer stored, upload it again', 410)
+
+    def consume(self, upload: TaskPackageUpload) -> None:
+        """ Marks a complete upload as used by a task, its content stays in the store """
+        self._check_status(upload, UPLOAD_STATUS.COMPLETE.value)
+        upload.status = UPLOAD_STATUS.USED.value
+        db.session.commit()
+
+    def abort(self, upload: TaskPackageUpload) -> None:
+        if upload.status == UPLOAD_STATUS.INITIATED.value:
+            store_client = MinioClientAdmin()
+            try:
+                store_client.s3_client.abort_multipart_upload(
+                    Bucket=store_client.format_bucket_name(self.bucket), Key=upload.key,
+                    UploadId=upload.multipart_id
+                )
+            except Exception as e:
+                log.warning('Failed to abort package upload %s: %s', upload.id, e)
+        db.session.delete(upload)
+        db.session.commit()
+
+    def expire(self, limit: int = 100) -> None:
+        """ Drops sessions older than ttl, unfinished ones are aborted in MinIO """
+        for upload in TaskPackageUpload.query.filter(
+                TaskPackageUpload.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+        ).limit(limit).all():
+            self.abort(upload)
+            self.stats['expired'] += 1
+
+
+package_uploads = PackageUploads()
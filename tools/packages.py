@@ -0,0 +1,444 @@
+import hashlib
+from datetime import datetime, timedelta
+from threading import Thread, Event, Lock
+from typing import Optional, Dict, Iterable, Set, Tuple, Callable
+
+from botocore.exceptions import ClientError
+from hurry.filesize import size
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from pylon.core.tools import log
+from tools import db, MinioClientAdmin
+
+from .package_manifest import inspect_package
+from .retention import get_minio_client
+from ..constants import PACKAGE_HASH_CHUNK_SIZE, UPLOAD_STATUS
+from ..models.packages import TaskPackage, TaskPackageScope, TaskPackageBlob, TaskPackageUpload
+from ..models.tasks import Task
+
+
+def make_scope(mode: str, project_id: Optional[int]) -> Tuple[str, Optional[int]]:
+    return mode, int(project_id) if mode == 'default' and project_id is not None else None
+
+
+def scope_filter(mode: str, project_id: Optional[int], model=TaskPackage) -> list:
+    mode, project_id = make_scope(mode, project_id)
+    return [
+        model.mode == mode,
+        model.project_id == project_id if project_id is not None else model.project_id.is_(None),
+    ]
+
+
+def _hash_stream(chunks: Iterable[bytes]) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(file) -> Optional[str]:
+    """ sha256 of a file-like upload, the stream position is kept """
+    stream = getattr(file, 'stream', file)
+    if not all(hasattr(stream, i) for i in ('read', 'seek', 'tell')):
+        return None
+    position = stream.tell()
+    try:
+        return _hash_stream(iter(lambda: stream.read(PACKAGE_HASH_CHUNK_SIZE), b''))
+    finally:
+        stream.seek(position)
+
+
+class PackageCatalog:
+    """ task_package rows mirror the tasks bucket of every project, so listings need no MinIO calls
+
+    Uploads and deletes through the tasks api keep it in sync, a scope never listed before
+    (as recorded in task_package_scope) is loaded from MinIO on first use and a background run
+    reconciles every scope each interval: size, etag and upload time are taken from the bucket
+    and missing hashes are computed, the latter only ever off the request path.
+
+    With dedup on, package content is uploaded once per sha256 into the shared store bucket and
+    projects only reference it; the project bucket gets a server side copy while
+    keep_project_copies is set, for workers fetching packages by zippath. Dedup is off by default
+    as workers still fetch packages by zippath, so it only adds the store copy to the storage used.
+    """
+
+    def __init__(self, enabled: bool = True, interval: float = 900, dedup: bool = False,
+                 store_bucket: str = 'taskpackages', keep_project_copies: bool = True):
+        self.enabled = enabled
+        self.interval = interval
+        self.dedup = dedup
+        self.store_bucket = store_bucket
+        self.keep_project_copies = keep_project_copies
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        self._lock = Lock()
+        self._loaded: Set[tuple] = set()
+        self.stats = {
+            'reconciled': 0, 'added': 0, 'removed': 0, 'changed': 0, 'hashed': 0,
+            'stored': 0, 'deduplicated': 0, 'collected': 0,
+        }
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def start(self, app=None) -> None:
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app,), name='tasks-packages', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, app) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self.reconcile_all()
+                else:
+                    self.reconcile_all()
+            except Exception:
+                log.exception('Task packages reconciliation failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def record(self, mode: str, project_id: Optional[int], file_name: str, **metadata) -> TaskPackage:
+        """ Upserts the package with size, etag, content_hash and uploaded_at """
+        zippath = f'tasks/{file_name}'
+        mode, project_id = make_scope(mode, project_id)
+        for attempt in range(2):
+            package = TaskPackage.query.filter(
+                *scope_filter(mode, project_id), TaskPackage.zippath == zippath
+            ).first()
+            if package is None:
+                package = TaskPackage(mode=mode, project_id=project_id, zippath=zippath)
+                db.session.add(package)
+            for k, v in metadata.items():
+                setattr(package, k, v)
+            try:
+                db.session.commit()
+                return package
+            except IntegrityError:
+                # inserted concurrently by another upload, update that row instead
+                db.session.rollback()
+                if attempt:
+                    raise
+
+    def record_upload(self, mode: str, project_id: Optional[int], file_name: str,
+                      file_hash: Optional[str] = None, **metadata) -> TaskPackage:
+        """ Records a package just uploaded, one HEAD request for its size and etag """
+        minio_client = get_minio_client(*make_scope(mode, project_id))
+        head = minio_client.s3_client.head_object(
+            Bucket=minio_client.format_bucket_name('tasks'), Key=file_name
+        )
+        return self.record(
+            mode, project_id, file_name,
+            size=head['ContentLength'],
+            etag=head['ETag'].strip('"'),
+            content_hash=file_hash,
+            uploaded_at=datetime.utcnow(),
+            **metadata
+        )
+
+    def manifest(self, mode: str, project_id: Optional[int], zippath: str) -> Optional[dict]:
+        package = TaskPackage.query.with_entities(TaskPackage.manifest).filter(
+            *scope_filter(mode, project_id), TaskPackage.zippath == zippath
+        ).first()
+        return package[0] if package else None
+
+    def store_key(self, file_hash: str) -> str:
+        return f'{file_hash}.zip'
+
+    def store_path(self, file_hash: Optional[str]) -> Optional[str]:
+        """ bucket/key of the content in the store, None if it is not stored there """
+        if file_hash and TaskPackageBlob.query.get(file_hash) is not None:
+            return f'{self.store_bucket}/{self.store_key(file_hash)}'
+
+    def _touch(self, blob: TaskPackageBlob) -> None:
+        """ A dedup hit, keeps the blob out of collect_blobs until it gets referenced """
+        blob.last_used_at = datetime.utcnow()
+        db.session.commit()
+        self.stats['deduplicated'] += 1
+
+    def _store_blob(self, store_client, file, file_hash: str) -> TaskPackageBlob:
+        """ Uploads the content unless the store already has it """
+        blob = TaskPackageBlob.query.get(file_hash)
+        if blob is not None:
+            self._touch(blob)
+            return blob
+        if self.store_bucket not in store_client.list_bucket():
+            store_client.create_bucket(bucket=self.store_bucket, bucket_type='autogenerated')
+        stream = getattr(file, 'stream', file)
+        position = stream.tell()
+        store_client.s3_client.upload_fileobj(
+            stream, store_client.format_bucket_name(self.store_bucket), self.store_key(file_hash)
+        )
+        stream.seek(position)
+        head = store_client.s3_client.head_object(
+            Bucket=store_client.format_bucket_name(self.store_bucket), Key=self.store_key(file_hash)
+        )
+        blob = TaskPackageBlob(content_hash=file_hash, size=head['ContentLength'], etag=head['ETag'].strip('"'))
+        db.session.add(blob)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # stored concurrently by another request, the object is the same
+            db.session.rollback()
+            blob = TaskPackageBlob.query.get(file_hash)
+        self.stats['stored'] += 1
+        return blob
+
+    def upload(self, mode: str, project_id: Optional[int], file, upload_func: Callable,
+               manifest: Optional[dict] = None) -> TaskPackage:
+        """ Stores the package of a task, content already in the store is not uploaded again """
+        mode, project_id = make_scope(mode, project_id)
+        file_hash = content_hash(file)
+        if manifest is None and file_hash is not None:
+            manifest = inspect_package(file)
+        if not self.dedup or file_hash is None:
+            upload_func(bucket="tasks", f=file, project=project_id)
+            return self.record_upload(mode, project_id, file.filename, file_hash, manifest=manifest)
+
+        self._store_blob(MinioClientAdmin(), file, file_hash)
+        try:
+            return self.attach(mode, project_id, file.filename, file_hash, manifest)
+        except (ClientError, LookupError) as e:
+            log.warning('Server side copy of package %s failed, uploading it: %s', file_hash, e)
+            upload_func(bucket="tasks", f=file, project=project_id)
+            return self.record_upload(mode, project_id, file.filename, file_hash, manifest=manifest)
+
+    def attach(self, mode: str, project_id: Optional[int], file_name: str, file_hash: str,
+               manifest: Optional[dict] = None) -> TaskPackage:
+        """ References stored content as package file_name of the scope, LookupError if it is not stored """
+        mode, project_id = make_scope(mode, project_id)
+        blob = TaskPackageBlob.query.get(file_hash)
+        if blob is None:
+            raise LookupError(f'Package content {file_hash} is not stored')
+        if self.keep_project_copies:
+            store_client = MinioClientAdmin()
+            minio_client = get_minio_client(mode, project_id)
+            if 'tasks' not in minio_client.list_bucket():
+                minio_client.create_bucket(bucket='tasks')
+            minio_client.s3_client.copy(
+                {'Bucket': store_client.format_bucket_name(self.store_bucket), 'Key': self.store_key(file_hash)},
+                minio_client.format_bucket_name('tasks'), file_name
+            )
+            return self.record_upload(mode, project_id, file_name, file_hash, manifest=manifest)
+        return self.record(
+            mode, project_id, file_name,
+            size=blob.size, etag=blob.etag, content_hash=file_hash, uploaded_at=datetime.utcnow(),
+            manifest=manifest,
+        )
+
+    def store_staged(self, store_client, key: str, file_hash: str) -> TaskPackageBlob:
+        """ Moves an object uploaded to the store bucket under key to its content address """
+        bucket = store_client.format_bucket_name(self.store_bucket)
+        blob = TaskPackageBlob.query.get(file_hash)
+        if blob is None:
+            store_client.s3_client.copy({'Bucket': bucket, 'Key': key}, bucket, self.store_key(file_hash))
+            head = store_client.s3_client.head_object(Bucket=bucket, Key=self.store_key(file_hash))
+            blob = TaskPackageBlob(content_hash=file_hash, size=head['ContentLength'], etag=head['ETag'].strip('"'))
+            db.session.add(blob)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                blob = TaskPackageBlob.query.get(file_hash)
+            self.stats['stored'] += 1
+        else:
+            self._touch(blob)
+        store_client.s3_client.delete_object(Bucket=bucket, Key=key)
+        return blob
+
+    def remove(self, mode: str, project_id: Optional[int], file_name: str) -> None:
+        TaskPackage.query.filter(
+            *scope_filter(mode, project_id), TaskPackage.zippath == f'tasks/{file_name}'
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def ensure_loaded(self, mode: str, project_id: Optional[int]) -> None:
+        """ Lists a scope from MinIO once if it was never loaded, without hashing anything """
+        scope = make_scope(mode, project_id)
+        if scope in self._loaded:
+            return
+        with self._lock:
+            if scope in self._loaded:
+                return
+            if not TaskPackageScope.query.filter(*scope_filter(*scope, model=TaskPackageScope)).first():
+                self.sync(*scope)
+            self._loaded.add(scope)
+
+    def zippaths(self, mode: str, project_id: Optional[int]):
+        """ Query of package paths in the scope, to be used in a Task.zippath.in_() filter """
+        return db.session.query(TaskPackage.zippath).filter(*scope_filter(mode, project_id))
+
+    @staticmethod
+    def packages(tasks: Iterable[Task]) -> Dict[tuple, TaskPackage]:
+        """ {(mode, project_id, zippath): package} of the packages of tasks """
+        keys = {(*make_scope(i.mode, i.project_id), i.zippath) for i in tasks}
+        if not keys:
+            return dict()
+        rows = TaskPackage.query.filter(
+            TaskPackage.mode.in_({i[0] for i in keys}),
+            TaskPackage.zippath.in_({i[2] for i in keys}),
+        ).all()
+        return {
+            (i.mode, i.project_id, i.zippath): i for i in rows
+            if (i.mode, i.project_id, i.zippath) in keys
+        }
+
+    @staticmethod
+    def package_of(packages: Dict[tuple, TaskPackage], task: Task) -> Optional[TaskPackage]:
+        return packages.get((*make_scope(task.mode, task.project_id), task.zippath))
+
+    @staticmethod
+    def to_json(package: Optional[TaskPackage]) -> dict:
+        if package is None:
+            return {"size": None, "package": None}
+        return {
+            "size": size(package.size) if package.size is not None else None,
+            "package": {
+                "size_bytes": package.size,
+                "etag": package.etag,
+                "content_hash": package.content_hash,
+                "uploaded_at": package.uploaded_at.isoformat() if package.uploaded_at else None,
+                "unpacked_size": (package.manifest or {}).get('unpacked_size'),
+                "file_count": (package.manifest or {}).get('file_count'),
+            },
+        }
+
+    @staticmethod
+    def list_objects(minio_client) -> Dict[str, dict]:
+        """ {zippath: metadata} of the tasks bucket """
+        objects = dict()
+        paginator = minio_client.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=minio_client.format_bucket_name('tasks')):
+            for i in page.get('Contents', []):
+                objects[f'tasks/{i["Key"]}'] = {
+                    'size': i['Size'],
+                    'etag': i['ETag'].strip('"'),
+                    'uploaded_at': i['LastModified'].replace(tzinfo=None),
+                }
+        return objects
+
+    def sync(self, mode: str, project_id: Optional[int]) -> None:
+        """ Makes the scope match the tasks bucket listing and marks it loaded """
+        try:
+            self._sync(mode, project_id)
+        except IntegrityError:
+            # a package was recorded concurrently, the second pass sees it
+            db.session.rollback()
+            self._sync(mode, project_id)
+
+    def _sync(self, mode: str, project_id: Optional[int]) -> None:
+        mode, project_id = make_scope(mode, project_id)
+        minio_client = get_minio_client(mode, project_id)
+        objects = self.list_objects(minio_client)
+        known = {i.zippath: i for i in TaskPackage.query.filter(*scope_filter(mode, project_id)).all()}
+        stored = {i[0] for i in db.session.query(TaskPackageBlob.content_hash).filter(
+            TaskPackageBlob.content_hash.in_({i.content_hash for i in known.values() if i.content_hash})
+        ).all()}
+        for zippath, package in known.items():
+            metadata = objects.get(zippath)
+            if metadata is None and package.content_hash in stored:
+                # only referenced from the store
+                continue
+            if metadata is None:
+                db.session.delete(package)
+                self.stats['removed'] += 1
+            elif package.etag != metadata['etag'] or package.size != metadata['size']:
+                # replaced behind our back, the old hash does not hold anymore
+                package.size = metadata['size']
+                package.etag = metadata['etag']
+                package.uploaded_at = metadata['uploaded_at']
+                package.content_hash = None
+                self.stats['changed'] += 1
+        for zippath, metadata in objects.items():
+            if zippath not in known:
+                db.session.add(TaskPackage(mode=mode, project_id=project_id, zippath=zippath, **metadata))
+                self.stats['added'] += 1
+        if not TaskPackageScope.query.filter(*scope_filter(mode, project_id, model=TaskPackageScope)).first():
+            db.session.add(TaskPackageScope(mode=mode, project_id=project_id))
+        db.session.commit()
+
+    def hash_missing(self, mode: str, project_id: Optional[int]) -> None:
+        """ Streams packages of the scope without a content hash to compute it, slow on big packages """
+        mode, project_id = make_scope(mode, project_id)
+        minio_client = get_minio_client(mode, project_id)
+        for package in TaskPackage.query.filter(
+                *scope_filter(mode, project_id), TaskPackage.content_hash.is_(None)
+        ).all():
+            if self._stop.is_set():
+                break
+            try:
+                obj = minio_client.s3_client.get_object(
+                    Bucket=minio_client.format_bucket_name('tasks'), Key=package.file_name
+                )
+                package.content_hash = _hash_stream(obj['Body'].iter_chunks(PACKAGE_HASH_CHUNK_SIZE))
+                db.session.commit()
+                self.stats['hashed'] += 1
+            except Exception as e:
+                log.warning('Failed to hash task package %s: %s', package.zippath, e)
+                db.session.rollback()
+
+    def reconcile(self, mode: str, project_id: Optional[int]) -> None:
+        """ Makes the scope match the tasks bucket and fills in missing hashes """
+        self.sync(mode, project_id)
+        self.hash_missing(mode, project_id)
+        self.stats['reconciled'] += 1
+
+    def collect_blobs(self) -> None:
+        """ Deletes stored content nothing references anymore, sparing blobs used within an interval
+
+        Complete chunked uploads not yet turned into a task count as references.
+        """
+        referenced = db.session.query(TaskPackage.content_hash).filter(TaskPackage.content_hash.isnot(None))
+        uploaded = db.session.query(TaskPackageUpload.sha256).filter(
+            TaskPackageUpload.status == UPLOAD_STATUS.COMPLETE.value
+        )
+        blobs = TaskPackageBlob.query.filter(
+            TaskPackageBlob.content_hash.notin_(referenced),
+            TaskPackageBlob.content_hash.notin_(uploaded),
+            func.coalesce(TaskPackageBlob.last_used_at, TaskPackageBlob.created_at) <
+            datetime.utcnow() - timedelta(seconds=self.interval),
+        ).all()
+        if not blobs:
+            return
+        store_client = MinioClientAdmin()
+        for blob in blobs:
+            try:
+                store_client.s3_client.delete_object(
+                    Bucket=store_client.format_bucket_name(self.store_bucket), Key=self.store_key(blob.content_hash)
+                )
+            except Exception as e:
+                log.warning('Failed to delete stored package %s: %s', blob.content_hash, e)
+                continue
+            db.session.delete(blob)
+            self.stats['collected'] += 1
+        db.session.commit()
+
+    def reconcile_all(self) -> None:
+        scopes = {make_scope(*i) for i in db.session.query(Task.mode, Task.project_id).distinct().all()}
+        scopes.update(make_scope(*i) for i in db.session.query(TaskPackage.mode, TaskPackage.project_id).distinct().all())
+        for scope in scopes:
+            if self._stop.is_set():
+                break
+            try:
+                self.reconcile(*scope)
+            except Exception as e:
+                log.warning('Failed to reconcile task packages of %s: %s', scope, e)
+                db.session.rollback()
+        if not self._stop.is_set():
+            self.collect_blobs()
+
+
+package_catalog = PackageCatalog()
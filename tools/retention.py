@@ -0,0 +1,280 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from threading import Thread, Event
+from typing import Optional, Dict, Tuple
+
+from sqlalchemy import or_
+
+from pylon.core.tools import log
+from tools import db, MinioClient, MinioClientAdmin
+
+from .log_storage import compressed_writer, iter_decompressed
+from .minio_upload import MultipartWriter
+from ..constants import TASK_STATUS, ARCHIVE_STATUS
+from ..models.log_archive import TaskLogArchiveJob
+from ..models.results import TaskResults
+from ..models.retention import TaskRetentionPolicy, TaskResultsArchive
+from ..models.tasks import Task
+
+
+def get_minio_client(mode: str, project_id: Optional[int]):
+    if mode == 'default':
+        return MinioClient.from_project_id(project_id)
+    return MinioClientAdmin()
+
+
+def log_bucket_name(task_name: str) -> str:
+    return str(task_name).replace("_", "").replace(" ", "").lower()
+
+
+class RetentionCompactor:
+    """ Moves expired task_results into gzipped NDJSON chunks in MinIO and prunes expired run logs
+
+    Policies come from task_retention_policy per (mode, project_id), falling back to
+    results_days/logs_days from config; None keeps forever. Batches are taken with
+    SKIP LOCKED, so several nodes can compact side by side.
+    """
+
+    def __init__(self, enabled: bool = True, interval: float = 3600, batch_size: int = 1000,
+                 results_days: Optional[int] = None, logs_days: Optional[int] = None,
+                 bucket: str = 'tasksarchive'):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.results_days = results_days
+        self.logs_days = logs_days
+        self.bucket = bucket
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        self.stats = {'archived_rows': 0, 'archives': 0, 'pruned_logs': 0, 'runs': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def start(self, app=None) -> None:
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app,), name='tasks-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, app) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self.run_once()
+                else:
+                    self.run_once()
+            except Exception:
+                log.exception('Task results retention run failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def get_policies(self) -> Dict[Tuple[str, Optional[int]], Tuple[Optional[int], Optional[int]]]:
+        return {
+            (i.mode, i.project_id): (i.results_days, i.logs_days)
+            for i in TaskRetentionPolicy.query.all()
+        }
+
+    def run_once(self) -> None:
+        policies = self.get_policies()
+        default = (self.results_days, self.logs_days)
+        now = datetime.utcnow()
+
+        for column, model, index in (
+                (TaskResults.created_at, TaskResults, 0),
+                (TaskLogArchiveJob.finished_at, TaskLogArchiveJob, 1),
+        ):
+            days = [i[index] for i in (default, *policies.values()) if i[index]]
+            if not days:
+                continue
+            # only scopes having anything older than the shortest retention
+            scopes = db.session.query(model.mode, model.project_id).filter(
+                column < now - timedelta(days=min(days))
+            ).distinct().all()
+            for mode, project_id in scopes:
+                keep_days = policies.get((mode, project_id), default)[index]
+                if not keep_days or self._stop.is_set():
+                    continue
+                cutoff = now - timedelta(days=keep_days)
+                if index == 0:
+                    while self.compact(mode, project_id, cutoff) and not self._stop.is_set():
+                        pass
+                else:
+                    while self.prune_logs(mode, project_id, cutoff) and not self._stop.is_set():
+                        pass
+        self.stats['runs'] += 1
+
+    @staticmethod
+    def _expired_filter(mode: str, project_id: Optional[int], cutoff: datetime) -> list:
+        return [
+            TaskResults.mode == mode,
+            TaskResults.project_id == project_id if project_id is not None else TaskResults.project_id.is_(None),
+            TaskResults.created_at < cutoff,
+            or_(TaskResults.task_status.is_(None), TaskResults.task_status != TASK_STATUS.IN_PROGRESS.value),
+        ]
+
+    def compact(self, mode: str, project_id: Optional[int], cutoff: datetime) -> int:
+        """ Archives and deletes one batch of results older than cutoff, returns the number of rows
+
+        Every task's chunk is locked, uploaded and committed on its own, so a failed upload
+        leaves no archived object behind without its rows deleted and archive recorded.
+        """
+        candidates = TaskResults.query.with_entities(TaskResults.id, TaskResults.task_id).filter(
+            *self._expired_filter(mode, project_id, cutoff)
+        ).order_by(TaskResults.id).limit(self.batch_size).all()
+        db.session.rollback()
+        if not candidates:
+            return 0
+
+        by_task = defaultdict(list)
+        for row_id, task_id in candidates:
+            by_task[task_id].append(row_id)
+        minio_client = get_minio_client(mode, project_id)
+        if self.bucket not in minio_client.list_bucket():
+            minio_client.create_bucket(bucket=self.bucket, bucket_type='autogenerated')
+
+        archived = 0
+        for task_id, ids in by_task.items():
+            if self._stop.is_set():
+                break
+            archived += self._compact_chunk(minio_client, mode, project_id, cutoff, task_id, ids)
+        if archived:
+            log.info('Archived %s task results of %s/%s', archived, mode, project_id)
+        return archived
+
+    def _compact_chunk(self, minio_client, mode: str, project_id: Optional[int], cutoff: datetime,
+                       task_id: Optional[str], ids: list) -> int:
+        rows = TaskResults.query.filter(
+            TaskResults.id.in_(ids), *self._expired_filter(mode, project_id, cutoff)
+        ).order_by(TaskResults.id).with_for_update(skip_locked=True).all()
+        if not rows:
+            # taken by another node
+            db.session.rollback()
+            return 0
+
+        file_name = f'results/{mode}/{project_id}/{task_id}/{rows[0].id}-{rows[-1].id}.ndjson.gz'
+        try:
+            with MultipartWriter(
+                    minio_client, self.bucket, file_name,
+                    ContentType='application/x-ndjson', ContentEncoding='gzip'
+            ) as upload, compressed_writer(upload, 'gzip') as output:
+                for row in rows:
+                    output.write(json.dumps(
+                        {c.key: getattr(row, c.key) for c in TaskResults.__mapper__.column_attrs},
+                        default=str
+                    ).encode('utf-8') + b'\n')
+        except Exception:
+            db.session.rollback()
+            raise
+
+        try:
+            db.session.add(TaskResultsArchive(
+                project_id=project_id, mode=mode, task_id=task_id,
+                bucket=self.bucket, file_name=file_name, rows=len(rows),
+                first_created_at=rows[0].created_at,
+                last_created_at=max(i.created_at for i in rows),
+            ))
+            result_ids = [i.task_result_id for i in rows]
+            TaskResults.query.filter(
+                TaskResults.id.in_([i.id for i in rows])
+            ).delete(synchronize_session=False)
+            # archived logs are still pruned through their jobs, the others point at nothing now
+            TaskLogArchiveJob.query.filter(
+                TaskLogArchiveJob.task_result_id.in_(result_ids),
+                TaskLogArchiveJob.status != ARCHIVE_STATUS.DONE.value,
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            try:
+                minio_client.s3_client.delete_object(
+                    Bucket=minio_client.format_bucket_name(self.bucket), Key=file_name
+                )
+            except Exception as e:
+                log.warning('Failed to delete unrecorded archive %s: %s', file_name, e)
+            raise
+        self.stats['archives'] += 1
+        self.stats['archived_rows'] += len(rows)
+        return len(rows)
+
+    def prune_logs(self, mode: str, project_id: Optional[int], cutoff: datetime) -> int:
+        """ Deletes one batch of archived run logs finished before cutoff, returns the number handled
+
+        Jobs of results already compacted are deleted with their log, the others are marked pruned.
+        """
+        jobs = TaskLogArchiveJob.query.filter(
+            TaskLogArchiveJob.mode == mode,
+            TaskLogArchiveJob.project_id == project_id if project_id is not None
+            else TaskLogArchiveJob.project_id.is_(None),
+            TaskLogArchiveJob.status == ARCHIVE_STATUS.DONE.value,
+            TaskLogArchiveJob.finished_at < cutoff,
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+        if not jobs:
+            db.session.rollback()
+            return 0
+
+        task_names = dict(Task.query.with_entities(Task.task_id, Task.task_name).filter(
+            Task.task_id.in_({i.task_id for i in jobs if not i.bucket})
+        ).all())
+        results = {i[0] for i in TaskResults.query.with_entities(TaskResults.task_result_id).filter(
+            TaskResults.task_result_id.in_([i.task_result_id for i in jobs])
+        ).all()}
+        minio_client = get_minio_client(mode, project_id)
+        handled = pruned = 0
+        for job in jobs:
+            if job.bucket:
+                bucket, file_name = job.bucket, job.file_name
+            elif task_names.get(job.task_id):
+                # archived before the location was recorded
+                bucket, file_name = log_bucket_name(task_names[job.task_id]), f'{job.task_result_id}.log'
+            else:
+                job.status = ARCHIVE_STATUS.FAILED.value
+                job.last_error = 'Log location unknown, the task was deleted'
+                handled += 1
+                continue
+            try:
+                minio_client.s3_client.delete_object(
+                    Bucket=minio_client.format_bucket_name(bucket), Key=file_name
+                )
+            except Exception as e:
+                log.warning('Failed to prune log of %s: %s', job.task_result_id, e)
+                continue
+            if job.task_result_id in results:
+                job.status = ARCHIVE_STATUS.PRUNED.value
+            else:
+                db.session.delete(job)
+            handled += 1
+            pruned += 1
+        db.session.commit()
+        self.stats['pruned_logs'] += pruned
+        return handled
+
+    @staticmethod
+    def read_archive(archive: TaskResultsArchive) -> list:
+        """ Rows of one archived chunk """
+        minio_client = get_minio_client(archive.mode, archive.project_id)
+        obj = minio_client.s3_client.get_object(
+            Bucket=minio_client.format_bucket_name(archive.bucket), Key=archive.file_name
+        )
+        rows, tail = [], b''
+        for chunk in iter_decompressed(obj['Body'].iter_chunks(64 * 1024), 'gzip'):
+            *lines, tail = (tail + chunk).split(b'\n')
+            rows.extend(json.loads(i) for i in lines if i.strip())
+        if tail.strip():
+            rows.append(json.loads(tail))
+        return rows
+
+
+retention_compactor = RetentionCompactor()
@@ -0,0 +1,176 @@
+import random
+import socket
+from datetime import datetime, timedelta
+from threading import Thread, Event
+from typing import Optional
+from uuid import uuid4
+
+from croniter import croniter
+from sqlalchemy.exc import IntegrityError
+
+from pylon.core.tools import log
+from tools import db
+
+from .TaskManager import TaskManager
+from ..models.schedules import TaskSchedule, TaskSchedulerLeader
+from ..models.tasks import Task
+
+
+def get_next_run(schedule: TaskSchedule, base: datetime) -> datetime:
+    """ First due slot after base, interval slots are counted from created_at so they never drift """
+    if schedule.cron:
+        next_run = croniter(schedule.cron, base).get_next(datetime)
+    else:
+        anchor = schedule.created_at or base
+        slots = int((base - anchor).total_seconds() // schedule.interval) + 1
+        next_run = anchor + timedelta(seconds=slots * schedule.interval)
+    if schedule.jitter:
+        next_run += timedelta(seconds=random.uniform(0, schedule.jitter))
+    return next_run
+
+
+class Scheduler:
+    """ Leader-elected ticker firing due TaskSchedule rows through TaskManager.run_task
+
+    Due rows are locked only to plan their next run, tasks are dispatched after that commit.
+    Schedules of tasks that no longer exist are deactivated.
+    """
+    LEADER_ROW_ID = 1
+
+    def __init__(self, tick_interval: float = 5, lease: int = 30, batch_size: int = 100):
+        self.tick_interval = tick_interval
+        self.lease = lease
+        self.batch_size = batch_size
+        self.node_id = f'{socket.gethostname()}:{uuid4()}'
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        self.is_leader = False
+        self.stats = {'fired': 0, 'misfired': 0, 'failed': 0, 'disabled': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def start(self, app=None) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app,), name='tasks-scheduler', daemon=True)
+        self._thread.start()
+        log.info('Task scheduler started as %s', self.node_id)
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+        if self.is_leader:
+            self._release_leadership()
+
+    def _run(self, app) -> None:
+        while not self._stop.wait(self.tick_interval):
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self.tick()
+                else:
+                    self.tick()
+            except Exception:
+                log.exception('Task scheduler tick failed')
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _acquire_leadership(self) -> bool:
+        now = datetime.utcnow()
+        leader = db.session.query(TaskSchedulerLeader).filter(
+            TaskSchedulerLeader.id == self.LEADER_ROW_ID
+        ).with_for_update().first()
+        if leader is None:
+            leader = TaskSchedulerLeader(id=self.LEADER_ROW_ID)
+            db.session.add(leader)
+        elif leader.holder != self.node_id and leader.expires_at and leader.expires_at > now:
+            db.session.rollback()
+            return False
+        leader.holder = self.node_id
+        leader.expires_at = now + timedelta(seconds=self.lease)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # another node created the row first
+            db.session.rollback()
+            return False
+        return True
+
+    def _release_leadership(self) -> None:
+        try:
+            db.session.query(TaskSchedulerLeader).filter(
+                TaskSchedulerLeader.id == self.LEADER_ROW_ID,
+                TaskSchedulerLeader.holder == self.node_id
+            ).update({TaskSchedulerLeader.expires_at: None})
+            db.session.commit()
+        except Exception as e:
+            log.warning('Task scheduler failed to release leadership: %s', e)
+            db.session.rollback()
+        self.is_leader = False
+
+    def tick(self) -> None:
+        is_leader = self._acquire_leadership()
+        if is_leader != self.is_leader:
+            log.info('Task scheduler %s leadership: %s', self.node_id, is_leader)
+        self.is_leader = is_leader
+        if not is_leader:
+            return
+
+        now = datetime.utcnow()
+        due = db.session.query(TaskSchedule).filter(
+            TaskSchedule.active.is_(True),
+            TaskSchedule.next_run_at <= now
+        ).order_by(
+            TaskSchedule.next_run_at
+        ).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+        existing = {i[0] for i in Task.query.with_entities(Task.task_id).filter(
+            Task.task_id.in_({i.task_id for i in due})
+        ).all()} if due else set()
+        to_fire = []
+        for schedule in due:
+            if schedule.task_id not in existing:
+                log.warning('Schedule %s disabled, task %s no longer exists', schedule.id, schedule.task_id)
+                schedule.active = False
+                self.stats['disabled'] += 1
+                continue
+            late = (now - schedule.next_run_at).total_seconds()
+            if schedule.misfire_grace is not None and late > schedule.misfire_grace:
+                # missed runs are coalesced and skipped, next run is the first slot after now
+                log.warning('Schedule %s misfired by %ss, skipping', schedule.id, int(late))
+                self.stats['misfired'] += 1
+            else:
+                to_fire.append(schedule)
+            schedule.next_run_at = get_next_run(schedule, now)
+        # release the row locks before any network I/O
+        db.session.commit()
+        for schedule in to_fire:
+            self.fire(schedule)
+
+    def fire(self, schedule: TaskSchedule) -> None:
+        event = schedule.event if schedule.event is not None else [{}]
+        if isinstance(event, dict):
+            event = [event]
+        try:
+            TaskManager(
+                project_id=schedule.project_id, mode=schedule.mode
+            ).run_task(event, schedule.task_id, queue_name=schedule.queue_name, priority=schedule.priority)
+            self.stats['fired'] += 1
+        except Exception:
+            log.exception('Schedule %s failed to run task %s', schedule.id, schedule.task_id)
+            self.stats['failed'] += 1
+            db.session.rollback()
+        TaskSchedule.query.filter(TaskSchedule.id == schedule.id).update(
+            {TaskSchedule.last_run_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.session.commit()
+
+
+scheduler = Scheduler()
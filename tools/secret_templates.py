@@ -0,0 +1,143 @@
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Optional
+
+SECRET_PLACEHOLDER = re.compile(r'{{\s*secret\.([\w-]+)\s*}}')
+
+
+def _render_secret(secrets: dict, name: str) -> str:
+    value = secrets.get(name)
+    return '' if value is None else str(value)
+
+
+def _compile_str(value: str, fallback: Callable) -> Callable[[dict], Any]:
+    parts = SECRET_PLACEHOLDER.split(value)
+    remainder = ''.join(parts[::2])
+    if '{{' in remainder or '{%' in remainder:
+        # not a plain {{secret.*}} substitution, leave it to the vault client
+        return lambda secrets: fallback(value=value, secrets=secrets)
+    literals, names = parts[::2], parts[1::2]
+
+    def render(secrets: dict) -> str:
+        chunks = [literals[0]]
+        for name, literal in zip(names, literals[1:]):
+            chunks.append(_render_secret(secrets, name))
+            chunks.append(literal)
+        return ''.join(chunks)
+    return render
+
+
+def _compile(value: Any, fallback: Callable) -> Optional[Callable[[dict], Any]]:
+    """ Returns a render function for values that contain placeholders, None for constants """
+    if isinstance(value, str):
+        if '{{' not in value and '{%' not in value:
+            return None
+        return _compile_str(value, fallback)
+    if isinstance(value, dict):
+        slots = [(k, _compile(v, fallback)) for k, v in value.items()]
+        slots = [(k, fn) for k, fn in slots if fn]
+        if not slots:
+            return None
+
+        def render(secrets: dict) -> dict:
+            rendered = dict(value)
+            for k, fn in slots:
+                rendered[k] = fn(secrets)
+            return rendered
+        return render
+    if isinstance(value, (list, tuple)):
+        slots = [(i, _compile(v, fallback)) for i, v in enumerate(value)]
+        slots = [(i, fn) for i, fn in slots if fn]
+        if not slots:
+            return None
+
+        def render(secrets: dict) -> list:
+            rendered = list(value)
+            for i, fn in slots:
+                rendered[i] = fn(secrets)
+            return rendered
+        return render
+    return None
+
+
+class SecretTemplate:
+    """ Value with {{secret.*}} placeholder positions located once, rendered by filling slots """
+
+    def __init__(self, value: Any, fallback: Callable):
+        self.value = value
+        self._render = _compile(value, fallback)
+
+    @property
+    def has_slots(self) -> bool:
+        return self._render is not None
+
+    def render(self, secrets: dict) -> Any:
+        if self._render is None:
+            if isinstance(self.value, dict):
+                return dict(self.value)
+            if isinstance(self.value, list):
+                return list(self.value)
+            return self.value
+        return self._render(secrets)
+
+
+class TaskTemplateCache:
+    """ LRU of compiled task json templates keyed by task_id, entries expire after ttl seconds
+
+    Templates hold task json before secrets are rendered, so secret rotation does not
+    affect them. Edits made on other nodes are picked up once the entry expires; the
+    cheap exists check on every hit keeps tasks deleted elsewhere from being dispatched.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: int = 10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._templates: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def configure(self, max_size: Optional[int] = None, ttl: Optional[int] = None,
+                  **kwargs) -> None:
+        if max_size is not None:
+            self.max_size = max_size
+        if ttl is not None:
+            self.ttl = ttl
+
+    def get(self, task_id: str, loader: Callable[[], Optional[dict]], fallback: Callable,
+            exists: Optional[Callable[[], bool]] = None) -> Optional[SecretTemplate]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._templates.get(task_id)
+            if entry is not None and entry[0] <= now:
+                del self._templates[task_id]
+                entry = None
+            if entry is not None:
+                self._templates.move_to_end(task_id)
+        if entry is not None:
+            if exists is None or exists():
+                self.stats['hits'] += 1
+                return entry[1]
+            self.invalidate(task_id)
+            return None
+        self.stats['misses'] += 1
+        task_json = loader()
+        if task_json is None:
+            return None
+        template = SecretTemplate(task_json, fallback)
+        with self._lock:
+            self._templates[task_id] = (now + self.ttl, template)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def invalidate(self, task_id: Optional[str] = None) -> None:
+        with self._lock:
+            if task_id is None:
+                self._templates.clear()
+                return
+            self._templates.pop(task_id, None)
+
+
+task_templates = TaskTemplateCache()
@@ -0,0 +1,79 @@
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Optional, Tuple, Dict
+
+from pylon.core.tools import log
+from tools import VaultClient
+
+
+class SecretsCache:
+    """ TTL cache of vault secrets per (project_id, mode) with single-flight refresh """
+
+    def __init__(self, ttl: int = 60):
+        self.ttl = ttl
+        self._lock = Lock()
+        self._key_locks: Dict[tuple, Lock] = defaultdict(Lock)
+        self._entries: Dict[tuple, Tuple[float, dict]] = dict()
+        self._versions: Dict[tuple, int] = defaultdict(int)
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def configure(self, ttl: Optional[int] = None, **kwargs) -> None:
+        if ttl is not None:
+            self.ttl = ttl
+
+    @staticmethod
+    def make_key(project_id: Optional[int] = None, mode: str = 'default') -> tuple:
+        return (int(project_id) if mode == 'default' and project_id is not None else None), mode
+
+    @staticmethod
+    def get_vault_client(project_id: Optional[int] = None, mode: str = 'default') -> VaultClient:
+        if mode == 'default':
+            return VaultClient.from_project(project_id)
+        return VaultClient()
+
+    def _get_fresh(self, key: tuple) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+
+    def get(self, project_id: Optional[int] = None, mode: str = 'default') -> dict:
+        key = self.make_key(project_id, mode)
+        secrets = self._get_fresh(key)
+        if secrets is not None:
+            self.stats['hits'] += 1
+            return dict(secrets)
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            # another thread may have refreshed it while we were waiting
+            secrets = self._get_fresh(key)
+            if secrets is not None:
+                self.stats['hits'] += 1
+                return dict(secrets)
+            self.stats['misses'] += 1
+            secrets = self.get_vault_client(*key).get_all_secrets()
+            previous = self._entries.get(key)
+            if not previous or previous[1] != secrets:
+                self._versions[key] += 1
+            self._entries[key] = (time.monotonic() + self.ttl, secrets)
+        return dict(secrets)
+
+    def version(self, project_id: Optional[int] = None, mode: str = 'default') -> int:
+        return self._versions[self.make_key(project_id, mode)]
+
+    def invalidate(self, project_id: Optional[int] = None, mode: Optional[str] = None) -> None:
+        """ Drops one entry, every entry of a mode without project_id, or everything without mode """
+        self.stats['invalidations'] += 1
+        if mode is None:
+            log.info('Secrets cache invalidated')
+            self._entries.clear()
+            return
+        if project_id is None:
+            for key in [k for k in list(self._entries) if k[1] == mode]:
+                self._entries.pop(key, None)
+            return
+        self._entries.pop(self.make_key(project_id, mode), None)
+
+
+secrets_cache = SecretsCache()
@@ -0,0 +1,128 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from itertools import count
+from threading import Lock, Condition
+from typing import Optional, Tuple, Dict, List
+
+from pylon.core.tools import log
+
+from ..constants import TASK_STATUS
+from ..models.results import TaskResults
+
+
+def make_key(mode: str, project_id: Optional[int], task_id: str) -> Tuple[str, Optional[int], str]:
+    return mode, int(project_id) if mode == 'default' and project_id is not None else None, task_id
+
+
+def get_task_status(mode: str, project_id: Optional[int], task_id: str) -> dict:
+    """ Same payload as the task_status api: is the task running and which results are in progress """
+    query_filter = [TaskResults.task_id == task_id, TaskResults.mode == mode]
+    if mode == 'default':
+        query_filter.append(TaskResults.project_id == project_id)
+    resp = TaskResults.query.with_entities(TaskResults.task_result_id).filter(
+        TaskResults.task_status == TASK_STATUS.IN_PROGRESS,
+        *query_filter
+    ).all()
+    if resp:
+        return {"code": 200, "IN_PROGRESS": True, "task_result_ids": [i[0] for i in resp]}
+    return {"code": 200, "IN_PROGRESS": False}
+
+
+class _Topic:
+    def __init__(self, history_size: int):
+        self.condition = Condition()
+        self.events = deque(maxlen=history_size)
+        self.subscribers = 0
+
+
+class StatusBroker:
+    """ In-process pub/sub of task run status changes, one topic per watched task
+
+    Results handlers call notify() after committing; it only touches the DB when someone on
+    this node subscribed to the task. Events carry the full task status, so a subscriber that
+    misses some still ends up with the current state. Results handled on other nodes are not
+    published here, subscribers re-read the status from the DB every heartbeat to catch them.
+    """
+
+    def __init__(self, history_size: int = 50, heartbeat: float = 15, max_stream_duration: float = 300,
+                 max_wait: float = 60, max_streams: int = 64):
+        self.history_size = history_size
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.max_stream_duration = max_stream_duration
+        self.max_wait = max_wait
+        self._lock = Lock()
+        self._topics: Dict[tuple, _Topic] = dict()
+        self._versions = count(1)
+        self.stats = {'published': 0, 'skipped': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def has_subscribers(self, key: tuple) -> bool:
+        return key in self._topics
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return sum(t.subscribers for t in self._topics.values())
+
+    @contextmanager
+    def subscribe(self, key: tuple):
+        with self._lock:
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = _Topic(self.history_size)
+            topic.subscribers += 1
+        try:
+            yield topic
+        finally:
+            with self._lock:
+                topic.subscribers -= 1
+                if topic.subscribers <= 0 and self._topics.get(key) is topic:
+                    del self._topics[key]
+
+    def publish(self, key: tuple, event: dict) -> Optional[int]:
+        topic = self._topics.get(key)
+        if topic is None:
+            return None
+        with topic.condition:
+            version = next(self._versions)
+            topic.events.append((version, event))
+            topic.condition.notify_all()
+        self.stats['published'] += 1
+        return version
+
+    def notify(self, *task_results: TaskResults) -> None:
+        """ Publishes the status of every task touched by task_results """
+        for key in {make_key(i.mode, i.project_id, i.task_id) for i in task_results}:
+            if not self.has_subscribers(key):
+                self.stats['skipped'] += 1
+                continue
+            try:
+                self.publish(key, get_task_status(*key))
+            except Exception as e:
+                log.warning('Failed to publish status of task %s: %s', key, e)
+
+    @staticmethod
+    def wait(topic: _Topic, since: int, timeout: float) -> List[Tuple[int, dict]]:
+        """ Events of topic newer than since, waiting up to timeout for the first one """
+        deadline = time.monotonic() + timeout
+        with topic.condition:
+            while True:
+                events = [i for i in topic.events if i[0] > since]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                topic.condition.wait(remaining)
+
+    @staticmethod
+    def current_version(topic: _Topic) -> int:
+        with topic.condition:
+            return topic.events[-1][0] if topic.events else 0
+
+
+status_broker = StatusBroker()
@@ -0,0 +1,120 @@
+import time
+from threading import Thread, Event
+from typing import Optional
+
+from sqlalchemy import and_, text
+
+from pylon.core.tools import log
+from tools import db
+
+from ..models.pd.results import parse_task_stats
+from ..models.results import TaskResults
+
+
+class TaskStatsNormalizer:
+    """ Turns raw docker stats of task results into the cpu/memory metric columns
+
+    columns() is used on ingest. The backfill converts rows stored before the columns existed,
+    batch_size rows per transaction, on one node at a time (postgres advisory lock). The raw blob
+    is only dropped with store_raw off, and never when nothing could be parsed from it.
+    """
+
+    # pg_try_advisory_lock key, any constant unique within the database
+    LOCK_KEY = 0x7461736b73  # 'tasks'
+
+    def __init__(self, store_raw: bool = True, backfill: bool = True, batch_size: int = 500, pause: float = 0.5):
+        self.store_raw = store_raw
+        self.backfill = backfill
+        self.batch_size = batch_size
+        self.pause = pause
+        self._thread: Optional[Thread] = None
+        self._stop = Event()
+        self.stats = {'backfilled': 0, 'batches': 0}
+
+    def configure(self, **kwargs) -> None:
+        for k, v in kwargs.items():
+            if hasattr(self, k) and not k.startswith('_'):
+                setattr(self, k, v)
+
+    def columns(self, task_stats: Optional[dict]) -> dict:
+        values = parse_task_stats(task_stats)
+        parsed = any(v is not None for v in values.values())
+        return {
+            **values,
+            'task_stats': task_stats if self.store_raw or not parsed else None,
+        }
+
+    def start(self, app=None) -> None:
+        if not self.backfill or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app,), name='tasks-stats-backfill', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, app) -> None:
+        try:
+            if app is not None:
+                with app.app_context():
+                    self._run_locked()
+            else:
+                self._run_locked()
+        except Exception:
+            log.exception('Task stats backfill failed')
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+    def _run_locked(self) -> None:
+        if db.engine.dialect.name != 'postgresql':
+            self.run_backfill()
+            return
+        with db.engine.connect() as connection:
+            if not connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': self.LOCK_KEY}).scalar():
+                log.info('Task stats backfill runs on another node')
+                return
+            try:
+                self.run_backfill()
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': self.LOCK_KEY})
+
+    def run_backfill(self) -> int:
+        """ Walks unconverted rows by id so rows with unparsable stats are only visited once """
+        last_id, converted = 0, 0
+        while not self._stop.is_set():
+            rows = TaskResults.query.with_entities(TaskResults.id, TaskResults.task_stats).filter(
+                TaskResults.id > last_id,
+                TaskResults.task_stats.isnot(None),
+                and_(TaskResults.cpu_usage.is_(None), TaskResults.memory_usage_bytes.is_(None))
+            ).order_by(TaskResults.id).limit(self.batch_size).all()
+            if not rows:
+                break
+            mappings = []
+            for row_id, task_stats in rows:
+                if task_stats is None:
+                    # json null, stored as sql NULL (none_as_null) so later passes skip the row
+                    mappings.append({'id': row_id, 'task_stats': None})
+                    continue
+                values = self.columns(task_stats)
+                if values['task_stats'] is not None:
+                    # kept as is, no need to write the blob back
+                    values.pop('task_stats')
+                mappings.append({'id': row_id, **values})
+            db.session.bulk_update_mappings(TaskResults, mappings)
+            db.session.commit()
+            last_id = rows[-1][0]
+            converted += len(rows)
+            self.stats['backfilled'] += len(rows)
+            self.stats['batches'] += 1
+            time.sleep(self.pause)
+        if converted:
+            log.info('Task stats backfill converted %s results', converted)
+        return converted
+
+
+task_stats_normalizer = TaskStatsNormalizer()
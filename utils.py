@@ -1,5 +1,4 @@
 from datetime import datetime
-from io import BytesIO
 from typing import Optional
 from urllib.parse import urlparse, urlunparse
 
@@ -8,57 +7,60 @@ from flask import current_app
 
 from .models.results import TaskResults
 from .models.tasks import Task
+from .tools.log_export import loki_exporter
+from .tools.minio_upload import MultipartWriter
+from .tools.log_storage import check_encoding, compressed_writer, log_file_name, UNCOMPRESSED_SIZE_METADATA
 from pylon.core.tools import log
 
 from tools import api_tools, rpc_tools, data_tools, MinioClient, VaultClient, MinioClientAdmin
 
 
-def write_task_run_logs_to_minio_bucket(task_result: TaskResults, task_name: Optional[str] = None, **kwargs):
+def write_task_run_logs_to_minio_bucket(task_result: TaskResults, task_name: Optional[str] = None,
+                                        **kwargs) -> Optional[tuple]:
+    """ Copies the run log from Loki to MinIO, returns its (bucket, file name) or None without Loki """
     if not task_name:
         task_name = Task.query.filter(Task.task_id == task_result.task_id).first().task_name
     loki_settings_url = urlparse(current_app.config["CONTEXT"].settings.get('loki', {}).get('url'))
 
-    # task_result_id = task_result.task_result_id
-    # task_id = task.task_id
-
-    if loki_settings_url:
+    if loki_settings_url.netloc:
         logs_query = "{" + f'hostname="{task_name}", task_id="{task_result.task_id}", task_result_id="{task_result.task_result_id}"' + "}"
         loki_url = urlunparse((
             loki_settings_url.scheme,
             loki_settings_url.netloc,
             '/loki/api/v1/query_range',
             None,
-            'query=' + logs_query,
+            None,
             None
         ))
-        response = requests.get(loki_url)
-
-        if response.ok:
-            results = response.json()
-            enc = 'utf-8'
-            file_output = BytesIO()
+        enc = 'utf-8'
 
-            file_output.write(f'Task {task_name} (task_result_id={task_result.task_result_id}) run log:\n'.encode(enc))
-
-            unpacked_values = []
-            for i in results['data']['result']:
-                for ii in i['values']:
-                    unpacked_values.append(ii)
-            for unix_ns, log_line in sorted(unpacked_values, key=lambda x: int(x[0])):
-                timestamp = datetime.fromtimestamp(int(unix_ns) / 1e9).strftime("%Y-%m-%d %H:%M:%S")
-                file_output.write(
-                    f'{timestamp}\t{log_line}\n'.encode(enc)
-                )
-            if task_result.mode == 'default':
-                minio_client = MinioClient.from_project_id(task_result.project_id)
-            else:
-                minio_client = MinioClientAdmin()
-            file_output.seek(0)
-            bucket_name = str(task_name).replace("_", "").replace(" ", "").lower()
-            file_name = f"{task_result.task_result_id}.log"
-
-            if bucket_name not in minio_client.list_bucket():
-                minio_client.create_bucket(bucket=bucket_name, bucket_type='autogenerated')
-            minio_client.upload_file(bucket_name, file_output, file_name)
+        if task_result.mode == 'default':
+            minio_client = MinioClient.from_project_id(task_result.project_id)
         else:
-            log.warning('Request to loki failed with status %s', response.status_code)
+            minio_client = MinioClientAdmin()
+        bucket_name = str(task_name).replace("_", "").replace(" ", "").lower()
+        # entries are paged from loki, compressed and flushed to minio part by part
+        encoding = check_encoding(loki_exporter.compression)
+        file_name = log_file_name(task_result.task_result_id, encoding)
+        if bucket_name not in minio_client.list_bucket():
+            minio_client.create_bucket(bucket=bucket_name, bucket_type='autogenerated')
+
+        object_kwargs = {'ContentType': 'text/plain; charset=utf-8'}
+        if encoding:
+            object_kwargs['ContentEncoding'] = encoding
+        with MultipartWriter(
+                minio_client, bucket_name, file_name, part_size=loki_exporter.part_size, **object_kwargs
+        ) as upload:
+            written = 0
+            with compressed_writer(upload, encoding, loki_exporter.compression_level) as file_output:
+                data = f'Task {task_name} (task_result_id={task_result.task_result_id}) run log:\n'.encode(enc)
+                file_output.write(data)
+                written += len(data)
+                for unix_ns, log_line in loki_exporter.iter_entries(loki_url, logs_query, task_result.created_at):
+                    timestamp = datetime.fromtimestamp(unix_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+                    data = f'{timestamp}\t{log_line}\n'.encode(enc)
+                    file_output.write(data)
+                    written += len(data)
+            # lets downloads serve ranges of the decompressed log
+            upload.metadata[UNCOMPRESSED_SIZE_METADATA] = str(written)
+        return bucket_name, file_name